@@ -0,0 +1,99 @@
+"""
+Latency comparison of the analysis backends.
+
+Runs the Assistants backend (``AsyncOpenAIClient``) and the single-call
+vision backend (``AsyncVisionClient``) against the local OpenAI stub, which
+adds a fixed latency to every API call and the same inference time to a run
+and to a chat completion. Reports p50/p95/p99 latency and API calls per
+analysis.
+
+    python -m benchmarks.bench_backends --call-latency 0.15 --run-latency 1.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from benchmarks.openai_stub import StubConfig, create_stub_app, serve_stub
+from src.config import settings
+from src.openai_client.client import AsyncOpenAIClient
+from src.openai_client.vision import AsyncVisionClient
+
+BACKENDS = {"assistants": AsyncOpenAIClient, "vision": AsyncVisionClient}
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def _bench(backend: str, requests: int, concurrency: int, image: tuple) -> list[float]:
+    client = BACKENDS[backend]()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await client.process_image(image)
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        await asyncio.gather(*(one() for _ in range(requests)))
+    finally:
+        await client.close()
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--call-latency", type=float, default=0.15,
+                        help="round-trip latency added to every API call (s)")
+    parser.add_argument("--run-latency", type=float, default=1.5,
+                        help="model inference time for a run or a completion (s)")
+    parser.add_argument("--poll-after-ms", type=int, default=500,
+                        help="poll interval the stub suggests while a run is pending")
+    parser.add_argument("--image-bytes", type=int, default=300 * 1024)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    stub = StubConfig(call_latency=args.call_latency, run_latency=args.run_latency,
+                      poll_after_ms=args.poll_after_ms)
+    image = ("meal.jpg", os.urandom(args.image_bytes), "image/jpeg")
+    results = []
+    app = create_stub_app(stub)
+    with serve_stub(app=app) as base_url:
+        settings.OPENAI_BASE_URL = base_url
+        settings.OPENAI_API_KEY = "stub"
+        settings.ASSISTANT_ID = "asst_stub"
+        for backend in BACKENDS:
+            calls_before = app.state.stats["calls"]
+            latencies = asyncio.run(_bench(backend, args.requests, args.concurrency, image))
+            results.append({
+                "backend": backend,
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "p50_ms": round(statistics.median(latencies) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+                "mean_ms": round(statistics.fmean(latencies) * 1000, 1),
+                "api_calls_per_analysis": round((app.state.stats["calls"] - calls_before) / args.requests, 1),
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'backend':<12}{'reqs':>6}{'conc':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'mean ms':>10}{'calls':>7}")
+    for r in results:
+        print(f"{r['backend']:<12}{r['requests']:>6}{r['concurrency']:>6}{r['p50_ms']:>10}"
+              f"{r['p95_ms']:>10}{r['p99_ms']:>10}{r['mean_ms']:>10}{r['api_calls_per_analysis']:>7}")
+
+
+if __name__ == "__main__":
+    main()
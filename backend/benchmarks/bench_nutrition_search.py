@@ -0,0 +1,96 @@
+"""
+Benchmark of nutrition reference lookups at USDA table size.
+
+Builds a synthetic reference of ``--names`` foods from the words of the
+bundled table and the qualifiers USDA names are full of ("raw", "with salt",
+"drained solids", ...), so a few trigrams occur in most names. Times
+``NutritionReference.search`` with the default work bounds against an
+unbounded index (every posting counted, every candidate scored), and checks
+that both return the same best match.
+
+    python -m benchmarks.bench_nutrition_search --names 100000
+"""
+import argparse
+import csv
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from src.nutrition_reference import BUNDLED_PATH, NutritionReference
+
+QUALIFIERS = ["raw", "cooked", "boiled", "fried", "baked", "canned", "frozen", "with", "without", "salt", "skin",
+              "lean", "fat", "whole", "low", "sodium", "added", "sugar", "enriched", "drained", "solids", "prepared",
+              "commercial", "home", "recipe", "style", "sauce", "chopped", "sliced"]
+
+QUERIES = ["chicken breast", "greek yoghurt", "apple pie", "brown rice", "a", "raw cooked with salt",
+           "canned tuna in water drained solids", "zzzz"]
+
+
+def write_table(path: Path, names: int, seed: int) -> None:
+    with open(BUNDLED_PATH, newline="") as f:
+        text = " ".join(" ".join((row["food_name"], row["aliases"])) for row in csv.DictReader(f))
+    words = sorted({w for w in text.lower().replace("|", " ").replace(",", " ").split() if w.isalpha() and len(w) > 2})
+    words += QUALIFIERS
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("food_name", "aliases", "calories_Kcal", "fat_in_g", "protein_in_g", "sugar_in_g"))
+        for _ in range(names):
+            name = ", ".join(" ".join(rng.sample(words, rng.randint(1, 3))) for _ in range(rng.randint(2, 4)))
+            writer.writerow((name.capitalize(), "", 100, 1, 1, 1))
+
+
+def time_search(reference: NutritionReference, query: str, number: int) -> list[float]:
+    timings = []
+    for _ in range(number):
+        start = time.perf_counter()
+        reference.search(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--names", type=int, default=100_000, help="names in the synthetic table")
+    parser.add_argument("--number", type=int, default=50, help="searches per query")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "reference.csv"
+        write_table(path, args.names, args.seed)
+        bounded = NutritionReference(path)
+        unbounded = NutritionReference(path, max_postings=args.names * 4, max_candidates=args.names * 4)
+        start = time.perf_counter()
+        bounded.load()
+        load_s = time.perf_counter() - start
+        unbounded.load()
+
+    results = []
+    for query in QUERIES:
+        result = {"query": query}
+        for name, reference in (("bounded", bounded), ("unbounded", unbounded)):
+            timings = sorted(time_search(reference, query, args.number))
+            result[f"{name}_p50_ms"] = round(statistics.median(timings), 2)
+            result[f"{name}_p99_ms"] = round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 2)
+        best = [reference.search(query, 1) for reference in (bounded, unbounded)]
+        result["same_best"] = [(f.food_name, round(s, 3)) for f, s in best[0]] == \
+            [(f.food_name, round(s, 3)) for f, s in best[1]]
+        results.append(result)
+
+    if args.json:
+        print(json.dumps({"names": args.names, "load_s": round(load_s, 2), "results": results}, indent=2))
+        return
+    print(f"{args.names} names, loaded in {load_s:.2f}s")
+    print(f"{'query':<38}{'bounded p50':>12}{'p99':>8}{'unbounded p50':>15}{'p99':>8}{'same best':>11}")
+    for r in results:
+        print(f"{r['query']:<38}{r['bounded_p50_ms']:>12}{r['bounded_p99_ms']:>8}"
+              f"{r['unbounded_p50_ms']:>15}{r['unbounded_p99_ms']:>8}{str(r['same_best']):>11}")
+
+
+if __name__ == "__main__":
+    main()
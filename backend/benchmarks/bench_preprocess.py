@@ -0,0 +1,114 @@
+"""
+Benchmark of the image preprocessing stage.
+
+Generates synthetic phone-sized photos, runs them through
+``ImagePreprocessor`` and then through ``AsyncOpenAIClient.process_image``
+against the local OpenAI stub with a throttled uplink, once with the
+original bytes and once with the preprocessed ones. Reports bytes saved and
+end-to-end latency saved per image.
+
+    python -m benchmarks.bench_preprocess --sizes 4032x3024 3000x4000 --uplink-mbps 20
+"""
+import argparse
+import asyncio
+import io
+import json
+import time
+
+from PIL import Image
+
+from benchmarks.openai_stub import StubConfig, serve_stub
+from src.config import settings
+from src.image_preprocessor import CONTENT_TYPES, ImagePreprocessor
+from src.openai_client.client import AsyncOpenAIClient
+
+
+def make_photo(width: int, height: int, quality: int = 95) -> bytes:
+    """
+    Noisy gradient JPEG with an EXIF orientation tag, compressing roughly
+    like a real camera photo.
+    """
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    image = Image.merge("RGB", (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 CW
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, exif=exif)
+    return buffer.getvalue()
+
+
+async def _analyze(client: AsyncOpenAIClient, name: str, content: bytes, content_type: str) -> float:
+    started = time.perf_counter()
+    await client.process_image((name, content, content_type))
+    return time.perf_counter() - started
+
+
+async def _bench(photos: list[tuple[str, bytes]], args) -> list[dict]:
+    client = AsyncOpenAIClient()
+    processed_type = CONTENT_TYPES.get(args.format.upper(), "application/octet-stream")
+    results = []
+    try:
+        for name, original in photos:
+            started = time.perf_counter()
+            processed = ImagePreprocessor.preprocess(
+                io.BytesIO(original), args.max_edge, args.format.upper(), args.quality,
+                settings.IMAGE_MIN_QUALITY, settings.IMAGE_TARGET_BYTES)
+            preprocess_s = time.perf_counter() - started
+
+            # The synthetic originals are JPEGs; the processed image is in --format
+            original_s = await _analyze(client, name, original, "image/jpeg")
+            processed_s = await _analyze(client, name, processed, processed_type) + preprocess_s
+            results.append({
+                "image": name,
+                "original_bytes": len(original),
+                "processed_bytes": len(processed),
+                "bytes_saved": len(original) - len(processed),
+                "preprocess_ms": round(preprocess_s * 1000, 1),
+                "e2e_original_ms": round(original_s * 1000, 1),
+                "e2e_processed_ms": round(processed_s * 1000, 1),
+                "latency_saved_ms": round((original_s - processed_s) * 1000, 1),
+            })
+    finally:
+        await client.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["4032x3024", "3024x4032", "1920x1080"])
+    parser.add_argument("--max-edge", type=int, default=settings.IMAGE_MAX_EDGE)
+    parser.add_argument("--format", default=settings.IMAGE_FORMAT)
+    parser.add_argument("--quality", type=int, default=settings.IMAGE_QUALITY)
+    parser.add_argument("--uplink-mbps", type=float, default=20.0,
+                        help="simulated client uplink used by the stub for uploads")
+    parser.add_argument("--run-latency", type=float, default=0.2)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    photos = []
+    for size in args.sizes:
+        width, height = (int(part) for part in size.split("x"))
+        photos.append((f"{size}.jpg", make_photo(width, height)))
+
+    stub = StubConfig(run_latency=args.run_latency,
+                      upload_bytes_per_second=args.uplink_mbps * 1_000_000 / 8)
+    with serve_stub(stub) as base_url:
+        settings.OPENAI_BASE_URL = base_url
+        settings.OPENAI_API_KEY = "stub"
+        settings.ASSISTANT_ID = "asst_stub"
+        results = asyncio.run(_bench(photos, args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'image':<16}{'original B':>12}{'processed B':>13}{'saved B':>11}"
+          f"{'prep ms':>9}{'e2e orig ms':>13}{'e2e prep ms':>13}{'saved ms':>10}")
+    for r in results:
+        print(f"{r['image']:<16}{r['original_bytes']:>12}{r['processed_bytes']:>13}{r['bytes_saved']:>11}"
+              f"{r['preprocess_ms']:>9}{r['e2e_original_ms']:>13}{r['e2e_processed_ms']:>13}"
+              f"{r['latency_saved_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
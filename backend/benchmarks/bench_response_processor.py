@@ -0,0 +1,116 @@
+"""
+Microbenchmark of model-reply parsing.
+
+Times ``ResponseProcessor.process_response`` against the previous
+implementation (non-greedy regex, ``json.loads``, field-by-field validation,
+then ``FoodInfo``) on typical and adversarial model outputs. Reports
+microseconds per reply, and whether each parser accepted it.
+
+    python -m benchmarks.bench_response_processor --number 2000
+"""
+import argparse
+import json
+import re
+import timeit
+
+from fastapi import HTTPException
+
+from src.response_processor import ResponseProcessor
+from src.schemas import FoodInfo
+
+FOOD = {"certainty": 0.9, "food_name": "Apple", "calories_Kcal": 52, "fat_in_g": 0.2, "protein_in_g": 0.3,
+        "sugar_in_g": 10.4}
+FOOD_JSON = json.dumps(FOOD, indent=4)
+
+CASES = {
+    "plain": FOOD_JSON,
+    "prose": f"Sure! Here is the nutrition information:\n{FOOD_JSON}\nLet me know if you need more.",
+    "nested": json.dumps({**FOOD, "details": {"variety": "Gala", "portion": {"grams": 182}}}),
+    "list": json.dumps([FOOD, {**FOOD, "food_name": "Banana", "calories_Kcal": 89}]),
+    "braces_in_strings": json.dumps({**FOOD, "food_name": "Soup {tomato} }{"}),
+    "long_prose": "The image shows a plate. " * 2000 + FOOD_JSON,
+    "long_string": json.dumps({**FOOD, "notes": "x" * 100_000}),
+    "truncated": FOOD_JSON[: len(FOOD_JSON) // 2],
+}
+
+LEGACY_FIELDS = {
+    "food_name": str,
+    "calories_Kcal": (int, float),
+    "certainty": (int, float),
+    "fat_in_g": (int, float),
+    "protein_in_g": (int, float),
+    "sugar_in_g": (int, float),
+}
+
+
+def legacy_process_response(content: str) -> FoodInfo:
+    """
+    The parser this module replaced, kept here as the baseline.
+    """
+    match = re.search(r'({.*?})', content, re.DOTALL)
+    if not match:
+        raise HTTPException(status_code=422, detail="Invalid JSON format")
+    try:
+        json_data = json.loads(match.group(1).strip())
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=422, detail="Invalid JSON format")
+    for field, field_type in LEGACY_FIELDS.items():
+        if field not in json_data:
+            raise HTTPException(status_code=422, detail=f"Field '{field}' is missing.")
+        if not isinstance(json_data[field], field_type):
+            try:
+                if field_type == (int, float):
+                    json_data[field] = float(json_data[field])
+            except ValueError:
+                raise HTTPException(status_code=422, detail=f"Field '{field}' is not of type {field_type}.")
+    return FoodInfo(**{field: json_data[field] for field in LEGACY_FIELDS})
+
+
+PARSERS = {"legacy": legacy_process_response, "current": ResponseProcessor.process_response}
+
+
+def accepts(parser, content: str) -> bool:
+    try:
+        parser(content)
+        return True
+    except HTTPException:
+        return False
+
+
+def time_parser(parser, content: str, number: int) -> float:
+    def run():
+        try:
+            parser(content)
+        except HTTPException:
+            pass
+
+    return min(timeit.repeat(run, number=number, repeat=3)) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000, help="calls per timing run")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for case, content in CASES.items():
+        # Large replies are timed with fewer calls so the run stays short
+        number = max(10, args.number * 1000 // max(len(content), 1000))
+        result = {"case": case, "bytes": len(content)}
+        for name, parse in PARSERS.items():
+            result[f"{name}_us"] = round(time_parser(parse, content, number), 1)
+            result[f"{name}_ok"] = accepts(parse, content)
+        results.append(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'case':<20}{'bytes':>9}{'legacy us':>12}{'ok':>6}{'current us':>12}{'ok':>6}")
+    for r in results:
+        print(f"{r['case']:<20}{r['bytes']:>9}{r['legacy_us']:>12}{str(r['legacy_ok']):>6}"
+              f"{r['current_us']:>12}{str(r['current_ok']):>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Load test comparing the blocking and async image-analysis paths.
+
+Runs ``process_image`` against the local OpenAI stub at increasing
+concurrency levels on a single event loop and reports throughput together
+with the worst event-loop lag observed (how long a ``/ping`` would stall).
+
+    python -m benchmarks.load_async_client --concurrency 1 8 32 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.openai_stub import StubConfig, serve_stub
+from src.config import settings
+from src.openai_client.client import OpenAIClient, AsyncOpenAIClient
+from src.services import process_image
+
+MODES = ("sync-inline", "sync-threadpool", "async")
+
+
+async def _lag_probe(stop: asyncio.Event, interval: float = 0.01) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def _run(mode: str, concurrency: int, requests: int, image_path: str) -> dict:
+    client = AsyncOpenAIClient() if mode == "async" else OpenAIClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            if mode == "sync-inline":
+                # What the original service did: call the blocking client on the loop.
+                return client.process_image(image_path)
+            return await process_image(client, image_path)
+
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_lag_probe(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    worst_lag = await probe
+    if isinstance(client, OpenAIClient):
+        client.close()
+    else:
+        await client.close()
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": requests,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "max_loop_lag_ms": round(worst_lag * 1000, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests-per-slot", type=int, default=2,
+                        help="analyses issued per concurrency slot")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--call-latency", type=float, default=0.02)
+    parser.add_argument("--run-latency", type=float, default=0.5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    stub = StubConfig(call_latency=args.call_latency, run_latency=args.run_latency)
+    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as image:
+        image.write(os.urandom(64 * 1024))
+
+    results = []
+    try:
+        with serve_stub(stub) as base_url:
+            settings.OPENAI_BASE_URL = base_url
+            settings.OPENAI_API_KEY = "stub"
+            settings.ASSISTANT_ID = "asst_stub"
+            for mode in args.modes:
+                for concurrency in args.concurrency:
+                    requests = concurrency * args.requests_per_slot
+                    results.append(asyncio.run(_run(mode, concurrency, requests, image.name)))
+    finally:
+        os.remove(image.name)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<16}{'conc':>6}{'reqs':>6}{'elapsed s':>11}{'req/s':>9}{'max lag ms':>12}")
+    for r in results:
+        print(f"{r['mode']:<16}{r['concurrency']:>6}{r['requests']:>6}{r['elapsed_s']:>11}"
+              f"{r['throughput_rps']:>9}{r['max_loop_lag_ms']:>12}")
+
+
+if __name__ == "__main__":
+    main()
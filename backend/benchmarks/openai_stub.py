@@ -0,0 +1,282 @@
+"""
+Local stand-in for the subset of the OpenAI API used by the backend.
+
+The stub implements the Assistants endpoints touched by ``OpenAIClient``
+(threads, files, messages, runs, including the file listing and deletions
+used by the janitor) and chat completions used by the vision
+backend, with configurable latency and error rates per endpoint so load
+tests can exercise the real SDK code paths without network access or API
+costs. It runs in a background thread (``serve_stub``) or on its own:
+
+    python -m benchmarks.openai_stub --port 8100 --latency create_file=0.3 --error-rate create_run=0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import uvicorn
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+
+DEFAULT_FOOD = {
+    "certainty": 0.9,
+    "food_name": "Apple",
+    "calories_Kcal": 52,
+    "fat_in_g": 0.2,
+    "protein_in_g": 0.3,
+    "sugar_in_g": 10.4,
+}
+
+
+@dataclass
+class StubConfig:
+    # Latency (seconds) added to every API call.
+    call_latency: float = 0.02
+    # Time (seconds) a run stays "in_progress" before it completes; chat
+    # completions take the same time, modelling identical inference cost.
+    run_latency: float = 0.5
+    # Simulated client uplink for file uploads (bytes/second), 0 for unlimited.
+    upload_bytes_per_second: float = 0
+    # Value of the ``openai-poll-after-ms`` header sent while a run is pending.
+    poll_after_ms: int = 50
+    # Assistant reply returned once a run completes.
+    reply: str = field(default_factory=lambda: json.dumps(DEFAULT_FOOD))
+    # Latency per endpoint, by route name (e.g. "create_file"), instead of call_latency.
+    endpoint_latency: dict[str, float] = field(default_factory=dict)
+    # Fraction of calls per endpoint answered with error_status instead.
+    error_rates: dict[str, float] = field(default_factory=dict)
+    error_status: int = 500
+    # Seed of the error draws, so a run fails the same calls every time.
+    seed: int | None = None
+
+
+def _now() -> int:
+    return int(time.time())
+
+
+def create_stub_app(config: StubConfig | None = None) -> FastAPI:
+    """
+    Build the stub application. State is kept in memory per app instance.
+    """
+    config = config or StubConfig()
+    rng = random.Random(config.seed)
+
+    async def simulate(request: Request):
+        name = request.scope["route"].name
+        await asyncio.sleep(config.endpoint_latency.get(name, config.call_latency))
+        if rng.random() < config.error_rates.get(name, 0):
+            stats["errors"] = stats.get("errors", 0) + 1
+            raise HTTPException(status_code=config.error_status, detail=f"Simulated failure of {name}")
+
+    app = FastAPI(title="OpenAI stub", dependencies=[Depends(simulate)])
+    app.state.config = config
+    runs: dict[str, dict] = {}
+    files: dict[str, dict] = {}
+    threads: set[str] = set()
+    # Sort keys of every file ever listed, so deleted files still work as cursors
+    file_keys: dict[str, tuple] = {}
+    stats = {"calls": 0}
+    app.state.stats = stats
+    # Exposed so tests can seed old uploads and check what is left
+    app.state.files = files
+    app.state.threads = threads
+
+    @app.middleware("http")
+    async def count_calls(request: Request, call_next):
+        stats["calls"] += 1
+        return await call_next(request)
+
+    @app.post("/v1/threads")
+    async def create_thread():
+        thread_id = f"thread_{uuid.uuid4().hex}"
+        threads.add(thread_id)
+        return {"id": thread_id, "object": "thread",
+                "created_at": _now(), "metadata": {}, "tool_resources": None}
+
+    @app.delete("/v1/threads/{thread_id}")
+    async def delete_thread(thread_id: str):
+        if thread_id not in threads:
+            return not_found(thread_id)
+        threads.discard(thread_id)
+        stats["threads_deleted"] = stats.get("threads_deleted", 0) + 1
+        return {"id": thread_id, "object": "thread.deleted", "deleted": True}
+
+    @app.post("/v1/files")
+    async def create_file(request: Request):
+        body = await request.body()
+        if config.upload_bytes_per_second:
+            await asyncio.sleep(len(body) / config.upload_bytes_per_second)
+        file = {"id": f"file-{uuid.uuid4().hex}", "object": "file", "bytes": len(body),
+                "created_at": _now(), "filename": "upload", "purpose": "vision",
+                "status": "processed"}
+        files[file["id"]] = file
+        return file
+
+    @app.get("/v1/files")
+    async def list_files(purpose: str | None = None, order: str = "desc", after: str | None = None,
+                         limit: int = 10000):
+        def key(file):
+            return file["created_at"], file["id"]
+
+        listed = sorted((file for file in files.values() if purpose is None or file["purpose"] == purpose),
+                        key=key, reverse=order == "desc")
+        if after is not None:
+            # The cursor file may have been deleted since, so page by its position in the order
+            cursor = file_keys[after]
+            listed = [file for file in listed if (key(file) < cursor if order == "desc" else key(file) > cursor)]
+        page = listed[:limit]
+        file_keys.update((file["id"], key(file)) for file in page)
+        return {"object": "list", "data": page, "first_id": page[0]["id"] if page else None,
+                "last_id": page[-1]["id"] if page else None, "has_more": len(listed) > limit}
+
+    @app.delete("/v1/files/{file_id}")
+    async def delete_file(file_id: str):
+        if files.pop(file_id, None) is None:
+            return not_found(file_id)
+        stats["files_deleted"] = stats.get("files_deleted", 0) + 1
+        return {"id": file_id, "object": "file", "deleted": True}
+
+    def not_found(resource_id: str) -> Response:
+        return Response(json.dumps({"error": {"message": f"No such object: {resource_id}",
+                                              "type": "invalid_request_error", "code": None}}),
+                        status_code=404, media_type="application/json")
+
+    @app.post("/v1/threads/{thread_id}/messages")
+    async def create_message(thread_id: str):
+        return {"id": f"msg_{uuid.uuid4().hex}", "object": "thread.message",
+                "created_at": _now(), "thread_id": thread_id, "role": "user",
+                "status": "completed", "content": [], "attachments": [],
+                "metadata": {}, "assistant_id": None, "run_id": None,
+                "completed_at": None, "incomplete_at": None, "incomplete_details": None}
+
+    def run_object(run_id: str) -> dict:
+        run = runs[run_id]
+        if run.get("cancelled"):
+            status = "cancelled"
+        elif time.monotonic() - run["started"] >= config.run_latency:
+            status = "completed"
+        else:
+            status = "in_progress"
+        return {"id": run_id, "object": "thread.run", "created_at": _now(),
+                "thread_id": run["thread_id"], "assistant_id": run["assistant_id"],
+                "status": status,
+                "model": "stub", "instructions": "", "tools": [], "metadata": {},
+                "parallel_tool_calls": False}
+
+    @app.post("/v1/threads/{thread_id}/runs")
+    async def create_run(thread_id: str, request: Request):
+        body = await request.json()
+        run_id = f"run_{uuid.uuid4().hex}"
+        runs[run_id] = {"thread_id": thread_id, "assistant_id": body.get("assistant_id"),
+                        "started": time.monotonic()}
+        return run_object(run_id)
+
+    @app.get("/v1/threads/{thread_id}/runs/{run_id}")
+    async def retrieve_run(thread_id: str, run_id: str, response: Response):
+        response.headers["openai-poll-after-ms"] = str(config.poll_after_ms)
+        return run_object(run_id)
+
+    @app.post("/v1/threads/{thread_id}/runs/{run_id}/cancel")
+    async def cancel_run(thread_id: str, run_id: str):
+        runs[run_id]["cancelled"] = True
+        stats["cancelled"] = stats.get("cancelled", 0) + 1
+        return run_object(run_id)
+
+    @app.get("/v1/threads/{thread_id}/messages")
+    async def list_messages(thread_id: str):
+        message = {"id": f"msg_{uuid.uuid4().hex}", "object": "thread.message",
+                   "created_at": _now(), "thread_id": thread_id, "role": "assistant",
+                   "status": "completed", "attachments": [], "metadata": {},
+                   "assistant_id": None, "run_id": None, "completed_at": None,
+                   "incomplete_at": None, "incomplete_details": None,
+                   "content": [{"type": "text",
+                                "text": {"value": config.reply, "annotations": []}}]}
+        return {"object": "list", "data": [message], "first_id": message["id"],
+                "last_id": message["id"], "has_more": False}
+
+    @app.post("/v1/chat/completions")
+    async def create_chat_completion(request: Request):
+        body = await request.json()
+        await asyncio.sleep(config.run_latency)
+        return {"id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion",
+                "created": _now(), "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "finish_reason": "stop", "logprobs": None,
+                             "message": {"role": "assistant", "content": config.reply,
+                                         "refusal": None}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}}
+
+    return app
+
+
+def free_port() -> int:
+    """
+    A TCP port on 127.0.0.1 that is free right now, for the stub or the app
+    under test.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve_stub(config: StubConfig | None = None, port: int | None = None, app: FastAPI | None = None):
+    """
+    Run the stub (or a prebuilt stub `app`, e.g. to read ``app.state.stats``)
+    with uvicorn in a background thread and yield its base URL (suitable for
+    ``OPENAI_BASE_URL``).
+    """
+    port = port or free_port()
+    app = app or create_stub_app(config)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port,
+                                           log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}/v1"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def parse_pairs(pairs: list[str]) -> dict[str, float]:
+    """
+    ["create_file=0.3", ...] as {"create_file": 0.3, ...}.
+    """
+    result = {}
+    for pair in pairs:
+        name, _, value = pair.partition("=")
+        result[name] = float(value)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--call-latency", type=float, default=StubConfig.call_latency)
+    parser.add_argument("--run-latency", type=float, default=StubConfig.run_latency)
+    parser.add_argument("--poll-after-ms", type=int, default=StubConfig.poll_after_ms)
+    parser.add_argument("--latency", nargs="*", default=[], metavar="ROUTE=SECONDS",
+                        help="per-endpoint latency, e.g. create_file=0.3")
+    parser.add_argument("--error-rate", nargs="*", default=[], metavar="ROUTE=FRACTION",
+                        help="per-endpoint error rate, e.g. create_run=0.05")
+    parser.add_argument("--error-status", type=int, default=StubConfig.error_status)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = StubConfig(call_latency=args.call_latency, run_latency=args.run_latency,
+                        poll_after_ms=args.poll_after_ms, endpoint_latency=parse_pairs(args.latency),
+                        error_rates=parse_pairs(args.error_rate), error_status=args.error_status, seed=args.seed)
+    uvicorn.run(create_stub_app(config), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
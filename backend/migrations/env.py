@@ -0,0 +1,50 @@
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+
+from src import models  # noqa: F401  registers the tables on Base.metadata
+from src.database import Base, engine, wait_for_database
+
+config = context.config
+
+# Keep the application's logging when migrations run inside the app
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # PostgreSQL-only indexes (BRIN) are not created on other databases
+    if type_ == "index" and object.dialect_kwargs.get("postgresql_using") == "brin":
+        return context.get_context().dialect.name == "postgresql"
+    return True
+
+
+def run_migrations_offline() -> None:
+    """
+    Emit the migration SQL for the configured database without connecting.
+    """
+    context.configure(url=engine.url.render_as_string(hide_password=False), target_metadata=target_metadata,
+                      literal_binds=True, dialect_opts={"paramstyle": "named"}, include_object=include_object)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    # From the command line the database may still be starting (e.g. in compose)
+    if config.attributes.get("wait_for_database", True) and not asyncio.run(wait_for_database()):
+        raise SystemExit("Database is not available")
+    with engine.connect() as connection:
+        # SQLite cannot ALTER most things in place; batch mode recreates the table
+        context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object,
+                          render_as_batch=connection.dialect.name == "sqlite")
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,48 @@
+"""Server-side timestamp defaults and BRIN index on food_info
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 15:02:11.482913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, Sequence[str], None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TIMESTAMP_COLUMNS = {
+    'user_calories': ('date_created', 'date_last_updated'),
+    'food_info': ('date_created', 'date_last_updated'),
+    'image_analysis_cache': ('date_created',),
+    'analysis_jobs': ('date_created', 'date_last_updated'),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, existing_type=sa.DateTime(), server_default=sa.func.now())
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_index('ix_food_info_date_created_brin', 'food_info', ['date_created'], unique=False,
+                        postgresql_using='brin', postgresql_with={'pages_per_range': 32})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_food_info_date_created_brin', table_name='food_info', postgresql_using='brin')
+
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, existing_type=sa.DateTime(), server_default=None)
@@ -0,0 +1,52 @@
+"""Store SQLite server-side timestamps in the application's datetime format
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 15:31:47.206518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, Sequence[str], None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TIMESTAMP_COLUMNS = {
+    'user_calories': ('date_created', 'date_last_updated'),
+    'food_info': ('date_created', 'date_last_updated'),
+    'image_analysis_cache': ('date_created',),
+    'analysis_jobs': ('date_created', 'date_last_updated'),
+    'openai_resources': ('date_created',),
+}
+# What src.database.db_now() renders on SQLite
+SQLITE_NOW = "(strftime('%Y-%m-%d %H:%M:%f000', 'now'))"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # PostgreSQL stores timestamps natively; nothing to do there
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, existing_type=sa.DateTime(), server_default=sa.text(SQLITE_NOW))
+        # Rows defaulted by CURRENT_TIMESTAMP lack the fraction of a second
+        for column in columns:
+            op.execute(f"UPDATE {table} SET {column} = {column} || '.000000' WHERE length({column}) = 19")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, existing_type=sa.DateTime(), server_default=sa.func.now())
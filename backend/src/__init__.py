@@ -1,6 +1,43 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine, Base
+from fastapi.concurrency import run_in_threadpool
+from .database import async_engine, run_migrations, wait_for_database
+from .config import settings
+from .logger import RequestIdMiddleware
+from .metrics import MetricsMiddleware
+from .uploads import UploadSizeLimitMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Wait for the database (migrating it when DB_MIGRATE_ON_STARTUP is set),
+    create the shared OpenAI client and start background workers with the
+    application; stop and close them on shutdown.
+    """
+    if await wait_for_database() and settings.DB_MIGRATE_ON_STARTUP:
+        await run_in_threadpool(run_migrations)
+    from .batch_writer import food_info_writer, user_calories_writer
+    from .jobs import job_queue
+    from .nutrition_reference import nutrition_reference
+    from .openai_client.janitor import openai_janitor
+    from .services import create_openai_client, close_openai_client
+    # Before any analysis: large reference tables take a while to index
+    await run_in_threadpool(nutrition_reference.load)
+    app.state.openai_client = create_openai_client()
+    await job_queue.start(app.state.openai_client)
+    await openai_janitor.start()
+    try:
+        yield
+    finally:
+        await job_queue.stop()
+        await openai_janitor.stop()
+        await food_info_writer.flush()
+        await user_calories_writer.flush()
+        await close_openai_client(app.state.openai_client)
+        app.state.openai_client = None
+        await async_engine.dispose()
+
 
 def create_app() -> FastAPI:
     """
@@ -12,6 +49,7 @@ def create_app() -> FastAPI:
         title="Food recognition API",
         version="0.0.2",
         description="An API for food recognition",
+        lifespan=lifespan,
     )
     origins = ["*"]  # Allow all origins
 
@@ -22,11 +60,13 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    app.add_middleware(UploadSizeLimitMiddleware, max_bytes=settings.MAX_REQUEST_BYTES,
+                       path_limits={"/analyze-images": settings.MAX_BATCH_REQUEST_BYTES})
+    # Outermost, so rejected uploads and CORS preflights are timed and tagged as well
+    app.add_middleware(MetricsMiddleware)
+    app.add_middleware(RequestIdMiddleware)
 
     from .routes import setup_routes
     setup_routes(app)
 
-    # Vytvoření tabulek v databázi podle modelů
-    Base.metadata.create_all(bind=engine)
-
     return app
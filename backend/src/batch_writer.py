@@ -0,0 +1,159 @@
+import asyncio
+from typing import Awaitable, Callable
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from .config import settings
+from .logger import setup_logger
+from .models import FoodInfoDB, UserCalories
+from .rollups import update_daily_rollups
+
+logger = setup_logger(__name__)
+
+
+class BatchWriter:
+    """
+    Write-behind buffer for one table. Rows submitted by concurrent requests
+    are coalesced and written with one multi-row INSERT (COPY on PostgreSQL
+    for large batches) and a single commit, as soon as `max_rows` are pending
+    or `max_delay` seconds after the first pending row.
+
+    Rows are written to the database the submitting session is bound to, in
+    a session of the writer's own. `after_insert` runs in the same
+    transaction, for derived tables that must stay consistent with the rows.
+    When a batch fails, its submissions are retried one by one, so only the
+    callers whose rows are bad see the error.
+    """
+
+    def __init__(self, model, max_rows: int = settings.WRITE_BATCH_MAX_ROWS,
+                 max_delay: float = settings.WRITE_BATCH_MAX_DELAY_SECONDS,
+                 copy_threshold: int = settings.WRITE_BATCH_COPY_THRESHOLD,
+                 after_insert: Callable[[AsyncSession, list[dict]], Awaitable[None]] | None = None):
+        self.table = model.__table__
+        self.after_insert = after_insert
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.copy_threshold = copy_threshold
+        self._pending: list[tuple[AsyncEngine, list[dict], asyncio.Future | None]] = []
+        self._pending_rows = 0
+        self._timer: asyncio.Task | None = None
+        self._writes: set[asyncio.Task] = set()
+
+    async def submit(self, db: AsyncSession, rows: list[dict], wait: bool = True) -> None:
+        """
+        Queue `rows` for insertion. With `wait` the call returns once the rows
+        are committed and raises if the write failed; otherwise it returns
+        immediately and failures are only logged.
+        """
+        if not rows:
+            return
+        future = asyncio.get_running_loop().create_future() if wait else None
+        self._pending.append((db.bind, rows, future))
+        self._pending_rows += len(rows)
+        if self._pending_rows >= self.max_rows:
+            self._start_write()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._write_later())
+        if future is not None:
+            await future
+
+    async def flush(self) -> None:
+        """
+        Write everything pending now and wait for writes in flight.
+        """
+        if self._pending:
+            self._start_write()
+        await asyncio.gather(*self._writes, return_exceptions=True)
+
+    async def _write_later(self) -> None:
+        await asyncio.sleep(self.max_delay)
+        self._timer = None
+        self._start_write()
+
+    def _start_write(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_rows = self._pending, [], 0
+        task = asyncio.create_task(self._write(batch))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch: list[tuple[AsyncEngine, list[dict], asyncio.Future | None]]) -> None:
+        by_engine: dict[AsyncEngine, list[tuple[list[dict], asyncio.Future | None]]] = {}
+        for engine, rows, future in batch:
+            by_engine.setdefault(engine, []).append((rows, future))
+
+        for engine, entries in by_engine.items():
+            rows = [row for entry_rows, _ in entries for row in entry_rows]
+            try:
+                await self._commit(engine, rows)
+                logger.debug("Wrote %s rows to %s from %s requests", len(rows), self.table.name, len(entries))
+                errors = [None] * len(entries)
+            except Exception as e:
+                logger.error("Failed to write %s rows to %s: %s", len(rows), self.table.name, e)
+                errors = [e] if len(entries) == 1 else await self._retry_separately(engine, entries)
+            for (_, future), error in zip(entries, errors):
+                if future is None or future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    async def _retry_separately(self, engine: AsyncEngine,
+                                entries: list[tuple[list[dict], asyncio.Future | None]]) -> list[Exception | None]:
+        """
+        Write each submission of a failed batch in its own transaction, so a
+        bad row (e.g. a foreign key violation) only fails its own caller.
+        Returns the error of each submission, None for the written ones.
+        """
+        errors = []
+        for rows, _ in entries:
+            try:
+                await self._commit(engine, rows)
+                errors.append(None)
+            except Exception as e:
+                logger.error("Failed to write %s rows to %s: %s", len(rows), self.table.name, e)
+                errors.append(e)
+        return errors
+
+    async def _commit(self, engine: AsyncEngine, rows: list[dict]) -> None:
+        async with AsyncSession(engine) as db:
+            await self._insert(db, rows)
+            if self.after_insert is not None:
+                await self.after_insert(db, rows)
+            await db.commit()
+
+    async def _insert(self, db: AsyncSession, rows: list[dict]) -> None:
+        if db.bind.dialect.name == "postgresql" and len(rows) >= self.copy_threshold:
+            await self._copy(db, rows)
+        else:
+            await db.execute(insert(self.table), rows)
+
+    async def _copy(self, db: AsyncSession, rows: list[dict]) -> None:
+        """
+        COPY the rows with asyncpg. COPY bypasses SQLAlchemy, so client-side
+        column defaults are filled in here.
+        """
+        rows = [self._with_defaults(row) for row in rows]
+        columns = list(rows[0])
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            self.table.name, records=[tuple(row[column] for column in columns) for row in rows], columns=columns)
+
+    def _with_defaults(self, row: dict) -> dict:
+        row = dict(row)
+        for column in self.table.columns:
+            if column.name in row or column.primary_key or column.default is None:
+                continue
+            default = column.default
+            if default.is_scalar:
+                row[column.name] = default.arg
+            elif default.is_callable:
+                row[column.name] = default.arg(None)
+        return row
+
+
+user_calories_writer = BatchWriter(UserCalories)
+food_info_writer = BatchWriter(FoodInfoDB, after_insert=update_daily_rollups)
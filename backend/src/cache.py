@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import io
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Awaitable, BinaryIO, Callable, Hashable
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from .config import settings
+from .database import AsyncSessionLocal, utcnow
+from .logger import setup_logger
+from .models import ImageAnalysisCache
+from .schemas import FoodInfo
+
+try:
+    from PIL import Image
+except ImportError:  # Perceptual matching is optional
+    Image = None
+
+logger = setup_logger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache whose entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            return default if entry is _MISSING else entry[1]
+
+    def items(self) -> list[tuple[Hashable, Any]]:
+        """
+        Snapshot of the live (non-expired) entries, least recently used first.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at > now]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def perceptual_hash(content: bytes | BinaryIO) -> str | None:
+    """
+    64-bit difference hash (dHash) of an image as a hex string, or None when
+    Pillow is missing or the data is not a readable image.
+    """
+    if Image is None:
+        return None
+    if isinstance(content, bytes):
+        content = io.BytesIO(content)
+    try:
+        with Image.open(content) as image:
+            pixels = list(image.convert("L").resize((9, 8)).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            bits = (bits << 1) | (left > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def _hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+class ImageResultCache:
+    """
+    Content-addressed cache of image analysis results.
+
+    Lookups go through an in-memory TTL/LRU tier keyed on the SHA-256 of the
+    image bytes, optionally a near-duplicate match by perceptual hash, and
+    optionally the persistent image_analysis_cache table. The persistent tier
+    uses its own short-lived sessions, so lookups can run concurrently; it
+    matches perceptual hashes exactly (through their index), the memory tier
+    within `perceptual_distance`.
+
+    Misses for the same image are analyzed once: `single_flight` makes
+    concurrent callers (retries, double taps) wait for the first analysis.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, persistent: bool = False,
+                 perceptual: bool = False, perceptual_distance: int = 4,
+                 session_factory: async_sessionmaker = AsyncSessionLocal):
+        self.memory = TTLCache(max_entries, ttl)
+        self.ttl = ttl
+        self.persistent = persistent
+        self.session_factory = session_factory
+        self.perceptual = perceptual and Image is not None
+        self.perceptual_distance = perceptual_distance
+        self.stats = {"hits": 0, "misses": 0, "memory_hits": 0,
+                      "perceptual_hits": 0, "persistent_hits": 0, "coalesced": 0}
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    async def get(self, image_hash: str, phash: str | None = None) -> FoodInfo | None:
+        entry = self.memory.get(image_hash)
+        if entry is not None:
+            return self._hit("memory_hits", entry[1])
+
+        if self.perceptual and phash is not None:
+            for _, (stored_phash, food_info) in self.memory.items():
+                if stored_phash is not None and _hamming(phash, stored_phash) <= self.perceptual_distance:
+                    return self._hit("perceptual_hits", food_info)
+
+        if self.persistent:
+            food_info = await self._get_persistent(image_hash)
+            if food_info is not None:
+                self.memory.set(image_hash, (phash, food_info))
+                return self._hit("persistent_hits", food_info)
+            if self.perceptual and phash is not None:
+                food_info = await self._get_persistent_perceptual(phash)
+                if food_info is not None:
+                    self.memory.set(image_hash, (phash, food_info))
+                    return self._hit("perceptual_hits", food_info)
+
+        self.stats["misses"] += 1
+        return None
+
+    async def single_flight(self, image_hash: str, analyze: Callable[[], Awaitable[FoodInfo]]) -> FoodInfo:
+        """
+        Run `analyze` for an image unless an analysis of the same image is
+        already in flight, in which case its result (or error) is shared.
+        A waiter whose leader was cancelled runs the analysis itself.
+        """
+        while (future := self._in_flight.get(image_hash)) is not None:
+            self.stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[image_hash] = future
+        try:
+            food_info = await analyze()
+            future.set_result(food_info)
+            return food_info
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Waiters re-raise it; without any, it must not be logged as unretrieved
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[image_hash]
+
+    async def set(self, image_hash: str, food_info: FoodInfo, phash: str | None = None) -> None:
+        self.memory.set(image_hash, (phash, food_info))
+        if self.persistent:
+            await self._set_persistent(image_hash, phash, food_info)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        for name in self.stats:
+            self.stats[name] = 0
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self.memory),
+            "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0,
+        }
+
+    def _hit(self, tier: str, food_info: FoodInfo) -> FoodInfo:
+        self.stats["hits"] += 1
+        self.stats[tier] += 1
+        return food_info
+
+    async def _get_persistent(self, image_hash: str) -> FoodInfo | None:
+        try:
+            async with self.session_factory() as db:
+                row = await db.get(ImageAnalysisCache, image_hash)
+        except Exception as e:
+            logger.error("Image cache lookup failed: %s", e)
+            return None
+        if row is None:
+            return None
+        if (utcnow() - row.date_created).total_seconds() > self.ttl:
+            return None
+        return FoodInfo.model_validate(row)
+
+    async def _get_persistent_perceptual(self, phash: str) -> FoodInfo | None:
+        try:
+            async with self.session_factory() as db:
+                row = await db.scalar(select(ImageAnalysisCache)
+                                      .where(ImageAnalysisCache.perceptual_hash == phash,
+                                             ImageAnalysisCache.date_created >= utcnow() - timedelta(seconds=self.ttl))
+                                      .limit(1))
+        except Exception as e:
+            logger.error("Image cache lookup failed: %s", e)
+            return None
+        return FoodInfo.model_validate(row) if row is not None else None
+
+    async def _set_persistent(self, image_hash: str, phash: str | None, food_info: FoodInfo) -> None:
+        try:
+            async with self.session_factory() as db:
+                await db.merge(ImageAnalysisCache(image_hash=image_hash, perceptual_hash=phash,
+                                                  date_created=utcnow(),
+                                                  **food_info.model_dump()))
+                await db.commit()
+        except Exception as e:
+            logger.error("Failed to persist image cache entry: %s", e)
+
+
+image_cache = ImageResultCache(
+    max_entries=settings.IMAGE_CACHE_MAX_ENTRIES,
+    ttl=settings.IMAGE_CACHE_TTL_SECONDS,
+    persistent=settings.IMAGE_CACHE_PERSISTENT,
+    perceptual=settings.IMAGE_CACHE_PERCEPTUAL,
+    perceptual_distance=settings.IMAGE_CACHE_PERCEPTUAL_DISTANCE,
+)
+
+# Users behind authenticated requests, keyed by id; see services.invalidate_user
+user_cache = TTLCache(max_entries=settings.USER_CACHE_MAX_ENTRIES, ttl=settings.USER_CACHE_TTL_SECONDS)
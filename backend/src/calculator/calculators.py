@@ -1,5 +1,12 @@
+import numpy as np
 from .schemas import UserInfo, DailyIntake
 
+ACTIVITY_FACTORS = {
+    "low": 1.2,
+    "medium": 1.55,
+    "high": 1.725
+}
+
 # Define the IntakeCalculator class
 
 class IntakeCalculator:
@@ -10,13 +17,7 @@ class IntakeCalculator:
         else:
             bmr = 447.593 + (9.247 * user_info.weight_kg) + (3.098 * user_info.height_cm) - (4.330 * user_info.age)
 
-        activity_factors = {
-            "low": 1.2,
-            "medium": 1.55,
-            "high": 1.725
-        }
-
-        daily_calories = bmr * activity_factors[user_info.activity_level]
+        daily_calories = bmr * ACTIVITY_FACTORS[user_info.activity_level]
         
         protein_g = user_info.weight_kg * 1.2
         fat_g = daily_calories * 0.25 / 9
@@ -29,3 +30,31 @@ class IntakeCalculator:
             sugar_g=sugar_g,
             protein_g=protein_g
         )
+
+
+class BatchIntakeCalculator:
+    """
+    Same formulas as IntakeCalculator, evaluated over whole columns at once.
+    Rows with an unknown gender or activity level, or a missing number,
+    come out as NaN.
+    """
+
+    @staticmethod
+    def calculate_daily_intake(height_cm: np.ndarray, weight_kg: np.ndarray, age: np.ndarray,
+                               gender: np.ndarray, activity_level: np.ndarray) -> dict[str, np.ndarray]:
+        bmr = np.select(
+            [gender == "male", gender == "female"],
+            [88.362 + 13.397 * weight_kg + 4.799 * height_cm - 5.677 * age,
+             447.593 + 9.247 * weight_kg + 3.098 * height_cm - 4.330 * age],
+            np.nan,
+        )
+        factor = np.select([activity_level == level for level in ACTIVITY_FACTORS],
+                           list(ACTIVITY_FACTORS.values()), np.nan)
+
+        daily_calories = bmr * factor
+        return {
+            "calories": daily_calories,
+            "fat_g": daily_calories * 0.25 / 9,
+            "sugar_g": daily_calories * 0.1 / 4,
+            "protein_g": weight_kg * 1.2,
+        }
@@ -1,11 +1,15 @@
+import numpy as np
 from fastapi import HTTPException
-from .schemas import DailyIntake
-from .validators import InputValidator, InvalidInputException
-from .calculators import IntakeCalculator
+from .schemas import DailyIntake, DailyIntakeBatch
+from .validators import BatchInputValidator, InputValidator, InvalidInputException
+from .calculators import BatchIntakeCalculator, IntakeCalculator
 from ..logger import setup_logger
 
 logger = setup_logger(__name__)
 
+NUMERIC_FIELDS = ("height_cm", "weight_kg", "age")
+TEXT_FIELDS = ("gender", "activity_level")
+
 
 class IntakeProcessor:
     @staticmethod
@@ -13,9 +17,38 @@ class IntakeProcessor:
         try:
             validated_user_info = InputValidator.validate(user_info)
         except InvalidInputException as e:
-            logger.error(f"Validation error: {e}")
+            logger.error("Validation error: %s", e)
             raise HTTPException(status_code=422, detail=str(e))
 
         daily_intake = IntakeCalculator.calculate_daily_intake(
             validated_user_info)
         return daily_intake
+
+    @staticmethod
+    def process_batch(columns: dict[str, list]) -> DailyIntakeBatch:
+        """
+        Calculate the daily intake for columnar input in one vectorised pass.
+        Only mismatched column lengths fail the request; invalid rows are
+        reported through the per-field masks of the result.
+        """
+        rows = len(columns["owner_id"])
+        mismatched = [field for field in NUMERIC_FIELDS + TEXT_FIELDS if len(columns[field]) != rows]
+        if mismatched:
+            raise HTTPException(status_code=422,
+                                detail=f"Columns {', '.join(mismatched)} must have {rows} values like owner_id")
+
+        arrays = {field: np.array(columns[field], dtype=np.float64) for field in NUMERIC_FIELDS}
+        arrays.update({field: np.array(columns[field], dtype=str) for field in TEXT_FIELDS})
+        masks = BatchInputValidator.validate(**arrays)
+        valid = ~np.logical_or.reduce(list(masks.values()))
+        results = BatchIntakeCalculator.calculate_daily_intake(**arrays)
+
+        invalid_rows = rows - int(valid.sum())
+        if invalid_rows:
+            logger.warning("Batch intake calculation: %s of %s rows invalid", invalid_rows, rows)
+        return DailyIntakeBatch(
+            owner_id=columns["owner_id"],
+            **{name: np.where(valid, values, None).tolist() for name, values in results.items()},
+            valid=valid.tolist(),
+            errors={field: mask.tolist() for field, mask in masks.items()},
+        )
@@ -18,3 +18,16 @@ class DailyIntake(BaseModel):
     protein_g: float
 
     model_config = ConfigDict(orm_mode=True, from_attributes=True)
+
+class DailyIntakeBatch(BaseModel):
+    """
+    Columnar result of a batch calculation. Values of invalid rows are null;
+    `errors` holds one mask per input field, true where that field was invalid.
+    """
+    owner_id: list[int]
+    calories: list[float | None]
+    fat_g: list[float | None]
+    sugar_g: list[float | None]
+    protein_g: list[float | None]
+    valid: list[bool]
+    errors: dict[str, list[bool]]
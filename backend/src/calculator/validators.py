@@ -1,3 +1,4 @@
+import numpy as np
 from .schemas import UserInfo
 from ..logger import setup_logger
 
@@ -20,10 +21,10 @@ class InputValidator:
 
         for field, field_type in required_fields.items():
             if field not in user_info:
-                logger.error(f"Field '{field}' is missing.")
+                logger.error("Field '%s' is missing.", field)
                 raise InvalidInputException(f"Field '{field}' is missing.")
             if not isinstance(user_info[field], field_type):
-                logger.error(f"Field '{field}' is not of type {field_type}.")
+                logger.error("Field '%s' is not of type %s.", field, field_type)
                 raise InvalidInputException(f"Field '{field}' is not of type {field_type}.")
 
         if user_info["gender"] not in ["male", "female"]:
@@ -35,3 +36,22 @@ class InputValidator:
             raise InvalidInputException("Activity level must be 'low', 'medium', or 'high'.")
         logger.info("Input is valid.")
         return UserInfo(**user_info)
+
+
+class BatchInputValidator:
+    """
+    Row-wise version of InputValidator for columnar input: instead of raising
+    on the first problem it returns a boolean mask per field, true where the
+    row's value is invalid.
+    """
+
+    @staticmethod
+    def validate(height_cm: np.ndarray, weight_kg: np.ndarray, age: np.ndarray,
+                 gender: np.ndarray, activity_level: np.ndarray) -> dict[str, np.ndarray]:
+        return {
+            "height_cm": ~np.isfinite(height_cm),
+            "weight_kg": ~np.isfinite(weight_kg),
+            "age": ~np.isfinite(age),
+            "gender": ~np.isin(gender, ["male", "female"]),
+            "activity_level": ~np.isin(activity_level, ["low", "medium", "high"]),
+        }
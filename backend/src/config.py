@@ -9,7 +9,60 @@ class Settings:
     API_USERNAME: str = os.getenv('API_USERNAME')
     API_PASSWORD: str = os.getenv("API_PASSWORD")
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL")
+    # "async" uses AsyncOpenAI on the event loop, "sync" runs the blocking client in a thread pool
+    OPENAI_CLIENT_MODE: str = os.getenv("OPENAI_CLIENT_MODE", "async")
+    # "assistants" runs the ASSISTANT_ID assistant on a thread, "vision" sends the image
+    # inline in a single chat completion with structured output
+    OPENAI_ANALYSIS_BACKEND: str = os.getenv("OPENAI_ANALYSIS_BACKEND", "assistants")
+    OPENAI_VISION_MODEL: str = os.getenv("OPENAI_VISION_MODEL", "gpt-4o-mini")
+    OPENAI_IMAGE_DETAIL: str = os.getenv("OPENAI_IMAGE_DETAIL", "high")
+    # Connection pool of the application-wide OpenAI HTTP client
+    OPENAI_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    OPENAI_KEEPALIVE_EXPIRY: float = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+    OPENAI_HTTP2: bool = os.getenv("OPENAI_HTTP2", "true").lower() == "true"
+    OPENAI_CONNECT_TIMEOUT: float = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+    OPENAI_TIMEOUT: float = float(os.getenv("OPENAI_TIMEOUT", "60"))
+    OPENAI_MAX_RETRIES: int = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+    # Assistants run polling: first interval (after the typical run duration, once known),
+    # growth factor and cap
+    OPENAI_POLL_INITIAL_SECONDS: float = float(os.getenv("OPENAI_POLL_INITIAL_SECONDS", "0.1"))
+    OPENAI_POLL_BACKOFF: float = float(os.getenv("OPENAI_POLL_BACKOFF", "1.5"))
+    OPENAI_POLL_MAX_SECONDS: float = float(os.getenv("OPENAI_POLL_MAX_SECONDS", "2"))
+    # End-to-end budget of one analysis, including queueing and retries; runs still
+    # pending after it are cancelled
+    OPENAI_ANALYSIS_DEADLINE_SECONDS: float = float(os.getenv("OPENAI_ANALYSIS_DEADLINE_SECONDS", "120"))
+    OPENAI_UPLOAD_TIMEOUT_SECONDS: float = float(os.getenv("OPENAI_UPLOAD_TIMEOUT_SECONDS", "30"))
+    # Thread and message creation, message listing and run cancellation
+    OPENAI_CALL_TIMEOUT_SECONDS: float = float(os.getenv("OPENAI_CALL_TIMEOUT_SECONDS", "10"))
+    # Adaptive (AIMD) cap on concurrent analyses: grows by one per `limit` successes, halves on overload
+    OPENAI_CONCURRENCY_INITIAL: int = int(os.getenv("OPENAI_CONCURRENCY_INITIAL", "16"))
+    OPENAI_CONCURRENCY_MIN: int = int(os.getenv("OPENAI_CONCURRENCY_MIN", "1"))
+    OPENAI_CONCURRENCY_MAX: int = int(os.getenv("OPENAI_CONCURRENCY_MAX", "64"))
+    # Analyses waiting longer than this for a slot are rejected with 503
+    OPENAI_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("OPENAI_QUEUE_TIMEOUT_SECONDS", "30"))
+    # Account quotas shared by all analyses; 0 disables the limit
+    OPENAI_REQUESTS_PER_MINUTE: int = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "0"))
+    OPENAI_TOKENS_PER_MINUTE: int = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "0"))
+    # Estimated tokens used by one analysis (prompt, image and reply)
+    OPENAI_TOKENS_PER_ANALYSIS: int = int(os.getenv("OPENAI_TOKENS_PER_ANALYSIS", "1500"))
+    # Whole-analysis retries on transient failures, after the client's own per-call retries
+    OPENAI_ANALYSIS_RETRIES: int = int(os.getenv("OPENAI_ANALYSIS_RETRIES", "1"))
+    OPENAI_RETRY_BACKOFF_SECONDS: float = float(os.getenv("OPENAI_RETRY_BACKOFF_SECONDS", "1"))
+    OPENAI_RETRY_BACKOFF_MAX_SECONDS: float = float(os.getenv("OPENAI_RETRY_BACKOFF_MAX_SECONDS", "20"))
+    # Longer Retry-After values are passed on to the caller instead of waited out
+    OPENAI_RETRY_AFTER_MAX_SECONDS: float = float(os.getenv("OPENAI_RETRY_AFTER_MAX_SECONDS", "30"))
+    # Consecutive upstream failures that open the circuit, and how long it stays open
+    OPENAI_BREAKER_FAILURES: int = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+    OPENAI_BREAKER_RESET_SECONDS: float = float(os.getenv("OPENAI_BREAKER_RESET_SECONDS", "30"))
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    # "json" writes one JSON object per line, "text" the classic single-line format
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    # Longer messages are truncated when written
+    LOG_MAX_MESSAGE_CHARS: int = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+    # Records waiting for the writer thread; further records are dropped and counted
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
     DATABASE_URL: str = os.getenv("DATABASE_URL")
     POSTGRES_USER: str = os.getenv("POSTGRES_USER")
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD")
@@ -19,7 +72,94 @@ class Settings:
     POSTGRES_DB:str = os.getenv("POSTGRES_DB")
     DATABASE_URL:str = os.getenv("DATABASE_URL")
     ENV:str = os.getenv("ENV")
+    # Startup waits for the database: attempts and exponential backoff between them
+    DB_CONNECT_RETRIES: int = int(os.getenv("DB_CONNECT_RETRIES", "10"))
+    DB_CONNECT_BACKOFF_SECONDS: float = float(os.getenv("DB_CONNECT_BACKOFF_SECONDS", "0.5"))
+    DB_CONNECT_BACKOFF_MAX_SECONDS: float = float(os.getenv("DB_CONNECT_BACKOFF_MAX_SECONDS", "10"))
+    # Run `alembic upgrade head` in the app lifespan; deployments run it once before starting workers
+    DB_MIGRATE_ON_STARTUP: bool = os.getenv("DB_MIGRATE_ON_STARTUP", "true" if ENV == "development"
+                                            else "false").lower() == "true"
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    # Seconds after which pooled connections are replaced, below typical server/proxy idle timeouts
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
     JWT_SECRET:str = os.getenv("JWT_SECRET")
+    # Key id put in the token header; rotate by moving the old kid:secret to JWT_PREVIOUS_KEYS
+    JWT_KEY_ID: str = os.getenv("JWT_KEY_ID", "default")
+    JWT_PREVIOUS_KEYS: str = os.getenv("JWT_PREVIOUS_KEYS", "")
+    JWT_EXPIRE_SECONDS: int = int(os.getenv("JWT_EXPIRE_SECONDS", "3600"))
+    # Authenticated requests are served from this cache; bounds how stale a user record can get
+    USER_CACHE_TTL_SECONDS: int = int(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+    USER_CACHE_MAX_ENTRIES: int = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+    # bcrypt cost factor; stored hashes with another cost are upgraded on login
+    PASSWORD_BCRYPT_ROUNDS: int = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+    MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+    # Whole request body limit, leaves room for multipart framing around the image
+    MAX_REQUEST_BYTES: int = int(os.getenv("MAX_REQUEST_BYTES", str(21 * 1024 * 1024)))
+    BATCH_ANALYZE_CONCURRENCY: int = int(os.getenv("BATCH_ANALYZE_CONCURRENCY", "8"))
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+    MAX_BATCH_REQUEST_BYTES: int = int(os.getenv("MAX_BATCH_REQUEST_BYTES", str(200 * 1024 * 1024)))
+    # Write-behind batching of food log and intake rows: flush at this many rows or after this delay
+    WRITE_BATCH_MAX_ROWS: int = int(os.getenv("WRITE_BATCH_MAX_ROWS", "500"))
+    WRITE_BATCH_MAX_DELAY_SECONDS: float = float(os.getenv("WRITE_BATCH_MAX_DELAY_SECONDS", "0.02"))
+    # Batches at least this large are written with COPY on PostgreSQL
+    WRITE_BATCH_COPY_THRESHOLD: int = int(os.getenv("WRITE_BATCH_COPY_THRESHOLD", "100"))
+    # false: image analyses respond before their food log row is committed
+    FOOD_LOG_DURABLE_WRITES: bool = os.getenv("FOOD_LOG_DURABLE_WRITES", "true").lower() == "true"
+    NUTRITION_MAX_DAYS: int = int(os.getenv("NUTRITION_MAX_DAYS", "366"))
+    INTAKE_BATCH_MAX_ROWS: int = int(os.getenv("INTAKE_BATCH_MAX_ROWS", "100000"))
+    # Delete each async analysis' file and thread right after it; otherwise they are only
+    # recorded for the sweep (always the case for the blocking client)
+    OPENAI_CLEANUP_INLINE: bool = os.getenv("OPENAI_CLEANUP_INLINE", "true").lower() == "true"
+    # Inline deletions in flight at most; beyond that resources are recorded for the sweep
+    OPENAI_CLEANUP_INLINE_MAX_PENDING: int = int(os.getenv("OPENAI_CLEANUP_INLINE_MAX_PENDING", "100"))
+    # Background sweep of leftover files and threads; 0 disables it
+    OPENAI_JANITOR_INTERVAL_SECONDS: float = float(os.getenv("OPENAI_JANITOR_INTERVAL_SECONDS", "3600"))
+    # Uploaded vision files older than this are deleted; keep it above OPENAI_ANALYSIS_DEADLINE_SECONDS
+    OPENAI_RETENTION_SECONDS: float = float(os.getenv("OPENAI_RETENTION_SECONDS", "3600"))
+    OPENAI_JANITOR_CONCURRENCY: int = int(os.getenv("OPENAI_JANITOR_CONCURRENCY", "10"))
+    OPENAI_JANITOR_REQUESTS_PER_MINUTE: int = int(os.getenv("OPENAI_JANITOR_REQUESTS_PER_MINUTE", "600"))
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+    JOB_BACKOFF_SECONDS: float = float(os.getenv("JOB_BACKOFF_SECONDS", "2"))
+    JOB_BACKOFF_MAX_SECONDS: float = float(os.getenv("JOB_BACKOFF_MAX_SECONDS", "300"))
+    # How often idle workers look for due retries and jobs queued by other processes
+    JOB_POLL_INTERVAL_SECONDS: float = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+    # A job left "running" this long belongs to a worker that died; keep it above the analysis deadline
+    JOB_STALE_SECONDS: float = float(os.getenv("JOB_STALE_SECONDS", "600"))
+    # Comma-separated webhook hosts; when set, no others are called. Otherwise any https host
+    # resolving to public addresses only is accepted.
+    WEBHOOK_ALLOWED_HOSTS: str = os.getenv("WEBHOOK_ALLOWED_HOSTS", "")
+    WEBHOOK_TIMEOUT_SECONDS: float = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+    WEBHOOK_MAX_ATTEMPTS: int = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "3"))
+    IMAGE_PREPROCESS_ENABLED: bool = os.getenv("IMAGE_PREPROCESS_ENABLED", "true").lower() == "true"
+    # Longest edge after downscaling; the vision model works at about 768px on the short side
+    IMAGE_MAX_EDGE: int = int(os.getenv("IMAGE_MAX_EDGE", "1536"))
+    IMAGE_FORMAT: str = os.getenv("IMAGE_FORMAT", "JPEG")
+    IMAGE_QUALITY: int = int(os.getenv("IMAGE_QUALITY", "85"))
+    IMAGE_MIN_QUALITY: int = int(os.getenv("IMAGE_MIN_QUALITY", "50"))
+    # Re-encode at lower quality (down to IMAGE_MIN_QUALITY) until the image fits
+    IMAGE_TARGET_BYTES: int = int(os.getenv("IMAGE_TARGET_BYTES", str(1024 * 1024)))
+    IMAGE_PREPROCESS_WORKERS: int = int(os.getenv("IMAGE_PREPROCESS_WORKERS", str(os.cpu_count() or 2)))
+    IMAGE_CACHE_ENABLED: bool = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+    IMAGE_CACHE_TTL_SECONDS: int = int(os.getenv("IMAGE_CACHE_TTL_SECONDS", "86400"))
+    IMAGE_CACHE_MAX_ENTRIES: int = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "1024"))
+    # Keep results in the image_analysis_cache table as well, shared by all workers
+    IMAGE_CACHE_PERSISTENT: bool = os.getenv("IMAGE_CACHE_PERSISTENT", "false").lower() == "true"
+    # Match near-duplicate images by perceptual hash (requires Pillow)
+    IMAGE_CACHE_PERCEPTUAL: bool = os.getenv("IMAGE_CACHE_PERCEPTUAL", "false").lower() == "true"
+    IMAGE_CACHE_PERCEPTUAL_DISTANCE: int = int(os.getenv("IMAGE_CACHE_PERCEPTUAL_DISTANCE", "4"))
+    # Nutrition reference table (nutrients per 100 g); empty uses the bundled one
+    NUTRITION_REFERENCE_PATH: str = os.getenv("NUTRITION_REFERENCE_PATH", "")
+    # Recompute the model's macronutrients from the reference food named like its food
+    NUTRITION_CORRECTION_ENABLED: bool = os.getenv("NUTRITION_CORRECTION_ENABLED", "false").lower() == "true"
+    # Minimum name similarity (0-1) for correcting a food without an exact name or alias
+    # match, and for a search result
+    NUTRITION_MATCH_MIN_SIMILARITY: float = float(os.getenv("NUTRITION_MATCH_MIN_SIMILARITY", "0.9"))
+    NUTRITION_SEARCH_MIN_SIMILARITY: float = float(os.getenv("NUTRITION_SEARCH_MIN_SIMILARITY", "0.3"))
 
 
 
@@ -1,18 +1,26 @@
-import time
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, declarative_base, Session
+import asyncio
+from sqlalchemy import DateTime, create_engine, func, text
+from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.engine import URL
-from sqlalchemy.exc import OperationalError
-from typing import Generator
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncGenerator
 from .config import settings
 from .logger import setup_logger
 
 logger = setup_logger(__name__)
 
+SQLITE_PATH = "./backup.db"
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+
 # Function to create the database URL for PostgreSQL
-def create_postgres_url():
+def create_postgres_url(drivername: str = "postgresql+psycopg2"):
     return URL.create(
-        drivername="postgresql+psycopg2",
+        drivername=drivername,
         username=settings.POSTGRES_USER,
         password=settings.POSTGRES_PASSWORD,
         host=settings.POSTGRES_HOST,
@@ -20,35 +28,115 @@ def create_postgres_url():
         database=settings.POSTGRES_DB
     )
 
+def utcnow() -> datetime:
+    """
+    Current time as naive UTC, the form timestamps are stored in.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class db_now(FunctionElement):
+    """
+    The database's current time, for server-side timestamp defaults.
+
+    SQLite stores datetimes as text and its CURRENT_TIMESTAMP has no
+    fraction of a second, while SQLAlchemy binds datetimes with
+    microseconds. Text comparison of the two formats breaks range filters
+    and keyset pagination, so on SQLite the time is written in SQLAlchemy's
+    format (with millisecond precision).
+    """
+    type = DateTime()
+    inherit_cache = True
+
+@compiles(db_now)
+def _compile_db_now(element, compiler, **kw):
+    return compiler.process(func.now(), **kw)
+
+@compiles(db_now, "sqlite")
+def _compile_db_now_sqlite(element, compiler, **kw):
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
+def pool_options() -> dict:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+
 def create_sqlite_engine():
-    return create_engine("sqlite:///./backup.db")
+    return create_engine(f"sqlite:///{SQLITE_PATH}")
 
 # Check if we are in development mode
 is_development = settings.ENV == "development"
 
-# Try to create an engine for PostgreSQL only if not in development
+# Engines connect lazily: nothing touches the database at import time, and
+# wait_for_database() checks readiness with retries once the app starts.
 if not is_development:
-    try:
-        time.sleep(5) # give some time for DB to start
-        db_url = create_postgres_url()
-        engine = create_engine(db_url)
-        # Test connection
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        logger.info("--------Connected to PostgreSQL--------")
-    except OperationalError as e:
-        logger.error(f"PostgreSQL not available. Falling back to SQLite. Error: {e}")
-        engine = create_sqlite_engine()
+    # Sessions run in UTC so server-side now() defaults match the naive UTC
+    # timestamps written by the application
+    engine = create_engine(create_postgres_url(), connect_args={"options": "-c timezone=utc"}, **pool_options())
+    # The request path uses an async engine on the same database
+    async_engine = create_async_engine(create_postgres_url("postgresql+asyncpg"),
+                                       connect_args={"server_settings": {"timezone": "UTC"}}, **pool_options())
 else:
     logger.info("Development mode detected. Using SQLite.")
     engine = create_sqlite_engine()
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{SQLITE_PATH}")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+async def wait_for_database(retries: int = settings.DB_CONNECT_RETRIES,
+                            backoff: float = settings.DB_CONNECT_BACKOFF_SECONDS,
+                            backoff_max: float = settings.DB_CONNECT_BACKOFF_MAX_SECONDS) -> bool:
+    """
+    Wait until the database accepts connections, retrying with exponential
+    backoff. Returns False if it is still unreachable after `retries` attempts.
+    """
+    for attempt in range(1, retries + 1):
+        try:
+            async with async_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            logger.info("--------Connected to %s--------", async_engine.dialect.name)
+            return True
+        except (DBAPIError, OSError) as e:
+            if attempt == retries:
+                logger.error("Database not available after %s attempts: %s", retries, e)
+                break
+            delay = min(backoff * 2 ** (attempt - 1), backoff_max)
+            logger.warning("Database not ready (attempt %s/%s), retrying in %.1fs: %s", attempt, retries, delay, e)
+            await asyncio.sleep(delay)
+    return False
+
+
+def pool_status() -> dict:
+    """
+    Connection counts of the async engine's pool, for the readiness probe.
+    """
+    pool = async_engine.pool
+    status = {"class": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        status.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(),
+                      overflow=pool.overflow())
+    return status
+
+
+def run_migrations(revision: str = "head") -> None:
+    """
+    Bring the schema up to date with `alembic upgrade head`.
+    """
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(str(ALEMBIC_INI))
+    # Keep the application's logging configuration; readiness is already checked
+    config.attributes["configure_logger"] = False
+    config.attributes["wait_for_database"] = False
+    command.upgrade(config, revision)
@@ -0,0 +1,82 @@
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+from fastapi import UploadFile
+from .config import settings
+from .logger import setup_logger
+from .uploads import upload_payload
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Without Pillow uploads are sent unchanged
+    Image = None
+
+logger = setup_logger(__name__)
+
+CONTENT_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# Pillow releases the GIL while decoding, resizing and encoding, so a small
+# dedicated pool scales with cores without starving the default thread pool.
+_executor = ThreadPoolExecutor(max_workers=settings.IMAGE_PREPROCESS_WORKERS,
+                               thread_name_prefix="image-preprocess")
+
+
+class ImagePreprocessor:
+    @staticmethod
+    def preprocess(file: BinaryIO, max_edge: int, image_format: str = "JPEG", quality: int = 85,
+                   min_quality: int = 50, target_bytes: int = 0) -> bytes:
+        """
+        Apply the EXIF orientation, downscale so the longest edge is at most
+        `max_edge` and re-encode without metadata. The quality is lowered in
+        steps of 10 (not below `min_quality`) until the result fits in
+        `target_bytes`; 0 disables the size bound.
+        """
+        image_format = image_format.upper()
+        with Image.open(file) as image:
+            # Let the JPEG decoder skip detail we are about to throw away.
+            image.draft("RGB", (max_edge, max_edge))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+            if image_format == "JPEG" and image.mode != "RGB":
+                image = image.convert("RGB")
+            elif image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+            while True:
+                buffer = io.BytesIO()
+                image.save(buffer, format=image_format, quality=quality, optimize=True)
+                if not target_bytes or buffer.tell() <= target_bytes or quality - 10 < min_quality:
+                    return buffer.getvalue()
+                quality -= 10
+
+
+async def preprocess_upload(file: UploadFile) -> tuple:
+    """
+    Downscale and re-encode the upload off the event loop. Returns the
+    (filename, content, content type) payload for the OpenAI files API; the
+    original upload is passed through when Pillow is missing, preprocessing
+    is disabled or the data is not a decodable image.
+    """
+    filename = file.filename or "upload"
+    original = upload_payload(file)
+    if Image is None or not settings.IMAGE_PREPROCESS_ENABLED:
+        return original
+
+    image_format = settings.IMAGE_FORMAT.upper()
+    await file.seek(0)
+    loop = asyncio.get_running_loop()
+    try:
+        content = await loop.run_in_executor(
+            _executor, ImagePreprocessor.preprocess, file.file, settings.IMAGE_MAX_EDGE, image_format,
+            settings.IMAGE_QUALITY, settings.IMAGE_MIN_QUALITY, settings.IMAGE_TARGET_BYTES)
+    except Exception as e:
+        logger.warning("Image preprocessing skipped for %s: %s", filename, e)
+        await file.seek(0)
+        return original
+
+    logger.debug("Preprocessed %s: %s -> %s bytes", filename, file.size, len(content))
+    stem = os.path.splitext(filename)[0]
+    extension = ".jpg" if image_format == "JPEG" else f".{image_format.lower()}"
+    return (f"{stem}{extension}", content, CONTENT_TYPES.get(image_format, "application/octet-stream"))
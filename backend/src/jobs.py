@@ -0,0 +1,341 @@
+import asyncio
+import io
+import ipaddress
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit
+import httpx
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from starlette.datastructures import Headers
+from .config import settings
+from .database import AsyncSessionLocal, utcnow
+from .logger import setup_logger
+from .models import AnalysisJob
+from .openai_client.limits import TRANSIENT_STATUS_CODES
+from .schemas import FoodInfo, JobStatus
+from .services import analyze_upload, close_openai_client, create_openai_client, store_food_info
+
+logger = setup_logger(__name__)
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def resolve_webhook_url(url: str) -> list[str]:
+    """
+    Reject webhook URLs the server must not call: anything but https, hosts
+    outside WEBHOOK_ALLOWED_HOSTS when it is set, and otherwise hosts
+    resolving to loopback, private, link-local or other non-public
+    addresses (the instance metadata service, internal APIs). Raises a 400.
+
+    Returns the addresses the host was checked on, or [] for allowed hosts.
+    Calls must connect to one of these rather than resolve the host again,
+    which could answer differently by then (DNS rebinding).
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme != "https" or not host:
+        raise HTTPException(status_code=400, detail="webhook_url must be an https URL")
+    allowed_hosts = {h.strip().lower() for h in settings.WEBHOOK_ALLOWED_HOSTS.split(",") if h.strip()}
+    if allowed_hosts:
+        if host not in allowed_hosts:
+            raise HTTPException(status_code=400, detail="webhook_url host is not allowed")
+        return []
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, parts.port or 443, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise HTTPException(status_code=400, detail="webhook_url host cannot be resolved")
+    if not all(_is_public(address[4][0]) for address in addresses):
+        raise HTTPException(status_code=400, detail="webhook_url must point to a public host")
+    return list(dict.fromkeys(address[4][0] for address in addresses))
+
+
+async def check_webhook_url(url: str) -> str:
+    """
+    `url` if the server may call it; see resolve_webhook_url().
+    """
+    await resolve_webhook_url(url)
+    return url
+
+
+def pinned_request(url: str, address: str) -> tuple[str, dict, dict]:
+    """
+    URL, headers and httpx extensions that send a request for `url` to
+    `address`: the Host header and TLS server name (SNI, and the name the
+    certificate is checked against) stay those of the original host.
+    """
+    parts = urlsplit(url)
+    userinfo, _, host_port = parts.netloc.rpartition("@")
+    netloc = f"[{address}]" if ":" in address else address
+    if parts.port:
+        netloc = f"{netloc}:{parts.port}"
+    if userinfo:
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit(parts._replace(netloc=netloc)), {"host": host_port}, {"sni_hostname": parts.hostname}
+
+
+def job_status(job: AnalysisJob) -> JobStatus:
+    return JobStatus(
+        id=job.id,
+        status=job.status,
+        attempts=job.attempts,
+        food_info=FoodInfo(**job.result) if job.result else None,
+        error=job.error,
+        error_status_code=job.error_status_code,
+        date_created=job.date_created,
+        date_last_updated=job.date_last_updated,
+    )
+
+
+class JobQueue:
+    """
+    Persistent queue of image analyses backed by the analysis_jobs table.
+
+    Jobs are claimed with a conditional UPDATE, so several worker processes
+    can share the table. Transient OpenAI failures are retried with jittered
+    exponential backoff; jobs interrupted by a restart are claimed again once
+    they go stale, or failed if they have no attempts left.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker = AsyncSessionLocal, workers: int = settings.JOB_WORKERS,
+                 max_attempts: int = settings.JOB_MAX_ATTEMPTS, backoff: float = settings.JOB_BACKOFF_SECONDS,
+                 backoff_max: float = settings.JOB_BACKOFF_MAX_SECONDS,
+                 poll_interval: float = settings.JOB_POLL_INTERVAL_SECONDS,
+                 stale_after: float = settings.JOB_STALE_SECONDS):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.openai_client = None
+        self._wakeup: asyncio.Event | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self, openai_client=None) -> None:
+        """
+        Start the workers; they share `openai_client` when given, otherwise
+        each job creates and closes its own client.
+        """
+        self.openai_client = openai_client
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info("Started %s analysis job workers", self.workers)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, db: AsyncSession, content: bytes, filename: str | None, content_type: str | None,
+                      webhook_url: str | None = None, owner_id: int | None = None) -> AnalysisJob:
+        job = AnalysisJob(id=uuid.uuid4().hex, owner_id=owner_id, status="pending", attempts=0, filename=filename,
+                          content_type=content_type, image=content, webhook_url=webhook_url,
+                          next_attempt_at=utcnow())
+        db.add(job)
+        await db.commit()
+        await db.refresh(job)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    @staticmethod
+    async def get(db: AsyncSession, job_id: str, owner_id: int | None = None) -> AnalysisJob | None:
+        """
+        The job, if it exists and is visible to `owner_id`: jobs queued by a
+        user are only visible to that user, anonymous ones to anyone with
+        the id.
+        """
+        job = await db.get(AnalysisJob, job_id)
+        if job is None or (job.owner_id is not None and job.owner_id != owner_id):
+            return None
+        return job
+
+    async def process_next(self) -> bool:
+        """
+        Claim and run one due job. Returns False when nothing was due.
+        """
+        job_id = await self._claim_next()
+        if job_id is None:
+            return False
+        await self._run(job_id)
+        return True
+
+    def _stale(self, now: datetime):
+        return and_(AnalysisJob.status == "running",
+                    AnalysisJob.date_last_updated < now - timedelta(seconds=self.stale_after))
+
+    def _claimable(self, now: datetime):
+        return or_(
+            and_(AnalysisJob.status == "pending", AnalysisJob.next_attempt_at <= now),
+            and_(self._stale(now), AnalysisJob.attempts < self.max_attempts),
+        )
+
+    async def _fail_abandoned(self, now: datetime) -> None:
+        """
+        Fail stale jobs that have used all their attempts, instead of
+        leaving them "running" forever.
+        """
+        abandoned = and_(self._stale(now), AnalysisJob.attempts >= self.max_attempts)
+        failed = []
+        async with self.session_factory() as db:
+            for job_id in (await db.scalars(select(AnalysisJob.id).where(abandoned))).all():
+                result = await db.execute(update(AnalysisJob)
+                                          .where(AnalysisJob.id == job_id, abandoned)
+                                          .values(status="failed", error="Analysis did not finish",
+                                                  error_status_code=504, image=None, date_last_updated=now)
+                                          .execution_options(synchronize_session=False))
+                await db.commit()
+                if result.rowcount:
+                    job = await db.get(AnalysisJob, job_id, populate_existing=True)
+                    logger.error("Analysis job %s failed after %s attempts: did not finish", job_id, job.attempts)
+                    failed.append(job)
+        for job in failed:
+            if job.webhook_url:
+                await self._notify(job.webhook_url, job_status(job))
+
+    async def _claim_next(self) -> str | None:
+        now = utcnow()
+        await self._fail_abandoned(now)
+        async with self.session_factory() as db:
+            candidates = await db.scalars(select(AnalysisJob.id)
+                                          .where(self._claimable(now))
+                                          .order_by(AnalysisJob.next_attempt_at)
+                                          .limit(self.workers))
+            for job_id in candidates.all():
+                claimed = await db.execute(update(AnalysisJob)
+                                           .where(AnalysisJob.id == job_id, self._claimable(now))
+                                           .values(status="running", attempts=AnalysisJob.attempts + 1,
+                                                   date_last_updated=now)
+                                           .execution_options(synchronize_session=False))
+                await db.commit()
+                if claimed.rowcount:
+                    return job_id
+        return None
+
+    async def _run(self, job_id: str) -> None:
+        # No session (and pooled connection) is held during the analysis
+        async with self.session_factory() as db:
+            job = await db.get(AnalysisJob, job_id)
+            image, filename, content_type, owner_id = job.image or b"", job.filename, job.content_type, job.owner_id
+
+        upload = UploadFile(io.BytesIO(image), size=len(image), filename=filename,
+                            headers=Headers({"content-type": content_type or "application/octet-stream"}))
+        client = self.openai_client or create_openai_client()
+        food_info, failure = None, None
+        try:
+            food_info = await analyze_upload(upload, client)
+        except HTTPException as e:
+            failure = (str(e.detail), e.status_code)
+        except Exception as e:
+            logger.error("Analysis job %s failed: %s", job_id, e)
+            failure = ("Internal server error", 500)
+        finally:
+            if client is not self.openai_client:
+                await close_openai_client(client)
+
+        async with self.session_factory() as db:
+            job = await db.get(AnalysisJob, job_id)
+            if failure is None:
+                job.status = "completed"
+                job.result = food_info.model_dump()
+                job.error = None
+                job.error_status_code = None
+            else:
+                self._record_failure(job, *failure)
+            if job.status in ("completed", "failed"):
+                job.image = None
+            await db.commit()
+            status = job_status(job)
+            webhook_url = job.webhook_url if job.status in ("completed", "failed") else None
+
+        # The result is saved with the job above, so failing to add it to the
+        # food log is reported on the completed job instead of losing it
+        if failure is None:
+            try:
+                await store_food_info(food_info, self.session_factory(), owner_id=owner_id)
+            except Exception as e:
+                logger.error("Analysis job %s completed but its result was not added to the food log: %s", job_id, e)
+                async with self.session_factory() as db:
+                    job = await db.get(AnalysisJob, job_id)
+                    job.error = "Result could not be added to the food log"
+                    job.error_status_code = 500
+                    await db.commit()
+                    status = job_status(job)
+
+        if webhook_url:
+            await self._notify(webhook_url, status)
+
+    def _record_failure(self, job: AnalysisJob, detail: str, status_code: int) -> None:
+        job.error = detail
+        job.error_status_code = status_code
+        if status_code in TRANSIENT_STATUS_CODES and job.attempts < self.max_attempts:
+            delay = min(self.backoff * 2 ** (job.attempts - 1), self.backoff_max) * random.uniform(0.5, 1.5)
+            job.status = "pending"
+            job.next_attempt_at = utcnow() + timedelta(seconds=delay)
+            logger.warning("Analysis job %s attempt %s failed (%s), retrying in %.1fs",
+                           job.id, job.attempts, status_code, delay)
+        else:
+            job.status = "failed"
+            logger.error("Analysis job %s failed after %s attempts: %s", job.id, job.attempts, detail)
+
+    async def _notify(self, webhook_url: str, status: JobStatus) -> None:
+        """
+        POST the final job status to the webhook, best effort. The URL is
+        checked again, as its host may resolve differently by now, and the
+        request goes to the addresses just checked.
+        """
+        try:
+            addresses = await resolve_webhook_url(webhook_url)
+        except HTTPException as e:
+            logger.error("Not calling webhook for job %s: %s", status.id, e.detail)
+            return
+        async with httpx.AsyncClient(timeout=settings.WEBHOOK_TIMEOUT_SECONDS) as client:
+            for attempt in range(1, settings.WEBHOOK_MAX_ATTEMPTS + 1):
+                url, headers, extensions = webhook_url, {}, {}
+                if addresses:
+                    url, headers, extensions = pinned_request(webhook_url, addresses[(attempt - 1) % len(addresses)])
+                try:
+                    response = await client.post(url, content=status.model_dump_json(),
+                                                 headers={**headers, "content-type": "application/json"},
+                                                 extensions=extensions)
+                    if response.status_code < 500:
+                        return
+                    logger.warning("Webhook for job %s returned %s", status.id, response.status_code)
+                except httpx.HTTPError as e:
+                    logger.warning("Webhook for job %s failed: %s", status.id, e)
+                if attempt < settings.WEBHOOK_MAX_ATTEMPTS:
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+        logger.error("Giving up on webhook for job %s", status.id)
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                if await self.process_next():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Analysis job worker error: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+job_queue = JobQueue()
+
+
+def get_job_queue() -> JobQueue:
+    return job_queue
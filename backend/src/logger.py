@@ -1,29 +1,165 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
+import queue
+import threading
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from .config import settings
 
+request_id: contextvars.ContextVar[str | None] = contextvars.ContextVar("request_id", default=None)
 
-def setup_logger(name: str) -> logging.Logger:
-    log_level = settings.LOG_LEVEL
-    numeric_level = getattr(logging, log_level.upper(), None)
+# Attributes every LogRecord has; anything else was passed with `extra=`
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+TEXT_FORMAT = "%(levelname)s:     %(asctime)s - %(name)s - %(message)s"
+
+_listener: QueueListener | None = None
+
+
+def truncate(message: str, limit: int) -> str:
+    if limit <= 0 or len(message) <= limit:
+        return message
+    return f"{message[:limit]}... [{len(message) - limit} chars truncated]"
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line with the timestamp, level, logger, message,
+    request id and any `extra=` fields of the record.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": truncate(record.getMessage(), settings.LOG_MAX_MESSAGE_CHARS),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        record = copy.copy(record)
+        record.msg, record.args = truncate(record.getMessage(), settings.LOG_MAX_MESSAGE_CHARS), None
+        return super().format(record)
+
+
+def snapshot(arg, limit: int):
+    """
+    `arg` as it is now: numbers and the like as they are, anything else as
+    its (truncated) string.
+    """
+    if arg is None or isinstance(arg, (bool, int, float)):
+        return arg
+    return truncate(arg if isinstance(arg, str) else str(arg), limit)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks the caller. Message formatting happens on
+    the writer thread, but the arguments are snapshotted here, since the
+    caller may change them afterwards (and should not keep large objects
+    alive in the queue); the request id is captured here too because it
+    lives in the caller's context. When the queue is full records are
+    dropped, and the number dropped is attached to the next record that fits.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id.get()
+        limit = settings.LOG_MAX_MESSAGE_CHARS
+        if isinstance(record.args, dict):
+            record.args = {key: snapshot(value, limit) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(snapshot(arg, limit) for arg in record.args)
+        with self._dropped_lock:
+            if self.dropped:
+                record.dropped_records, self.dropped = self.dropped, 0
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1 + getattr(record, "dropped_records", 0)
+
+
+def configure_logging() -> None:
+    """
+    Route all logging through a bounded queue to a single writer thread.
+    Runs once per process; later calls do nothing.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    numeric_level = getattr(logging, settings.LOG_LEVEL.upper(), None)
     if not isinstance(numeric_level, int):
-        raise ValueError(f"Invalid log level: {log_level}")
+        raise ValueError(f"Invalid log level: {settings.LOG_LEVEL}")
 
-    # Set up basic configuration for your logger
-    logging.basicConfig(
-        level=numeric_level,
-        format="%(levelname)s:     %(asctime)s - %(name)s - %(message)s"
-    )
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else TextFormatter(TEXT_FORMAT))
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
 
-    # Create a logger object
-    logger = logging.getLogger(name)
-    logger.info(f"Log level set to {log_level}")
+    root = logging.getLogger()
+    root.setLevel(numeric_level)
+    root.addHandler(NonBlockingQueueHandler(log_queue))
 
     # Set log level for third-party libraries to WARNING or ERROR
-    logging.getLogger("httpcore").setLevel(logging.WARNING)
-    logging.getLogger("httpx").setLevel(logging.WARNING)
-    logging.getLogger("uvicorn").setLevel(logging.WARNING)
-    logging.getLogger("fastapi").setLevel(logging.WARNING)
-    logging.getLogger("openai._base_client").setLevel(logging.WARNING)
-    logging.getLogger("multipart.multipart").setLevel(logging.WARNING)
-
-    return logger
+    for name in ("httpcore", "httpx", "uvicorn", "fastapi", "openai._base_client", "multipart.multipart"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    logging.getLogger(__name__).info("Log level set to %s", settings.LOG_LEVEL)
+
+
+def setup_logger(name: str) -> logging.Logger:
+    configure_logging()
+    return logging.getLogger(name)
+
+
+class RequestIdMiddleware:
+    """
+    Tag every log record written while handling a request with its id,
+    taken from the X-Request-ID header or generated, and echo the id in the
+    response headers.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = dict(scope["headers"]).get(b"x-request-id")
+        current = header.decode("latin-1")[:64] if header else uuid.uuid4().hex
+        token = request_id.set(current)
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", current.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,141 @@
+"""
+Prometheus metrics, exposed on /metrics.
+
+Request latency is recorded per route template by MetricsMiddleware, DB
+query and commit timings by SQLAlchemy event listeners on every engine and
+session, and OpenAI stage timings, errors and retries by the OpenAI clients.
+Pool gauges are read from the async engine when the metrics are scraped.
+"""
+import time
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from .database import pool_status
+
+# OpenAI stages range from tens of milliseconds (thread create) to tens of
+# seconds (assistant runs), beyond the default buckets.
+OPENAI_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"])
+OPENAI_STAGE_LATENCY = Histogram(
+    "openai_stage_duration_seconds", "Time spent in each stage of an image analysis",
+    ["stage"], buckets=OPENAI_BUCKETS)
+OPENAI_ERRORS = Counter(
+    "openai_errors_total", "Failed image analyses by exception type", ["error"])
+OPENAI_RETRIES = Counter(
+    "openai_retries_total", "Requests to OpenAI retried by the client library")
+OPENAI_REJECTED = Counter(
+    "openai_rejected_total", "Analyses rejected without calling OpenAI", ["reason"])
+OPENAI_CONCURRENCY_LIMIT = Gauge(
+    "openai_concurrency_limit", "Current adaptive cap on concurrent analyses")
+OPENAI_IN_FLIGHT = Gauge(
+    "openai_in_flight", "Analyses currently calling OpenAI")
+OPENAI_CIRCUIT_OPEN = Gauge(
+    "openai_circuit_open", "1 while the OpenAI circuit breaker rejects or trials calls")
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Database statement execution time by statement type",
+    ["operation"], buckets=DB_BUCKETS)
+DB_COMMIT_LATENCY = Histogram(
+    "db_commit_duration_seconds", "Session commit time, including the final flush", buckets=DB_BUCKETS)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Connections of the async engine's pool by state", ["state"])
+
+for state in ("size", "checked_in", "checked_out", "overflow"):
+    DB_POOL_CONNECTIONS.labels(state).set_function(lambda state=state: pool_status().get(state, 0))
+
+
+def statement_operation(statement: str) -> str:
+    """
+    Leading keyword of a statement (SELECT, INSERT, ...), a bounded label.
+    """
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword if keyword in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH") else "OTHER"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    DB_QUERY_LATENCY.labels(statement_operation(statement)).observe(time.perf_counter() - started)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    # after_cursor_execute does not run for failed statements
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
+
+
+@event.listens_for(Session, "before_commit")
+def _before_commit(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        DB_COMMIT_LATENCY.observe(time.perf_counter() - started)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("commit_started", None)
+
+
+def count_retry(request) -> None:
+    """
+    httpx request hook: the OpenAI client numbers its attempts in the
+    x-stainless-retry-count header.
+    """
+    if request.headers.get("x-stainless-retry-count", "0") != "0":
+        OPENAI_RETRIES.inc()
+
+
+async def count_retry_async(request) -> None:
+    count_retry(request)
+
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    Record the latency of every HTTP request, labelled with the route
+    template (e.g. /jobs/{job_id}) rather than the raw path so label
+    cardinality stays bounded. Requests matching no route share one label.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(scope["method"], getattr(route, "path", "unmatched"),
+                                   str(status)).observe(time.perf_counter() - started)
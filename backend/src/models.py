@@ -1,8 +1,6 @@
-from passlib import hash
-from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime
-from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, Date, DateTime, LargeBinary, JSON, Index
 from sqlalchemy.orm import relationship
-from .database import Base
+from .database import Base, db_now
 
 class User(Base):
     __tablename__ = "users"
@@ -13,9 +11,6 @@ class User(Base):
     calories = relationship("UserCalories", back_populates="owner")
     food_info = relationship("FoodInfoDB", back_populates="owner")
 
-    def verify_password(self, password: str):
-        return hash.bcrypt.verify(password.encode('utf-8'), self.hashed_password)
-
 
 class UserCalories(Base):
     __tablename__ = "user_calories"
@@ -25,11 +20,13 @@ class UserCalories(Base):
     fat_g = Column(Float, nullable=False)
     sugar_g = Column(Float, nullable=False)
     protein_g = Column(Float, nullable=False)
-    date_created = Column(DateTime, default=datetime.now(timezone.utc))
-    date_last_updated = Column(DateTime, default=datetime.now(timezone.utc))
+    date_created = Column(DateTime, server_default=db_now())
+    date_last_updated = Column(DateTime, server_default=db_now(), onupdate=db_now())
 
     owner = relationship("User", back_populates="calories")
 
+    __table_args__ = (Index("ix_user_calories_owner_id_date_created", "owner_id", "date_created"),)
+
 
 class FoodInfoDB(Base):
     __tablename__ = "food_info"
@@ -41,7 +38,76 @@ class FoodInfoDB(Base):
     fat_in_g = Column(Float, nullable=False)
     sugar_in_g = Column(Float, nullable=False)
     protein_in_g = Column(Float, nullable=False)
-    date_created = Column(DateTime, default=datetime.now(timezone.utc))
-    date_last_updated = Column(DateTime, default=datetime.now(timezone.utc))
+    date_created = Column(DateTime, server_default=db_now())
+    date_last_updated = Column(DateTime, server_default=db_now(), onupdate=db_now())
 
     owner = relationship("User", back_populates="food_info")
+
+    __table_args__ = (
+        # Serves the per-user food log: equality on owner_id, range/order on date_created
+        Index("ix_food_info_owner_id_date_created", "owner_id", "date_created"),
+        # The log is append-only, so date_created follows the physical row order and a
+        # tiny BRIN index lets time-window scans across all users skip most blocks
+        Index("ix_food_info_date_created_brin", "date_created", postgresql_using="brin",
+              postgresql_with={"pages_per_range": 32}).ddl_if(dialect="postgresql"),
+    )
+
+
+class DailyNutritionRollup(Base):
+    """
+    Per-user, per-day totals of food_info, kept up to date on every write.
+    """
+    __tablename__ = "daily_nutrition_rollups"
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    entries = Column(Integer, nullable=False, default=0)
+    calories_Kcal = Column(Float, nullable=False, default=0)
+    fat_in_g = Column(Float, nullable=False, default=0)
+    sugar_in_g = Column(Float, nullable=False, default=0)
+    protein_in_g = Column(Float, nullable=False, default=0)
+
+
+class ImageAnalysisCache(Base):
+    __tablename__ = "image_analysis_cache"
+    image_hash = Column(String(64), primary_key=True)
+    perceptual_hash = Column(String(16), index=True)
+    certainty = Column(Float, nullable=False)
+    food_name = Column(String, nullable=False)
+    calories_Kcal = Column(Float, nullable=False)
+    fat_in_g = Column(Float, nullable=False)
+    sugar_in_g = Column(Float, nullable=False)
+    protein_in_g = Column(Float, nullable=False)
+    date_created = Column(DateTime, server_default=db_now())
+
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+    id = Column(String(32), primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    status = Column(String, nullable=False, default="pending", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    filename = Column(String)
+    content_type = Column(String)
+    # Kept until the job finishes so pending work survives restarts
+    image = Column(LargeBinary)
+    webhook_url = Column(String)
+    result = Column(JSON)
+    error = Column(String)
+    error_status_code = Column(Integer)
+    next_attempt_at = Column(DateTime, index=True)
+    date_created = Column(DateTime, server_default=db_now())
+    date_last_updated = Column(DateTime, server_default=db_now(), onupdate=db_now())
+
+    # Load the server-generated timestamps on flush; lazy loads are not possible with AsyncSession
+    __mapper_args__ = {"eager_defaults": True}
+
+
+class OpenAIResource(Base):
+    """
+    OpenAI file or thread whose deletion after its analysis failed; the
+    janitor retries it on its next sweep.
+    """
+    __tablename__ = "openai_resources"
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    date_created = Column(DateTime, server_default=db_now())
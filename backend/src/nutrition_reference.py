@@ -0,0 +1,252 @@
+"""
+Local nutrition reference: canonical nutrients per 100 g, looked up by
+food name through an in-memory trigram index.
+
+The table is a CSV with the columns food_name, aliases ("|"-separated),
+calories_Kcal, fat_in_g, protein_in_g and sugar_in_g. A small table of
+common foods is bundled; NUTRITION_REFERENCE_PATH points to a larger one,
+e.g. converted from a USDA FoodData Central CSV download:
+
+    python -m src.nutrition_reference --from-usda FoodData_Central_csv/ --output reference.csv
+"""
+import argparse
+import csv
+import heapq
+import math
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from .config import settings
+from .logger import setup_logger
+from .schemas import FoodInfo
+
+logger = setup_logger(__name__)
+
+BUNDLED_PATH = Path(__file__).resolve().parent / "data" / "nutrition_reference.csv"
+NUTRIENTS = ("calories_Kcal", "fat_in_g", "protein_in_g", "sugar_in_g")
+NON_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+# Bounds on the work of one lookup whatever the table size: postings of the
+# query's rarest trigrams are counted up to MAX_POSTINGS names in all (at
+# least the first MAX_POSTINGS of the rarest one), and at most MAX_CANDIDATES
+# names are scored.
+MAX_POSTINGS = 10000
+MAX_CANDIDATES = 500
+
+
+@dataclass(frozen=True)
+class ReferenceFood:
+    """
+    Nutrients of 100 g of a food.
+    """
+    food_name: str
+    calories_Kcal: float
+    fat_in_g: float
+    protein_in_g: float
+    sugar_in_g: float
+    aliases: tuple[str, ...] = field(default=(), compare=False)
+
+    def scaled(self, grams: float) -> dict[str, float]:
+        return {nutrient: round(getattr(self, nutrient) * grams / 100, 2) for nutrient in NUTRIENTS}
+
+
+def normalize(name: str) -> str:
+    return " ".join(NON_ALPHANUMERIC.sub(" ", name.lower()).split())
+
+
+def trigrams(name: str) -> frozenset[str]:
+    """
+    Trigrams of each word padded like pg_trgm ("  w", " wo", "wor", ...),
+    so word starts weigh more than word middles.
+    """
+    grams = set()
+    for word in normalize(name).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class NutritionReference:
+    """
+    Reference foods with an inverted index from trigrams to the names
+    (food names and aliases) containing them; similarity is the Jaccard
+    index of the two trigram sets. A name at least `min_similarity` similar
+    to the query shares one of its rarest trigrams (prefix filtering), so
+    candidates are collected from those postings only, leaving out very
+    common trigrams, and scored best possible similarity first until the
+    rest cannot make the results. The table is loaded on first use.
+
+    Trigram similarity ranks search results well but is too loose to pick
+    a food's nutrients ("Apple pie" shares most trigrams with "Apple"), so
+    match() takes an exact name or alias first and otherwise needs a
+    near-identical name.
+    """
+
+    def __init__(self, path: str | Path, max_postings: int = MAX_POSTINGS, max_candidates: int = MAX_CANDIDATES):
+        self.path = Path(path)
+        self.max_postings = max_postings
+        self.max_candidates = max_candidates
+        self.foods: list[ReferenceFood] = []
+        # Per indexed name: the food it names and its trigrams
+        self._names: list[tuple[ReferenceFood, frozenset[str]]] = []
+        self._postings: dict[str, list[int]] = {}
+        # Normalized food names and aliases
+        self._exact: dict[str, ReferenceFood] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        # Lookups run on every analysis; only the first one needs the lock
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            with open(self.path, newline="", encoding="utf-8") as f:
+                foods = [ReferenceFood(
+                    food_name=row["food_name"],
+                    aliases=tuple(alias for alias in (row.get("aliases") or "").split("|") if alias),
+                    **{nutrient: float(row[nutrient] or 0) for nutrient in NUTRIENTS},
+                ) for row in csv.DictReader(f)]
+            for food in foods:
+                self._add(food)
+            self.foods = foods
+            self._loaded = True
+            logger.info("Loaded %s reference foods from %s", len(foods), self.path)
+
+    def _add(self, food: ReferenceFood) -> None:
+        for name in (food.food_name, *food.aliases):
+            self._exact.setdefault(normalize(name), food)
+            grams = trigrams(name)
+            name_id = len(self._names)
+            self._names.append((food, grams))
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(name_id)
+
+    def search(self, query: str, limit: int = 10,
+               min_similarity: float = settings.NUTRITION_SEARCH_MIN_SIMILARITY) -> list[tuple[ReferenceFood, float]]:
+        """
+        Up to `limit` foods whose name or an alias is most similar to
+        `query`, best first, with their similarity (0-1).
+        """
+        self.load()
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        # A match shares at least ceil(min_similarity * |query|) trigrams, so
+        # one of the |query| - that + 1 rarest ones
+        postings = sorted((self._postings.get(gram, ()) for gram in query_grams), key=len)
+        prefix = len(query_grams) - max(1, math.ceil(min_similarity * len(query_grams))) + 1
+        shared: dict[int, int] = {}
+        counted = scanned = 0
+        for posting in postings[:prefix]:
+            if counted and counted + len(posting) > self.max_postings:
+                break
+            for name_id in posting[:self.max_postings]:
+                shared[name_id] = shared.get(name_id, 0) + 1
+            counted += len(posting)
+            scanned += 1
+
+        # Score candidates by their best possible similarity, sharing every
+        # trigram not counted, and stop once none can make the results
+        unscanned = len(query_grams) - scanned
+        bounds = []
+        for name_id, count in shared.items():
+            size = len(self._names[name_id][1])
+            count = min(count + unscanned, size, len(query_grams))
+            bounds.append((count / (len(query_grams) + size - count), name_id))
+        best: dict[str, tuple[ReferenceFood, float]] = {}
+        worst_kept = 0.0
+        for bound, name_id in heapq.nlargest(self.max_candidates, bounds):
+            if bound < min_similarity or bound < worst_kept:
+                break
+            food, grams = self._names[name_id]
+            count = len(query_grams & grams)
+            similarity = count / (len(query_grams) + len(grams) - count)
+            if similarity >= min_similarity and similarity > best.get(food.food_name, (food, 0.0))[1]:
+                best[food.food_name] = (food, similarity)
+                if len(best) >= limit:
+                    worst_kept = heapq.nlargest(limit, (match[1] for match in best.values()))[-1]
+        return sorted(best.values(), key=lambda match: (-match[1], match[0].food_name))[:limit]
+
+    def match(self, name: str,
+              min_similarity: float = settings.NUTRITION_MATCH_MIN_SIMILARITY) -> ReferenceFood | None:
+        self.load()
+        exact = self._exact.get(normalize(name))
+        if exact is not None:
+            return exact
+        matches = self.search(name, 1, min_similarity)
+        return matches[0][0] if matches else None
+
+    def correct(self, food: FoodInfo) -> FoodInfo:
+        """
+        `food` with fat, protein and sugar recomputed from the reference
+        food it names. The model's calories are kept as its estimate of
+        the portion, which sets the grams the reference values are scaled
+        to; without calories or a match the food is unchanged.
+        """
+        reference = self.match(food.food_name)
+        if reference is None or food.calories_Kcal <= 0 or reference.calories_Kcal < 1:
+            return food
+        nutrients = reference.scaled(food.calories_Kcal / reference.calories_Kcal * 100)
+        del nutrients["calories_Kcal"]
+        logger.debug("Corrected %s with reference food %s", food.food_name, reference.food_name)
+        return food.model_copy(update=nutrients)
+
+
+nutrition_reference = NutritionReference(settings.NUTRITION_REFERENCE_PATH or BUNDLED_PATH)
+
+
+# FoodData Central nutrient ids; energy is listed under one of several ids
+# depending on the data type.
+USDA_NUTRIENTS = {
+    "calories_Kcal": ("1008", "2047", "2048"),
+    "fat_in_g": ("1004",),
+    "protein_in_g": ("1003",),
+    "sugar_in_g": ("2000", "1063"),
+}
+USDA_DATA_TYPES = ("foundation_food", "sr_legacy_food", "survey_fndds_food")
+
+
+def convert_usda(directory: Path, output: Path, data_types: tuple[str, ...] = USDA_DATA_TYPES) -> int:
+    """
+    Write the reference table for the foods of a FoodData Central CSV
+    download (food.csv and food_nutrient.csv). Foods without energy, fat
+    or protein values are left out; missing sugar counts as 0. Returns the
+    number of foods written.
+    """
+    with open(directory / "food.csv", newline="", encoding="utf-8") as f:
+        names = {row["fdc_id"]: row["description"] for row in csv.DictReader(f) if row["data_type"] in data_types}
+
+    nutrient_fields = {nutrient_id: nutrient for nutrient, ids in USDA_NUTRIENTS.items() for nutrient_id in ids}
+    values: dict[str, dict[str, float]] = {}
+    with open(directory / "food_nutrient.csv", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            nutrient = nutrient_fields.get(row["nutrient_id"])
+            if nutrient and row["fdc_id"] in names and row["amount"]:
+                values.setdefault(row["fdc_id"], {}).setdefault(nutrient, float(row["amount"]))
+
+    written = 0
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(("food_name", "aliases", *NUTRIENTS))
+        for fdc_id, food in values.items():
+            if not {"calories_Kcal", "fat_in_g", "protein_in_g"} <= food.keys():
+                continue
+            writer.writerow((names[fdc_id], "", *(round(food.get(nutrient, 0), 2) for nutrient in NUTRIENTS)))
+            written += 1
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build a nutrition reference table from a USDA FoodData "
+                                                 "Central CSV download.")
+    parser.add_argument("--from-usda", type=Path, required=True, help="directory with food.csv and food_nutrient.csv")
+    parser.add_argument("--output", type=Path, required=True)
+    parser.add_argument("--data-types", nargs="+", default=list(USDA_DATA_TYPES))
+    args = parser.parse_args()
+    print(f"Wrote {convert_usda(args.from_usda, args.output, tuple(args.data_types))} foods to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
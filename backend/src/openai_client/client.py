@@ -1,72 +1,356 @@
-from openai import OpenAI
+import asyncio
+import os
+import time
+import aiofiles
+import openai
 from ..config import settings
 from ..response_processor import ResponseProcessor
 from fastapi import HTTPException
 from ..logger import setup_logger
+from ..metrics import OPENAI_ERRORS, OPENAI_STAGE_LATENCY
+from .http import create_async_openai, create_openai
+from .janitor import openai_janitor
 
 logger = setup_logger(__name__)
 
+# Run statuses that can still change; every other status is final
+RUN_PENDING_STATUSES = {"queued", "in_progress", "cancelling"}
+# First poll at this fraction of the typical run duration
+RUN_ESTIMATE_FRACTION = 0.9
+
+
+def retry_after_header(e: openai.APIStatusError) -> dict | None:
+    """
+    Pass the upstream Retry-After on to our caller and the limiter.
+    """
+    value = e.response.headers.get("retry-after")
+    return {"Retry-After": value} if value else None
+
+
+def to_http_exception(e: Exception) -> HTTPException:
+    """
+    Map an error raised while processing an image to the HTTPException
+    returned to the caller, keeping upstream rate limits and outages
+    distinguishable from permanent failures.
+    """
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, openai.RateLimitError):
+        return HTTPException(status_code=429, detail="OpenAI rate limit exceeded", headers=retry_after_header(e))
+    if isinstance(e, openai.APITimeoutError):
+        return HTTPException(status_code=504, detail="OpenAI request timed out")
+    if isinstance(e, openai.APIConnectionError):
+        return HTTPException(status_code=503, detail="OpenAI is unreachable")
+    if isinstance(e, openai.InternalServerError):
+        return HTTPException(status_code=502, detail="OpenAI returned a server error", headers=retry_after_header(e))
+    return HTTPException(status_code=500, detail="Internal server error")
+
+
+def analysis_deadline() -> float:
+    return time.monotonic() + settings.OPENAI_ANALYSIS_DEADLINE_SECONDS
+
+
+def time_left(deadline: float, stage_timeout: float | None = None) -> float:
+    """
+    Timeout for the next API call: what is left of the analysis deadline,
+    capped at the stage's own timeout. Raises 504 once the deadline passed.
+    """
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise HTTPException(status_code=504, detail="OpenAI analysis timed out")
+    return left if stage_timeout is None else min(left, stage_timeout)
+
+
+class RunDurationEstimate:
+    """
+    Moving average of how long completed runs took, so polling can skip
+    the part of a run that is almost certainly still in progress.
+    """
+
+    def __init__(self, weight: float = 0.2):
+        self.weight = weight
+        self.seconds: float | None = None
+
+    def update(self, seconds: float) -> None:
+        self.seconds = seconds if self.seconds is None else self.seconds + self.weight * (seconds - self.seconds)
+
+    def poll_intervals(self):
+        """
+        Run poll intervals: the first one waits until shortly before a
+        typical run finishes, the following ones start short so the end is
+        noticed quickly and grow geometrically up to the cap.
+        """
+        interval = settings.OPENAI_POLL_INITIAL_SECONDS
+        if self.seconds is not None:
+            yield max(interval, self.seconds * RUN_ESTIMATE_FRACTION)
+        while True:
+            yield interval
+            interval = min(interval * settings.OPENAI_POLL_BACKOFF, settings.OPENAI_POLL_MAX_SECONDS)
+
+
+def run_failure(run) -> HTTPException:
+    last_error = getattr(run, "last_error", None)
+    if last_error is not None and last_error.code == "rate_limit_exceeded":
+        return HTTPException(status_code=429, detail="OpenAI rate limit exceeded")
+    return HTTPException(status_code=500, detail="Processing failed with no additional info")
+
 
 class OpenAIClient:
+    # thread, upload, message, run and message list, not counting run polls
+    API_CALLS_PER_ANALYSIS = 5
+
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = create_openai()
+        self.run_duration = RunDurationEstimate()
+
+    def close(self):
+        self.client.close()
 
-    def create_thread(self):
-        return self.client.beta.threads.create()
+    def create_thread(self, timeout=None):
+        return self.client.beta.threads.create(timeout=timeout)
 
-    def create_message(self, thread_id, file_id):
+    def create_message(self, thread_id, file_id, timeout=None):
         return self.client.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=[
                 {"type": "text", "text": "Get me the info."},
-                {"type": "image_file", "image_file": {"file_id": file_id, "detail": "high"}}
-            ]
+                {"type": "image_file", "image_file": {"file_id": file_id, "detail": settings.OPENAI_IMAGE_DETAIL}}
+            ],
+            timeout=timeout
         )
 
-    def create_and_poll_run(self, thread_id, assistant_id):
-        return self.client.beta.threads.runs.create_and_poll(
+    def create_run(self, thread_id, assistant_id, timeout=None):
+        return self.client.beta.threads.runs.create(
             thread_id=thread_id,
-            assistant_id=assistant_id
+            assistant_id=assistant_id,
+            timeout=timeout
         )
 
-    def list_messages(self, thread_id):
-        return self.client.beta.threads.messages.list(thread_id=thread_id)
+    def cancel_run(self, thread_id, run_id):
+        """
+        Best effort: stop a run we no longer wait for, so it does not keep
+        consuming tokens.
+        """
+        try:
+            self.client.beta.threads.runs.cancel(run_id, thread_id=thread_id,
+                                                 timeout=settings.OPENAI_CALL_TIMEOUT_SECONDS)
+            logger.warning("Cancelled run %s", run_id)
+        except Exception as e:
+            logger.error("Failed to cancel run %s: %s", run_id, e)
+
+    def wait_for_run(self, thread_id, run, deadline):
+        """
+        Poll the run until it reaches a final status; cancel it and raise 504
+        if it is still pending at the deadline.
+        """
+        try:
+            started = time.monotonic()
+            for interval in self.run_duration.poll_intervals():
+                if run.status not in RUN_PENDING_STATUSES:
+                    if run.status == "completed":
+                        self.run_duration.update(time.monotonic() - started)
+                    return run
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise HTTPException(status_code=504, detail="OpenAI analysis timed out")
+                time.sleep(min(interval, left))
+                run = self.client.beta.threads.runs.retrieve(
+                    run.id, thread_id=thread_id, timeout=time_left(deadline, settings.OPENAI_CALL_TIMEOUT_SECONDS))
+        except HTTPException:
+            self.cancel_run(thread_id, run.id)
+            raise
+
+    def list_messages(self, thread_id, timeout=None):
+        return self.client.beta.threads.messages.list(thread_id=thread_id, timeout=timeout)
 
-    def upload_file(self, file_path):
-        with open(file_path, "rb") as file:
-            response = self.client.files.create(
-                file=file,
-                purpose="vision"
-            )
-            return response.id
+    def upload_file(self, file, timeout=None):
+        """
+        Upload an image given as a path or as a (filename, file object,
+        content type) tuple; file objects are streamed, not read into memory.
+        """
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "rb") as f:
+                return self.client.files.create(file=f, purpose="vision", timeout=timeout).id
+        response = self.client.files.create(
+            file=file,
+            purpose="vision",
+            timeout=timeout
+        )
+        return response.id
 
-    def process_image(self, file_path):
+    def process_image(self, file, deadline: float | None = None):
+        """
+        Analyze one image. Every API call is bounded by its stage timeout
+        and by the analysis deadline (OPENAI_ANALYSIS_DEADLINE_SECONDS from
+        now unless given).
+        """
+        deadline = deadline or analysis_deadline()
+        thread = file_id = None
         try:
-            thread = self.create_thread()
-            logger.debug(f"Created thread with thread_id: {thread.id}")
+            with OPENAI_STAGE_LATENCY.labels("thread_create").time():
+                thread = self.create_thread(time_left(deadline, settings.OPENAI_CALL_TIMEOUT_SECONDS))
+            logger.debug("Created thread with thread_id: %s", thread.id)
 
-            file_id = self.upload_file(file_path)
-            logger.debug(f"Uploaded file with file_id: {file_id}")
+            with OPENAI_STAGE_LATENCY.labels("upload").time():
+                file_id = self.upload_file(file, time_left(deadline, settings.OPENAI_UPLOAD_TIMEOUT_SECONDS))
+            logger.debug("Uploaded file with file_id: %s", file_id)
 
-            self.create_message(thread.id, file_id)
+            with OPENAI_STAGE_LATENCY.labels("message_create").time():
+                self.create_message(thread.id, file_id, time_left(deadline, settings.OPENAI_CALL_TIMEOUT_SECONDS))
 
-            run = self.create_and_poll_run(thread.id, settings.ASSISTANT_ID)
-            logger.debug(f"Created and polled run with run_id: {run.id}")
+            with OPENAI_STAGE_LATENCY.labels("run_poll").time():
+                run = self.create_run(thread.id, settings.ASSISTANT_ID,
+                                      time_left(deadline, settings.OPENAI_CALL_TIMEOUT_SECONDS))
+                run = self.wait_for_run(thread.id, run, deadline)
+            logger.debug("Created and polled run with run_id: %s", run.id)
 
             if run.status == "completed":
-                messages = self.list_messages(thread.id)
+                with OPENAI_STAGE_LATENCY.labels("list_messages").time():
+                    messages = self.list_messages(thread.id, time_left(deadline, settings.OPENAI_CALL_TIMEOUT_SECONDS))
                 content = messages.data[0].content[0].text.value
-                logger.debug(f"Content: {content}")
+                logger.debug("Content: %s", content)
 
                 # Process the response
-                food_info = ResponseProcessor.process_response(content)
+                with OPENAI_STAGE_LATENCY.labels("parse").time():
+                    food_info = ResponseProcessor.process_response(content, settings.NUTRITION_CORRECTION_ENABLED)
+                return food_info
+            else:
+                logger.error("Processing failed with run status: %s", run.status)
+                raise run_failure(run)
+        except Exception as e:
+            logger.error("Error processing image: %s", e)
+            OPENAI_ERRORS.labels(type(e).__name__).inc()
+            raise to_http_exception(e)
+        finally:
+            # Deleting here would block the response on two more API calls; the sweep deletes them
+            openai_janitor.record_sync(file_id, thread.id if thread else None)
+
+
+class AsyncOpenAIClient:
+    """
+    Non-blocking counterpart of OpenAIClient built on AsyncOpenAI.
+
+    Every API call, including run polling, awaits on the event loop, so a
+    single worker can keep many analyses in flight at once.
+    """
+
+    API_CALLS_PER_ANALYSIS = OpenAIClient.API_CALLS_PER_ANALYSIS
+
+    def __init__(self):
+        self.client = create_async_openai()
+        self.run_duration = RunDurationEstimate()
+
+    async def close(self):
+        await openai_janitor.flush()
+        await self.client.close()
+
+    async def create_thread(self, timeout=None):
+        return await self.client.beta.threads.create(timeout=timeout)
+
+    async def create_message(self, thread_id, file_id, timeout=None):
+        return await self.client.beta.threads.messages.create(
+            thread_id=thread_id,
+            role="user",
+            content=[
+                {"type": "text", "text": "Get me the info."},
+                {"type": "image_file", "image_file": {"file_id": file_id, "detail": settings.OPENAI_IMAGE_DETAIL}}
+            ],
+            timeout=timeout
+        )
+
+    async def create_run(self, thread_id, assistant_id, timeout=None):
+        return await self.client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            timeout=timeout
+        )
+
+    async def cancel_run(self, thread_id, run_id):
+        try:
+            await self.client.beta.threads.runs.cancel(run_id, thread_id=thread_id,
+                                                       timeout=settings.OPENAI_CALL_TIMEOUT_SECONDS)
+            logger.warning("Cancelled run %s", run_id)
+        except Exception as e:
+            logger.error("Failed to cancel run %s: %s", run_id, e)
+
+    async def wait_for_run(self, thread_id, run, deadline):
+        """
+        Poll the run until it reaches a final status. The run is cancelled
+        when the deadline passes (504) or the caller goes away.
+        """
+        try:
+            started = time.monotonic()
+            for interval in self.run_duration.poll_intervals():
+                if run.status not in RUN_PENDING_STATUSES:
+                    if run.status == "completed":
+                        self.run_duration.update(time.monotonic() - started)
+                    return run
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise HTTPException(status_code=504, detail="OpenAI analysis timed out")
+                await asyncio.sleep(min(interval, left))
+                run = await self.client.beta.threads.runs.retrieve(
+                    run.id, thread_id=thread_id, timeout=time_left(deadline, settings.OPENAI_CALL_TIMEOUT_SECONDS))
+        except (HTTPException, asyncio.CancelledError):
+            await self.cancel_run(thread_id, run.id)
+            raise
+
+    async def list_messages(self, thread_id, timeout=None):
+        return await self.client.beta.threads.messages.list(thread_id=thread_id, timeout=timeout)
+
+    async def upload_file(self, file, timeout=None):
+        if isinstance(file, (str, os.PathLike)):
+            async with aiofiles.open(file, "rb") as f:
+                file = (os.path.basename(file), await f.read())
+        response = await self.client.files.create(
+            file=file,
+            purpose="vision",
+            timeout=timeout
+        )
+        return response.id
+
+    async def process_image(self, file, deadline: float | None = None):
+        deadline = deadline or analysis_deadline()
+        thread = file_id = None
+        try:
+            with OPENAI_STAGE_LATENCY.labels("thread_create").time():
+                thread = await self.create_thread(time_left(deadline, settings.OPENAI_CALL_TIMEOUT_SECONDS))
+            logger.debug("Created thread with thread_id: %s", thread.id)
+
+            with OPENAI_STAGE_LATENCY.labels("upload").time():
+                file_id = await self.upload_file(file, time_left(deadline, settings.OPENAI_UPLOAD_TIMEOUT_SECONDS))
+            logger.debug("Uploaded file with file_id: %s", file_id)
+
+            with OPENAI_STAGE_LATENCY.labels("message_create").time():
+                await self.create_message(thread.id, file_id,
+                                          time_left(deadline, settings.OPENAI_CALL_TIMEOUT_SECONDS))
+
+            with OPENAI_STAGE_LATENCY.labels("run_poll").time():
+                run = await self.create_run(thread.id, settings.ASSISTANT_ID,
+                                            time_left(deadline, settings.OPENAI_CALL_TIMEOUT_SECONDS))
+                run = await self.wait_for_run(thread.id, run, deadline)
+            logger.debug("Created and polled run with run_id: %s", run.id)
+
+            if run.status == "completed":
+                with OPENAI_STAGE_LATENCY.labels("list_messages").time():
+                    messages = await self.list_messages(thread.id,
+                                                        time_left(deadline, settings.OPENAI_CALL_TIMEOUT_SECONDS))
+                content = messages.data[0].content[0].text.value
+                logger.debug("Content: %s", content)
+
+                # Process the response; correction looks foods up in the
+                # reference index, off the event loop
+                with OPENAI_STAGE_LATENCY.labels("parse").time():
+                    food_info = await asyncio.to_thread(ResponseProcessor.process_response, content,
+                                                        settings.NUTRITION_CORRECTION_ENABLED)
                 return food_info
             else:
-                logger.error("Processing failed")
-                raise HTTPException(
-                    status_code=500, detail="Processing failed with no additional info"
-                )
+                logger.error("Processing failed with run status: %s", run.status)
+                raise run_failure(run)
         except Exception as e:
-            logger.error(f"Error processing image: {e}")
-            raise HTTPException(status_code=500, detail="Internal server error")
+            logger.error("Error processing image: %s", e)
+            OPENAI_ERRORS.labels(type(e).__name__).inc()
+            raise to_http_exception(e)
+        finally:
+            openai_janitor.discard(self.client, file_id, thread.id if thread else None)
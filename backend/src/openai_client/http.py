@@ -0,0 +1,51 @@
+import importlib.util
+import httpx
+from openai import AsyncOpenAI, OpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, Timeout
+from ..config import settings
+from ..metrics import count_retry, count_retry_async
+
+
+def http2_enabled() -> bool:
+    """
+    HTTP/2 multiplexes concurrent calls over a single connection; it needs
+    the optional h2 package (httpx[http2]).
+    """
+    return settings.OPENAI_HTTP2 and importlib.util.find_spec("h2") is not None
+
+
+def http_options() -> dict:
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT),
+        "http2": http2_enabled(),
+    }
+
+
+def create_async_openai() -> AsyncOpenAI:
+    """
+    AsyncOpenAI client with an explicitly sized keep-alive connection pool.
+    Retried requests are counted in the openai_retries_total metric.
+    """
+    return AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        http_client=DefaultAsyncHttpxClient(**http_options(), event_hooks={"request": [count_retry_async]}),
+    )
+
+
+def create_openai() -> OpenAI:
+    """
+    Blocking OpenAI client with the same pool settings; safe to share
+    between threads.
+    """
+    return OpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        http_client=DefaultHttpxClient(**http_options(), event_hooks={"request": [count_retry]}),
+    )
@@ -0,0 +1,267 @@
+"""
+Cleanup of the files and threads image analyses leave on OpenAI.
+
+Each async analysis deletes its own upload and thread in the background as
+soon as it is done (`discard`), up to OPENAI_CLEANUP_INLINE_MAX_PENDING at
+a time. Analyses by the blocking client, and all analyses with
+OPENAI_CLEANUP_INLINE off, only record their resources (`record_sync`,
+`discard`). Whatever is recorded or left over is removed by `sweep`, run
+periodically by the app and available on the command line:
+
+    python -m src.openai_client.janitor [--retention-seconds N] [--dry-run]
+
+Uploaded files are listed oldest first and deleted once older than
+OPENAI_RETENTION_SECONDS. Threads cannot be listed through the API, so
+threads (and files) whose inline deletion failed are recorded in the
+openai_resources table and retried from there.
+"""
+import argparse
+import asyncio
+import time
+from openai import AsyncOpenAI, NotFoundError
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from ..config import settings
+from ..database import AsyncSessionLocal, SessionLocal
+from ..logger import setup_logger
+from ..models import OpenAIResource
+from .http import create_async_openai
+from .limits import TokenBucket
+
+logger = setup_logger(__name__)
+
+# Purpose of the images uploaded for analysis; other files (e.g. the
+# assistant's own) are never touched.
+UPLOAD_PURPOSE = "vision"
+LIST_PAGE_SIZE = 100
+
+
+def _resources(file_id: str | None, thread_id: str | None) -> list[tuple[str, str]]:
+    return [(kind, resource_id) for kind, resource_id in (("thread", thread_id), ("file", file_id)) if resource_id]
+
+
+def _record_statement(dialect_name: str, resources: list[tuple[str, str]]):
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    return (dialect.insert(OpenAIResource)
+            .values([{"kind": kind, "id": resource_id} for kind, resource_id in resources])
+            .on_conflict_do_nothing(index_elements=["id"]))
+
+
+class OpenAIJanitor:
+    def __init__(self, session_factory: async_sessionmaker = AsyncSessionLocal,
+                 retention: float = settings.OPENAI_RETENTION_SECONDS,
+                 concurrency: int = settings.OPENAI_JANITOR_CONCURRENCY,
+                 requests_per_minute: int = settings.OPENAI_JANITOR_REQUESTS_PER_MINUTE,
+                 interval: float = settings.OPENAI_JANITOR_INTERVAL_SECONDS,
+                 inline_max_pending: int = settings.OPENAI_CLEANUP_INLINE_MAX_PENDING,
+                 sync_session_factory: sessionmaker = SessionLocal):
+        self.session_factory = session_factory
+        self.sync_session_factory = sync_session_factory
+        self.retention = retention
+        self.concurrency = concurrency
+        # Sweep budget; inline deletions are bounded by inline_max_pending instead
+        self.requests = TokenBucket(requests_per_minute)
+        self.interval = interval
+        self.inline_max_pending = inline_max_pending
+        self._pending: set[asyncio.Task] = set()
+        self._deleting = 0
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._sweep_periodically())
+
+    async def stop(self) -> None:
+        """
+        Stop sweeping and wait for inline deletions still in flight.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Wait for the inline deletions scheduled so far, e.g. before closing
+        the client they use.
+        """
+        await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def discard(self, client: AsyncOpenAI, file_id: str | None = None, thread_id: str | None = None) -> None:
+        """
+        Delete an analysis' file and thread in the background, without
+        delaying the response. Failures, everything discarded while
+        `inline_max_pending` deletions are in flight, and everything when
+        OPENAI_CLEANUP_INLINE is off are recorded for the next sweep.
+        """
+        resources = _resources(file_id, thread_id)
+        if not resources:
+            return
+        if settings.OPENAI_CLEANUP_INLINE and self._deleting < self.inline_max_pending:
+            self._deleting += 1
+            task = asyncio.create_task(self._discard(client, resources))
+            task.add_done_callback(self._discarded)
+        else:
+            task = asyncio.create_task(self._record(resources))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def _discarded(self, task: asyncio.Task) -> None:
+        self._deleting -= 1
+
+    async def _discard(self, client: AsyncOpenAI, resources: list[tuple[str, str]]) -> None:
+        results = await asyncio.gather(*(self._delete(client, kind, resource_id, rate_limited=False)
+                                         for kind, resource_id in resources))
+        failed = [resource for resource, deleted in zip(resources, results) if not deleted]
+        if failed:
+            await self._record(failed)
+
+    async def _delete(self, client: AsyncOpenAI, kind: str, resource_id: str, rate_limited: bool = True) -> bool:
+        """
+        Delete one file or thread; True when it is gone.
+        """
+        if rate_limited:
+            await self.requests.acquire()
+        try:
+            if kind == "file":
+                await client.files.delete(resource_id, timeout=settings.OPENAI_CALL_TIMEOUT_SECONDS)
+            else:
+                await client.beta.threads.delete(resource_id, timeout=settings.OPENAI_CALL_TIMEOUT_SECONDS)
+            return True
+        except NotFoundError:
+            return True
+        except Exception as e:
+            logger.warning("Failed to delete OpenAI %s %s: %s", kind, resource_id, e)
+            return False
+
+    async def _record(self, resources: list[tuple[str, str]]) -> None:
+        try:
+            async with self.session_factory() as db:
+                await db.execute(_record_statement(db.bind.dialect.name, resources))
+                await db.commit()
+        except Exception as e:
+            logger.error("Failed to record OpenAI resources for cleanup: %s", e)
+
+    def record_sync(self, file_id: str | None = None, thread_id: str | None = None) -> None:
+        """
+        Record an analysis' file and thread for the sweep from a worker
+        thread (the blocking client), with one local insert instead of two
+        API calls before the response.
+        """
+        resources = _resources(file_id, thread_id)
+        if not resources:
+            return
+        try:
+            with self.sync_session_factory() as db:
+                db.execute(_record_statement(db.bind.dialect.name, resources))
+                db.commit()
+        except Exception as e:
+            logger.error("Failed to record OpenAI resources for cleanup: %s", e)
+
+    async def _delete_all(self, client: AsyncOpenAI, resources, on_deleted=None) -> tuple[int, int]:
+        """
+        Delete (kind, id) pairs from the async iterable `resources` with
+        `concurrency` workers. Returns (deleted, failed).
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        counts = {True: 0, False: 0}
+
+        async def worker() -> None:
+            while (resource := await queue.get()) is not None:
+                deleted = await self._delete(client, *resource)
+                counts[deleted] += 1
+                if deleted and on_deleted is not None:
+                    # A dead worker would leave the producer blocked on a full queue
+                    try:
+                        await on_deleted(resource)
+                    except Exception as e:
+                        logger.error("Failed to finish cleanup of OpenAI %s %s: %s", *resource, e)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            async for resource in resources:
+                await queue.put(resource)
+        finally:
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        return counts[True], counts[False]
+
+    async def _expired_files(self, client: AsyncOpenAI, cutoff: float):
+        # Oldest first: the listing stops at the first file young enough to keep
+        async for file in client.files.list(purpose=UPLOAD_PURPOSE, order="asc", limit=LIST_PAGE_SIZE,
+                                                   timeout=settings.OPENAI_CALL_TIMEOUT_SECONDS):
+            if file.created_at >= cutoff:
+                return
+            yield "file", file.id
+
+    async def _recorded(self):
+        async with self.session_factory() as db:
+            rows = (await db.execute(select(OpenAIResource.kind, OpenAIResource.id)
+                                     .order_by(OpenAIResource.date_created))).all()
+        for kind, resource_id in rows:
+            yield kind, resource_id
+
+    async def _forget(self, resource: tuple[str, str]) -> None:
+        async with self.session_factory() as db:
+            await db.execute(delete(OpenAIResource).where(OpenAIResource.id == resource[1]))
+            await db.commit()
+
+    async def sweep(self, client: AsyncOpenAI, dry_run: bool = False) -> dict:
+        """
+        Delete uploads past the retention age and every recorded leftover.
+        Returns counts per category.
+        """
+        cutoff = time.time() - self.retention
+        if dry_run:
+            files = [resource async for resource in self._expired_files(client, cutoff)]
+            recorded = [resource async for resource in self._recorded()]
+            return {"expired_files": len(files), "recorded": len(recorded)}
+
+        (files_deleted, files_failed), (recorded_deleted, recorded_failed) = await asyncio.gather(
+            self._delete_all(client, self._expired_files(client, cutoff)),
+            self._delete_all(client, self._recorded(), on_deleted=self._forget),
+        )
+        result = {"files_deleted": files_deleted, "files_failed": files_failed,
+                  "recorded_deleted": recorded_deleted, "recorded_failed": recorded_failed}
+        logger.info("OpenAI cleanup: %s", result)
+        return result
+
+    async def _sweep_periodically(self) -> None:
+        client = create_async_openai()
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                try:
+                    await self.sweep(client)
+                except Exception as e:
+                    logger.error("OpenAI cleanup failed: %s", e)
+        finally:
+            await client.close()
+
+
+openai_janitor = OpenAIJanitor()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Delete leftover OpenAI files and threads of image analyses.")
+    parser.add_argument("--retention-seconds", type=float, default=settings.OPENAI_RETENTION_SECONDS,
+                        help="delete uploads older than this")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be deleted")
+    args = parser.parse_args()
+
+    async def run() -> dict:
+        client = create_async_openai()
+        try:
+            return await OpenAIJanitor(retention=args.retention_seconds).sweep(client, dry_run=args.dry_run)
+        finally:
+            await client.close()
+
+    print(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Process-wide admission control for OpenAI calls.
+
+Every image analysis goes through `openai_guard`, which combines:
+
+- a circuit breaker that fails fast while the upstream is unhealthy,
+- token buckets for the account's requests and tokens per minute,
+- an AIMD concurrency cap that halves on overload and grows back slowly,
+- a shared pause honouring Retry-After, and jittered whole-analysis retries.
+"""
+import asyncio
+import math
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, TypeVar
+from fastapi import HTTPException
+from ..config import settings
+from ..logger import setup_logger
+from ..metrics import OPENAI_CIRCUIT_OPEN, OPENAI_CONCURRENCY_LIMIT, OPENAI_IN_FLIGHT, OPENAI_REJECTED
+
+logger = setup_logger(__name__)
+
+T = TypeVar("T")
+
+# Status codes worth retrying: the failure was upstream and may clear up.
+TRANSIENT_STATUS_CODES = {429, 502, 503, 504}
+# The upstream is saturated: shrink the concurrency cap
+OVERLOAD_STATUS_CODES = {429, 503, 504}
+# The upstream is failing (rate limits are not failures): count towards opening the circuit
+BREAKER_STATUS_CODES = {502, 503, 504}
+
+
+def retry_after_seconds(headers: dict | None) -> float | None:
+    """
+    Parse a Retry-After header given in seconds or as an HTTP date.
+    """
+    value = (headers or {}).get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute` / 60 per second up to one minute's worth.
+    Callers wait, in arrival order, until their amount is available.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock: asyncio.Lock | None = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        # asyncio primitives are bound to the loop that first uses them; the
+        # guard is process-wide, so each new loop (asyncio.run in CLIs and
+        # tests) gets its own
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._lock = loop, asyncio.Lock()
+        return self._lock
+
+    async def acquire(self, amount: float = 1) -> None:
+        if self.rate <= 0:
+            return
+        amount = min(amount, self.capacity)
+        async with self._get_lock():
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """
+    Additive-increase / multiplicative-decrease cap on calls in flight.
+    Each success adds 1/limit (about +1 per limit's worth of calls); an
+    overload multiplies the limit by `decrease_factor`, once per incident:
+    calls started before the last decrease do not shrink it again.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, decrease_factor: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self._decreased_at = 0.0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._condition: asyncio.Condition | None = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # One condition per event loop, as for TokenBucket
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._condition = loop, asyncio.Condition()
+        return self._condition
+
+    async def acquire(self, timeout: float) -> float:
+        """
+        Wait for a free slot; returns the start time to pass to release().
+        """
+        condition = self._get_condition()
+        async with condition:
+            try:
+                await asyncio.wait_for(condition.wait_for(lambda: self.in_flight < int(self.limit)), timeout)
+            except asyncio.TimeoutError:
+                OPENAI_REJECTED.labels("queue_timeout").inc()
+                raise HTTPException(status_code=503, detail="Too many image analyses in progress",
+                                    headers={"Retry-After": str(math.ceil(timeout))})
+            self.in_flight += 1
+            return time.monotonic()
+
+    async def release(self, started: float, overloaded: bool | None) -> None:
+        """
+        Free the slot and adapt the limit: `overloaded` True shrinks it,
+        False grows it, None (an outcome saying nothing about load) keeps it.
+        """
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            if overloaded and started >= self._decreased_at:
+                self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                self._decreased_at = time.monotonic()
+                logger.warning("OpenAI overloaded, concurrency limit lowered to %s", int(self.limit))
+            elif overloaded is False:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            condition.notify_all()
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    for `reset_timeout` seconds. Then a single trial call is let through
+    (half-open): its success closes the circuit, a failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def before_call(self) -> bool:
+        """
+        Admit a call or raise a 503; returns True if the call is the
+        half-open trial, which the caller must end with end_trial().
+        """
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        retry_after = max(1, math.ceil(self.opened_at + self.reset_timeout - time.monotonic()))
+        OPENAI_REJECTED.labels("circuit_open").inc()
+        raise HTTPException(status_code=503, detail="OpenAI is unavailable, try again later",
+                            headers={"Retry-After": str(retry_after)})
+
+    def end_trial(self) -> None:
+        """
+        Let another trial through if this one ended without an outcome
+        (cancelled, or an unexpected error); a no-op after record_*().
+        """
+        self._trial_running = False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("OpenAI circuit closed")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_running = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.error("OpenAI circuit opened after %s consecutive failures", self.failures)
+            self.opened_at = time.monotonic()
+
+
+class OpenAIGuard:
+    """
+    Runs analyses under the breaker, the quotas and the concurrency cap,
+    retrying transient failures with full-jitter backoff. A Retry-After
+    from upstream pauses all analyses in the process, not just the one
+    that received it.
+    """
+
+    def __init__(self, limiter: AdaptiveLimiter, breaker: CircuitBreaker, requests: TokenBucket,
+                 tokens: TokenBucket, retries: int = settings.OPENAI_ANALYSIS_RETRIES,
+                 backoff: float = settings.OPENAI_RETRY_BACKOFF_SECONDS,
+                 backoff_max: float = settings.OPENAI_RETRY_BACKOFF_MAX_SECONDS,
+                 retry_after_max: float = settings.OPENAI_RETRY_AFTER_MAX_SECONDS,
+                 queue_timeout: float = settings.OPENAI_QUEUE_TIMEOUT_SECONDS):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.requests = requests
+        self.tokens = tokens
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+        self.queue_timeout = queue_timeout
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def call(self, analyze: Callable[[], Awaitable[T]], requests: int = 1,
+                   tokens: int = settings.OPENAI_TOKENS_PER_ANALYSIS, deadline: float | None = None) -> T:
+        """
+        Run `analyze` (called again for every retry), which makes `requests`
+        API calls using about `tokens` tokens, and return its result. No
+        retry is started that would begin after the monotonic `deadline`.
+        """
+        for attempt in range(self.retries + 1):
+            paused = self.paused_until - time.monotonic()
+            if paused > 0:
+                await asyncio.sleep(paused)
+            # Admission first, so a half-open trial is not held while queueing
+            await self.requests.acquire(requests)
+            await self.tokens.acquire(tokens)
+            started = await self.limiter.acquire(self.queue_timeout)
+            try:
+                trial = self.breaker.before_call()
+            except HTTPException:
+                await self.limiter.release(started, None)
+                raise
+            overloaded = None
+            try:
+                result = await analyze()
+                overloaded = False
+                self.breaker.record_success()
+                return result
+            except HTTPException as e:
+                status_code = e.status_code
+                overloaded = True if status_code in OVERLOAD_STATUS_CODES else None
+                if status_code in BREAKER_STATUS_CODES:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                retry_after = retry_after_seconds(e.headers)
+                if retry_after is not None:
+                    self.pause(min(retry_after, self.retry_after_max))
+                if (status_code not in TRANSIENT_STATUS_CODES or attempt == self.retries
+                        or self.breaker.state != "closed"
+                        or (retry_after is not None and retry_after > self.retry_after_max)):
+                    raise
+                delay = retry_after if retry_after is not None else random.uniform(
+                    0, min(self.backoff_max, self.backoff * 2 ** attempt))
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+            finally:
+                if trial:
+                    self.breaker.end_trial()
+                await self.limiter.release(started, overloaded)
+            logger.warning("OpenAI analysis failed (%s), retry %s/%s in %.1fs",
+                           status_code, attempt + 1, self.retries, delay)
+            await asyncio.sleep(delay)
+
+
+def create_openai_guard() -> OpenAIGuard:
+    guard = OpenAIGuard(
+        AdaptiveLimiter(settings.OPENAI_CONCURRENCY_INITIAL, settings.OPENAI_CONCURRENCY_MIN,
+                        settings.OPENAI_CONCURRENCY_MAX),
+        CircuitBreaker(settings.OPENAI_BREAKER_FAILURES, settings.OPENAI_BREAKER_RESET_SECONDS),
+        TokenBucket(settings.OPENAI_REQUESTS_PER_MINUTE),
+        TokenBucket(settings.OPENAI_TOKENS_PER_MINUTE),
+    )
+    OPENAI_CONCURRENCY_LIMIT.set_function(lambda: int(guard.limiter.limit))
+    OPENAI_IN_FLIGHT.set_function(lambda: guard.limiter.in_flight)
+    OPENAI_CIRCUIT_OPEN.set_function(lambda: guard.breaker.state != "closed")
+    return guard
+
+
+openai_guard = create_openai_guard()
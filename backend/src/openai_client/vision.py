@@ -0,0 +1,106 @@
+import asyncio
+import base64
+import os
+import aiofiles
+from fastapi import HTTPException
+from ..config import settings
+from ..response_processor import ResponseProcessor
+from ..schemas import FoodInfo
+from ..logger import setup_logger
+from ..metrics import OPENAI_ERRORS, OPENAI_STAGE_LATENCY
+from .client import analysis_deadline, time_left, to_http_exception
+from .http import create_async_openai
+
+logger = setup_logger(__name__)
+
+VISION_PROMPT = (
+    "You are a nutritionist. Identify the food in the image and estimate the nutrition "
+    "of the portion shown. Reply with the food name, your certainty between 0 and 1, "
+    "calories in kcal, and fat, protein and sugar in grams."
+)
+
+# Structured output schema matching FoodInfo; strict mode needs every field
+# required and no additional properties.
+FOOD_INFO_SCHEMA = {
+    "type": "object",
+    "properties": {
+        name: {"type": "string" if field.annotation is str else "number"}
+        for name, field in FoodInfo.model_fields.items()
+    },
+    "required": list(FoodInfo.model_fields),
+    "additionalProperties": False,
+}
+
+
+class AsyncVisionClient:
+    """
+    Single-call analysis backend: the image is sent inline (base64) in one
+    chat completion with a JSON-schema response format, instead of the
+    thread / upload / message / run / list round-trips of the Assistants
+    API. Nothing is left behind on the OpenAI side.
+    """
+
+    API_CALLS_PER_ANALYSIS = 1
+
+    def __init__(self):
+        self.client = create_async_openai()
+
+    async def close(self):
+        await self.client.close()
+
+    @staticmethod
+    async def image_data_url(file) -> str:
+        """
+        Data URL for an image given as a path or as a (filename, bytes or
+        file object, content type) tuple.
+        """
+        if isinstance(file, (str, os.PathLike)):
+            async with aiofiles.open(file, "rb") as f:
+                content = await f.read()
+            content_type = "image/jpeg"
+        else:
+            # Reading a spooled upload and encoding megabytes of image both block, so off the loop
+            content = file[1] if isinstance(file[1], bytes) else await asyncio.to_thread(file[1].read)
+            content_type = file[2] if len(file) > 2 else "image/jpeg"
+        encoded = await asyncio.to_thread(base64.b64encode, content)
+        return f"data:{content_type};base64,{encoded.decode('ascii')}"
+
+    async def create_completion(self, image_url: str, timeout=None):
+        return await self.client.chat.completions.create(
+            model=settings.OPENAI_VISION_MODEL,
+            messages=[
+                {"role": "system", "content": VISION_PROMPT},
+                {"role": "user", "content": [
+                    {"type": "text", "text": "Get me the info."},
+                    {"type": "image_url", "image_url": {"url": image_url, "detail": settings.OPENAI_IMAGE_DETAIL}},
+                ]},
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "food_info", "strict": True, "schema": FOOD_INFO_SCHEMA},
+            },
+            timeout=timeout,
+        )
+
+    async def process_image(self, file, deadline: float | None = None):
+        deadline = deadline or analysis_deadline()
+        try:
+            with OPENAI_STAGE_LATENCY.labels("encode").time():
+                image_url = await self.image_data_url(file)
+            with OPENAI_STAGE_LATENCY.labels("completion").time():
+                completion = await self.create_completion(image_url, time_left(deadline))
+            message = completion.choices[0].message
+            if getattr(message, "refusal", None):
+                logger.error("Model refused to analyze the image: %s", message.refusal)
+                raise HTTPException(status_code=422, detail=f"Image could not be analyzed: {message.refusal}")
+
+            content = message.content
+            logger.debug("Content: %s", content)
+            # Correction looks foods up in the reference index, off the event loop
+            with OPENAI_STAGE_LATENCY.labels("parse").time():
+                return await asyncio.to_thread(ResponseProcessor.process_response, content,
+                                               settings.NUTRITION_CORRECTION_ENABLED)
+        except Exception as e:
+            logger.error("Error processing image: %s", e)
+            OPENAI_ERRORS.labels(type(e).__name__).inc()
+            raise to_http_exception(e)
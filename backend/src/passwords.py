@@ -0,0 +1,50 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from passlib.hash import bcrypt
+from .config import settings
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# bcrypt releases the GIL while hashing, so a bounded thread pool spreads
+# logins over the cores and keeps the event loop free.
+_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS,
+                               thread_name_prefix="password-hash")
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.using(rounds=rounds).hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return bcrypt.verify(password.encode('utf-8'), hashed_password)
+
+
+def needs_rehash(hashed_password: str, rounds: int | None = None) -> bool:
+    """
+    True when the hash was made with a different cost than the configured one.
+    """
+    rounds = rounds or settings.PASSWORD_BCRYPT_ROUNDS
+    try:
+        return bcrypt.from_string(hashed_password).rounds != rounds
+    except ValueError:
+        return False
+
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _hash, password, settings.PASSWORD_BCRYPT_ROUNDS)
+
+
+async def verify_password(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """
+    Check `password` against `hashed_password` off the event loop.
+
+    Returns (valid, new_hash); new_hash is set when the password is valid but
+    the stored hash uses a different cost and should be replaced.
+    """
+    loop = asyncio.get_running_loop()
+    valid = await loop.run_in_executor(_executor, _verify, password, hashed_password)
+    if not valid or not needs_rehash(hashed_password):
+        return valid, None
+    return True, await hash_password(password)
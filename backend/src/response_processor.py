@@ -1,82 +1,112 @@
-import json
 import re
 from fastapi import HTTPException
+from pydantic import TypeAdapter, ValidationError
 from .schemas import FoodInfo
 from .logger import setup_logger
+from .nutrition_reference import nutrition_reference
 
 logger = setup_logger(__name__)
 
-class InvalidFormatException(Exception):
-    pass
+# Strings (matched whole, so brackets inside them are ignored) and brackets
+JSON_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\]]')
 
-class ResponseValidator:
-    @staticmethod
-    def validate_and_convert(json_data):
-        required_fields = {
-            "food_name": str,
-            "calories_Kcal": (int, float),
-            "certainty": (int, float),
-            "fat_in_g": (int, float),
-            "protein_in_g": (int, float),
-            "sugar_in_g": (int, float),
-        }
+FOOD_LIST = TypeAdapter(list[FoodInfo])
+
+
+def extract_json(content: str) -> str | None:
+    """
+    First balanced JSON object or list of objects in `content`, found in a
+    single pass that only stops at strings and brackets. None if there is
+    none or it is cut off.
+    """
+    start = content.find("{")
+    if start == -1:
+        return None
+    # A list of objects starts at the "[" before the first object. A bare "["
+    # is not enough, model replies often contain bracketed prose like "[INFO]".
+    before = content[:start].rstrip()
+    if before.endswith("["):
+        start = len(before) - 1
+    depth = 0
+    for token in JSON_TOKEN.finditer(content, start):
+        char = token.group()[0]
+        if char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return content[start:token.end()]
+    return None
 
-        # Validate required fields
-        for field, field_type in required_fields.items():
-            if field not in json_data:
-                raise InvalidFormatException(f"Field '{field}' is missing.")
-            if not isinstance(json_data[field], field_type):
-                try:
-                    if field_type == (int, float):
-                        json_data[field] = float(json_data[field])
-                except ValueError:
-                    raise InvalidFormatException(
-                        f"Field '{field}' is not of type {field_type}.")
 
-        return json_data
+def validation_message(error: ValidationError) -> str:
+    """
+    Describe the first validation error in the wording clients already
+    match on.
+    """
+    first = error.errors()[0]
+    if first["type"] in ("json_invalid", "json_type"):
+        return "Invalid JSON format."
+    field = next((part for part in first["loc"] if isinstance(part, str)), None)
+    if first["type"] == "missing":
+        return f"Field '{field}' is missing."
+    expected = "str" if field == "food_name" else "(int, float)"
+    return f"Field '{field}' is not of type {expected}."
+
 
 class ResponseProcessor:
     @staticmethod
-    def process_response(content: str) -> FoodInfo:
-        # Extract JSON content using regular expression
-        match = re.search(r'({.*?})', content, re.DOTALL)
-        if match:
-            clean_content = match.group(1).strip()
-        else:
-            logger.error(f"JSON decode error: Invalid JSON format. The response was: {content}")
+    def parse_foods(content: str) -> list[FoodInfo]:
+        """
+        Validate the JSON in a model reply straight into FoodInfo objects:
+        one for an object, one per element for a list of foods.
+        """
+        json_text = extract_json(content)
+        if json_text is None:
+            logger.error("JSON decode error: Invalid JSON format. The response was: %s", content)
             raise HTTPException(
                 status_code=422, detail=f"Invalid JSON format. The response was: {content}")
 
         try:
-            json_data = json.loads(clean_content)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error: {e}. The response was: {content}")
+            if json_text[0] == "[":
+                foods = FOOD_LIST.validate_json(json_text)
+            else:
+                foods = [FoodInfo.model_validate_json(json_text)]
+        except ValidationError as e:
+            message = validation_message(e)
+            logger.error("Validation error: %s The response was: %s", message, content)
             raise HTTPException(
-                status_code=422, detail=f"Invalid JSON format. The response was: {content}")
+                status_code=422, detail=f"{message} The response was: {content}")
 
-        try:
-            json_data = ResponseValidator.validate_and_convert(json_data)
-        except InvalidFormatException as e:
-            logger.error(f"Validation error: {e}")
+        if not foods:
             raise HTTPException(
-                status_code=422, detail=f"{str(e)}. The response was: {content}")
+                status_code=422, detail=f"Invalid JSON format. The response was: {content}")
+        return foods
 
-        try:
-            food_info = FoodInfo(
-                certainty=json_data["certainty"],
-                food_name=json_data["food_name"],
-                calories_Kcal=json_data["calories_Kcal"],
-                fat_in_g=json_data["fat_in_g"],
-                protein_in_g=json_data["protein_in_g"],
-                sugar_in_g=json_data["sugar_in_g"],
-            )
-        except KeyError as e:
-            logger.error(f"Key error: {e}")
-            raise HTTPException(
-                status_code=422, detail=f"Missing field: {str(e)}")
-        except ValueError as e:
-            logger.error(f"Value error: {e}")
-            raise HTTPException(
-                status_code=422, detail=f"Invalid value: {str(e)}")
+    @staticmethod
+    def combine(foods: list[FoodInfo]) -> FoodInfo:
+        """
+        One food log entry for a meal of several foods: nutrients are
+        summed and the certainty is that of the least certain food.
+        """
+        if len(foods) == 1:
+            return foods[0]
+        return FoodInfo(
+            certainty=min(food.certainty for food in foods),
+            food_name=", ".join(food.food_name for food in foods),
+            calories_Kcal=sum(food.calories_Kcal for food in foods),
+            fat_in_g=sum(food.fat_in_g for food in foods),
+            protein_in_g=sum(food.protein_in_g for food in foods),
+            sugar_in_g=sum(food.sugar_in_g for food in foods),
+        )
 
-        return food_info
+    @staticmethod
+    def process_response(content: str, correct: bool = False) -> FoodInfo:
+        """
+        The food (or meal) in a model reply. With `correct`, each food's
+        macronutrients are recomputed from the nutrition reference first.
+        """
+        foods = ResponseProcessor.parse_foods(content)
+        if correct:
+            foods = [nutrition_reference.correct(food) for food in foods]
+        return ResponseProcessor.combine(foods)
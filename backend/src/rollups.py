@@ -0,0 +1,131 @@
+"""
+Materialised per-user daily nutrition totals.
+
+The daily_nutrition_rollups table is updated incrementally in the same
+transaction as every food_info insert. A full recomputation is only needed
+for backfills or repairs:
+
+    python -m src.rollups [--owner-id ID] [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+"""
+import argparse
+import asyncio
+from datetime import date, datetime, time, timezone
+from sqlalchemy import Date, cast, delete, func, insert, literal_column, select, type_coerce
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import AsyncSessionLocal, db_now
+from .logger import setup_logger
+from .models import DailyNutritionRollup, FoodInfoDB
+
+logger = setup_logger(__name__)
+
+NUTRIENTS = ("calories_Kcal", "fat_in_g", "sugar_in_g", "protein_in_g")
+
+
+def period_start(column, period: str, dialect: str):
+    """
+    SQL expression truncating `column` to the start of its day or ISO week
+    (Monday). The period is rendered literally so that the expression in the
+    SELECT and GROUP BY clauses is identical.
+    """
+    if dialect == "postgresql":
+        return cast(func.date_trunc(literal_column(f"'{period}'"), column), Date)
+    if period == "week":
+        return func.date(column, literal_column("'-6 days'"), literal_column("'weekday 1'"))
+    return func.date(column)
+
+
+async def _database_today(db: AsyncSession) -> date:
+    """
+    Day of the database's current time, which rows inserted without a
+    timestamp get as their default. On PostgreSQL now() is fixed for the
+    transaction, so this is exactly the day stored with the rows.
+    """
+    return await db.scalar(select(type_coerce(period_start(db_now(), "day", db.bind.dialect.name), Date)))
+
+
+def _day_of(row: dict, today: date | None) -> date:
+    date_created = row.get("date_created")
+    if date_created is None:
+        return today
+    if date_created.tzinfo is not None:
+        date_created = date_created.astimezone(timezone.utc)
+    return date_created.date()
+
+
+async def update_daily_rollups(db: AsyncSession, rows: list[dict]) -> None:
+    """
+    Add freshly inserted food_info rows to their owners' daily totals with
+    one upsert. Runs inside the caller's transaction.
+    """
+    rows = [row for row in rows if row.get("owner_id") is not None]
+    today = await _database_today(db) if any(row.get("date_created") is None for row in rows) else None
+    totals: dict[tuple[int, date], dict] = {}
+    for row in rows:
+        key = (row["owner_id"], _day_of(row, today))
+        total = totals.setdefault(key, dict(owner_id=key[0], day=key[1], entries=0,
+                                            **{nutrient: 0.0 for nutrient in NUTRIENTS}))
+        total["entries"] += 1
+        for nutrient in NUTRIENTS:
+            total[nutrient] += row[nutrient]
+    if not totals:
+        return
+
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    # Sorted so concurrent writers lock rows in the same order
+    statement = dialect.insert(DailyNutritionRollup).values([totals[key] for key in sorted(totals)])
+    table = DailyNutritionRollup.__table__
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=["owner_id", "day"],
+        set_={column: table.c[column] + statement.excluded[column] for column in ("entries",) + NUTRIENTS},
+    ))
+
+
+async def rebuild_daily_rollups(db: AsyncSession, owner_id: int | None = None, start: date | None = None,
+                                end: date | None = None) -> int:
+    """
+    Recompute the rollups from food_info for the given owner and day range
+    (start inclusive, end exclusive; everything by default). Returns the
+    number of rollup rows written.
+    """
+    rollup_conditions, food_conditions = [], [FoodInfoDB.owner_id.isnot(None)]
+    if owner_id is not None:
+        rollup_conditions.append(DailyNutritionRollup.owner_id == owner_id)
+        food_conditions.append(FoodInfoDB.owner_id == owner_id)
+    if start is not None:
+        rollup_conditions.append(DailyNutritionRollup.day >= start)
+        food_conditions.append(FoodInfoDB.date_created >= datetime.combine(start, time.min))
+    if end is not None:
+        rollup_conditions.append(DailyNutritionRollup.day < end)
+        food_conditions.append(FoodInfoDB.date_created < datetime.combine(end, time.min))
+
+    day = period_start(FoodInfoDB.date_created, "day", db.bind.dialect.name)
+    totals = (select(FoodInfoDB.owner_id, day, func.count(),
+                     *(func.sum(getattr(FoodInfoDB, nutrient)) for nutrient in NUTRIENTS))
+              .where(*food_conditions)
+              .group_by(FoodInfoDB.owner_id, day))
+
+    await db.execute(delete(DailyNutritionRollup).where(*rollup_conditions))
+    result = await db.execute(insert(DailyNutritionRollup).from_select(
+        ["owner_id", "day", "entries", *NUTRIENTS], totals))
+    await db.commit()
+    return result.rowcount
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild the daily nutrition rollups from the food log.")
+    parser.add_argument("--owner-id", type=int, help="only this user")
+    parser.add_argument("--start", type=date.fromisoformat, help="first day to rebuild (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, help="day after the last one to rebuild (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    async def run() -> int:
+        async with AsyncSessionLocal() as db:
+            return await rebuild_daily_rollups(db, args.owner_id, args.start, args.end)
+
+    rows = asyncio.run(run())
+    print(f"Rebuilt {rows} daily nutrition rollups")
+
+
+if __name__ == "__main__":
+    main()
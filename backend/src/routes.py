@@ -1,38 +1,54 @@
-from fastapi import APIRouter, FastAPI, File, UploadFile, HTTPException, Depends
+from datetime import date, datetime, timezone
+from fastapi import APIRouter, FastAPI, File, Form, Query, UploadFile, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import Annotated
-from sqlalchemy.orm import Session
+from typing import Annotated, Literal
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from .database import get_db
+from .database import get_db, pool_status
 from .config import settings
 from .logger import setup_logger
-from .calculator.schemas import DailyIntake
-from .schemas import UserInfoRequest, FoodInfo, UserCreate, User
-from .services import get_db_type, get_user_by_email, create_user, authenticate_user, create_token, get_current_user, calculate_daily_intake_and_save_to_db, analyze_image_and_save_to_db
+from .calculator.schemas import DailyIntake, DailyIntakeBatch
+from .schemas import (UserInfoRequest, UserInfoBatchRequest, FoodInfo, UserCreate, User, BatchItemResult, JobStatus,
+                      FoodLogPage, FoodLogAggregate, DailyNutrition, FoodSearchResult)
+from .jobs import JobQueue, check_webhook_url, get_job_queue, job_status
+from .uploads import check_upload_size
+from .cache import image_cache
+from .metrics import render as render_metrics
+from .nutrition_reference import nutrition_reference
+from .services import get_db_type, get_user_by_email, create_user, authenticate_user, create_token, get_current_user, get_optional_user, get_food_log_page, get_food_log_aggregates, get_daily_nutrition, calculate_daily_intake_and_save_to_db, calculate_daily_intakes_and_save_to_db, analyze_image_and_save_to_db, analyze_images_and_save_to_db, get_openai_client
 
 
 router = APIRouter()
 logger = setup_logger(__name__)
 
 assistant_id = settings.ASSISTANT_ID
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
 
 
 @router.get("/")
 async def root(db: db_dependency):
     """
-    Root endpoint to check if the database is running.
+    Root endpoint to check if the database is running. Serves as the
+    readiness probe: 503 until the database answers, with the connection
+    pool state in both cases.
     """
     try:
-        result = db.execute(text("SELECT 1")).scalar()
+        result = (await db.execute(text("SELECT 1"))).scalar()
         db_type = get_db_type(db.get_bind())
         if result == 1:
-            return {"status": "success", "message": "Database is running.", "database_type": db_type}
+            return {"status": "success", "message": "Database is running.", "database_type": db_type,
+                    "pool": pool_status()}
         else:
-            return {"status": "error", "message": "Unexpected result from database.", "database_type": db_type}
+            return JSONResponse(status_code=503, content={
+                "status": "error", "message": "Unexpected result from database.", "database_type": db_type,
+                "pool": pool_status()})
     except Exception as e:
-        logger.error(f"Database connection error: {e}")
-        return {"status": "error", "message": "Database is not running.", "database_type": "Unknown"}
+        logger.error("Database connection error: %s", e)
+        return JSONResponse(status_code=503, content={
+            "status": "error", "message": "Database is not running.", "database_type": "Unknown",
+            "pool": pool_status()})
 
 
 @router.get("/ping")
@@ -43,12 +59,22 @@ async def ping():
     return {"message": "pong"}
 
 
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus metrics: request latency, OpenAI stage timings, errors and
+    retries, DB query and commit timings and connection pool usage.
+    """
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 @router.post("/users")
 async def create_new_user(user: UserCreate, db: db_dependency):
     """
     Endpoint to create a new user.
     """
-    logger.debug(f"Creating user with email: {user.email}")
+    logger.debug("Creating user with email: %s", user.email)
     db_user = await get_user_by_email(user.email, db)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already exists")
@@ -76,6 +102,38 @@ async def get_user(user: User = Depends(get_current_user)):
     return user
 
 
+@router.get("/users/me/food-log", response_model=FoodLogPage)
+async def food_log(db: db_dependency, user: User = Depends(get_current_user), start: datetime | None = None,
+                   end: datetime | None = None, limit: int = Query(50, ge=1, le=500), cursor: str | None = None):
+    """
+    Endpoint to page through the current user's food log, newest first.
+    `start` is inclusive, `end` exclusive; pass `next_cursor` of a page as
+    `cursor` to get the next one.
+    """
+    return await get_food_log_page(user, db, start, end, limit, cursor)
+
+
+@router.get("/users/me/food-log/aggregates", response_model=list[FoodLogAggregate])
+async def food_log_aggregates(db: db_dependency, user: User = Depends(get_current_user),
+                              period: Literal["day", "week"] = "day", start: datetime | None = None,
+                              end: datetime | None = None):
+    """
+    Endpoint to get daily or weekly nutrient totals of the current user's food log.
+    """
+    return await get_food_log_aggregates(user, db, period, start, end)
+
+
+@router.get("/users/me/nutrition", response_model=list[DailyNutrition])
+async def daily_nutrition(db: db_dependency, user: User = Depends(get_current_user), start: date | None = None,
+                          end: date | None = None):
+    """
+    Endpoint to compare the current user's daily consumption with their
+    intake target, per day from `start` to `end` (both default to today, UTC).
+    """
+    today = datetime.now(timezone.utc).date()
+    return await get_daily_nutrition(user, db, start or end or today, end or today)
+
+
 @router.post("/calculate-intake", response_model=DailyIntake)
 async def calculate_intake(user_info: UserInfoRequest, db: db_dependency):
     """
@@ -85,15 +143,89 @@ async def calculate_intake(user_info: UserInfoRequest, db: db_dependency):
     return daily_intake
 
 
-@router.post("/analyze-image", response_model=FoodInfo)
-async def analyze_image(db: Session = Depends(get_db), file: UploadFile = File(...)):
+@router.post("/calculate-intake/batch", response_model=DailyIntakeBatch)
+async def calculate_intake_batch(batch: UserInfoBatchRequest, db: db_dependency):
     """
-    Endpoint to analyze an image and extract food information using OpenAI.
+    Endpoint to calculate daily intake for many users given as columns.
+    Invalid rows are reported in the per-field error masks.
     """
-    food_info = await analyze_image_and_save_to_db(file, db)
+    return await calculate_daily_intakes_and_save_to_db(batch, db)
+
+
+@router.get("/foods/search", response_model=list[FoodSearchResult])
+async def search_foods(q: str = Query(..., min_length=1, max_length=200), limit: int = Query(10, ge=1, le=50),
+                       grams: float = Query(100, gt=0, le=10000)):
+    """
+    Endpoint to look up foods by name in the local nutrition reference,
+    best match first, with their nutrients scaled to `grams`. No image
+    analysis is involved.
+    """
+    matches = await run_in_threadpool(nutrition_reference.search, q, limit)
+    return [FoodSearchResult(certainty=round(similarity, 3), food_name=food.food_name, grams=grams,
+                             **food.scaled(grams))
+            for food, similarity in matches]
+
+
+@router.post("/analyze-image", response_model=FoodInfo,
+             responses={202: {"model": JobStatus, "description": "Analysis queued as a background job"}})
+async def analyze_image(db: AsyncSession = Depends(get_db), file: UploadFile = File(...),
+                        async_job: bool = False, webhook_url: str | None = Form(None),
+                        queue: JobQueue = Depends(get_job_queue), client=Depends(get_openai_client),
+                        user: User | None = Depends(get_optional_user)):
+    """
+    Endpoint to analyze an image and extract food information using OpenAI.
+    With `async_job=true` the analysis is queued and a job id is returned
+    immediately; poll GET /jobs/{job_id} or, when authenticated, pass an
+    https `webhook_url` to be notified on completion. Results of
+    authenticated requests are added to the user's food log.
+    """
+    owner_id = user.id if user else None
+    if async_job:
+        if webhook_url:
+            if user is None:
+                raise HTTPException(status_code=401, detail="Webhooks require authentication",
+                                    headers={"WWW-Authenticate": "Bearer"})
+            await check_webhook_url(webhook_url)
+        check_upload_size(file)
+        job = await queue.enqueue(db, await file.read(), file.filename, file.content_type, webhook_url, owner_id)
+        return JSONResponse(status_code=202, content=job_status(job).model_dump(mode="json"))
+
+    food_info = await analyze_image_and_save_to_db(file, db, client, owner_id)
     return food_info
 
 
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, db: db_dependency, queue: JobQueue = Depends(get_job_queue),
+                  user: User | None = Depends(get_optional_user)):
+    """
+    Endpoint to check the status and result of a queued image analysis.
+    Jobs queued by a user are only visible to that user.
+    """
+    job = await queue.get(db, job_id, user.id if user else None)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
+
+@router.post("/analyze-images", response_model=list[BatchItemResult])
+async def analyze_images(db: AsyncSession = Depends(get_db), files: list[UploadFile] = File(...),
+                         client=Depends(get_openai_client), user: User | None = Depends(get_optional_user)):
+    """
+    Endpoint to analyze many images (or zip archives of images) in one request.
+    Results are returned in upload order, with per-item errors.
+    """
+    return await analyze_images_and_save_to_db(files, db, client, user.id if user else None)
+
+
+@router.get("/image-cache/stats")
+async def get_image_cache_stats(user: User = Depends(get_current_user)):
+    """
+    Endpoint to report hit/miss counters of the image analysis cache, to
+    signed-in users only: hit rates tell what others have been uploading.
+    """
+    return image_cache.get_stats()
+
+
 def setup_routes(app: FastAPI) -> None:
     """
     Function to setup routes in the FastAPI application.
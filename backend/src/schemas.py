@@ -1,4 +1,5 @@
-from pydantic import BaseModel, ConfigDict
+from datetime import date, datetime
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field
 
 
 class UserBase(BaseModel):
@@ -18,7 +19,8 @@ class User(UserBase):
 
 
 class UserInfoRequest(BaseModel):
-    owner_id: int
+    # Also accepted as user_id, the name the frontend's intake form sends
+    owner_id: int = Field(validation_alias=AliasChoices("owner_id", "user_id"))
     height_cm: float
     weight_kg: float
     age: float
@@ -28,6 +30,18 @@ class UserInfoRequest(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class UserInfoBatchRequest(BaseModel):
+    """
+    Many profiles as parallel columns; row i of every column is one user.
+    """
+    owner_id: list[int]
+    height_cm: list[float | None]
+    weight_kg: list[float | None]
+    age: list[float | None]
+    gender: list[str | None]
+    activity_level: list[str | None]
+
+
 class UserWithInfo(User):
     user_info: UserInfoRequest
 
@@ -43,3 +57,66 @@ class FoodInfo(BaseModel):
     sugar_in_g: float | int
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class FoodSearchResult(FoodInfo):
+    """
+    Reference nutrients of `grams` of a food; `certainty` is the similarity
+    of its name to the query.
+    """
+    grams: float
+
+
+class FoodLogEntry(FoodInfo):
+    id: int
+    date_created: datetime
+
+
+class FoodLogPage(BaseModel):
+    items: list[FoodLogEntry]
+    # Pass as `cursor` to get the next (older) page; null on the last page
+    next_cursor: str | None = None
+
+
+class FoodLogAggregate(BaseModel):
+    period_start: date
+    entries: int
+    calories_Kcal: float
+    fat_in_g: float
+    sugar_in_g: float
+    protein_in_g: float
+
+
+class NutrientTotals(BaseModel):
+    calories_Kcal: float
+    fat_in_g: float
+    sugar_in_g: float
+    protein_in_g: float
+
+
+class DailyNutrition(BaseModel):
+    day: date
+    entries: int
+    consumed: NutrientTotals
+    # Latest /calculate-intake result in effect on that day, if any
+    target: NutrientTotals | None = None
+    remaining: NutrientTotals | None = None
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    filename: str | None = None
+    food_info: FoodInfo | None = None
+    error: str | None = None
+    status_code: int = 200
+
+
+class JobStatus(BaseModel):
+    id: str
+    status: str
+    attempts: int
+    food_info: FoodInfo | None = None
+    error: str | None = None
+    error_status_code: int | None = None
+    date_created: datetime | None = None
+    date_last_updated: datetime | None = None
@@ -1,21 +1,35 @@
-import os
-from jwt import encode, decode
+import asyncio
+import base64
+import time
+from datetime import date, datetime, timedelta, timezone
+from jwt import InvalidTokenError, decode, encode, get_unverified_header
+from sqlalchemy import func, select, tuple_
 from sqlalchemy.engine.base import Engine
-from sqlalchemy.orm import Session
-from passlib.hash import bcrypt
-from fastapi import Depends, HTTPException, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import Depends, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from .models import User, UserCalories, FoodInfoDB
-from .schemas import UserCreate, UserInfoRequest, FoodInfo, User as PydanticUser
+from .models import User, UserCalories, FoodInfoDB, DailyNutritionRollup
+from .schemas import (UserCreate, UserInfoRequest, UserInfoBatchRequest, FoodInfo, BatchItemResult, FoodLogEntry,
+                      FoodLogPage, FoodLogAggregate, NutrientTotals, DailyNutrition, User as PydanticUser)
 from .config import settings
 from .logger import setup_logger
 from .database import get_db
 from .calculator.processors import IntakeProcessor
-from .openai_client.client import OpenAIClient
+from .cache import image_cache, perceptual_hash, user_cache
+from .batch_writer import food_info_writer, user_calories_writer
+from .rollups import NUTRIENTS, period_start
+from .passwords import hash_password, verify_password
+from .uploads import BatchUploadError, check_upload_size, expand_batch_uploads, hash_upload
+from .image_preprocessor import preprocess_upload
+from .openai_client.client import OpenAIClient, AsyncOpenAIClient, analysis_deadline
+from .openai_client.vision import AsyncVisionClient
+from .openai_client.limits import openai_guard
 
 logger = setup_logger(__name__)
 
 oauth2schema = OAuth2PasswordBearer(tokenUrl="/token")
+optional_oauth2schema = OAuth2PasswordBearer(tokenUrl="/token", auto_error=False)
 
 
 def get_db_type(engine: Engine) -> str:
@@ -28,116 +42,442 @@ def get_db_type(engine: Engine) -> str:
     return "Unknown"
 
 
-async def get_user_by_email(email: str, db: Session):
-    return db.query(User).filter(User.email == email).first()
+async def get_user_by_email(email: str, db: AsyncSession):
+    return await db.scalar(select(User).where(User.email == email).limit(1))
 
 
-async def create_user(user: UserCreate, db: Session):
+async def create_user(user: UserCreate, db: AsyncSession):
     user_obj = User(email=user.email,
-                    hashed_password=bcrypt.hash(user.hashed_password))
+                    hashed_password=await hash_password(user.hashed_password))
     db.add(user_obj)
-    db.commit()
-    db.refresh(user_obj)
+    await db.commit()
+    await db.refresh(user_obj)
     return user_obj
 
 
-async def get_user(user_id: int, db: Session):
-    return db.query(User).filter(User.id == user_id).first()
+async def get_user(user_id: int, db: AsyncSession):
+    return await db.get(User, user_id)
 
 
-async def authenticate_user(email: str, password: str, db: Session):
+async def authenticate_user(email: str, password: str, db: AsyncSession):
     user = await get_user_by_email(email, db)
     if not user:
         return False
-    if not user.verify_password(password):
+    valid, new_hash = await verify_password(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+        invalidate_user(user.id)
+        logger.info("Upgraded password hash for user %s", user.id)
     return user
 
 
+def jwt_keys() -> dict[str, str]:
+    """
+    Verification keys by key id: the current signing key plus the retired
+    ones listed in JWT_PREVIOUS_KEYS as "kid:secret,kid:secret".
+    """
+    keys = dict(item.strip().split(":", 1) for item in settings.JWT_PREVIOUS_KEYS.split(",") if ":" in item)
+    keys[settings.JWT_KEY_ID] = settings.JWT_SECRET
+    return keys
+
+
 async def create_token(user: User):
     user_obj = PydanticUser.model_validate(user)
-    token = encode(user_obj.model_dump(), settings.JWT_SECRET)
+    now = int(time.time())
+    claims = {**user_obj.model_dump(), "iat": now, "exp": now + settings.JWT_EXPIRE_SECONDS}
+    token = encode(claims, settings.JWT_SECRET, algorithm="HS256", headers={"kid": settings.JWT_KEY_ID})
+    user_cache.set(user_obj.id, user_obj)
 
     return dict(access_token=token, token_type="bearer")
 
 
-async def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2schema)):
+def decode_token(token: str) -> dict:
     try:
-        payload = decode(token, settings.JWT_SECRET, algorithms=["HS256"])
-        user = db.query(User).get(payload["id"])
-    except:
-        return HTTPException(status_code=401, detail="Invalid email or password")
-    finally:
-        return PydanticUser.model_validate(user)
+        kid = get_unverified_header(token).get("kid", settings.JWT_KEY_ID)
+        key = jwt_keys().get(kid)
+        if key is None:
+            raise InvalidTokenError(f"Unknown key id {kid}")
+        return decode(token, key, algorithms=["HS256"], options={"require": ["exp", "iat", "id"]})
+    except InvalidTokenError as e:
+        logger.debug("Rejected token: %s", e)
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+def invalidate_user(user_id: int) -> None:
+    """
+    Drop a cached user record; call whenever a user is changed or deleted.
+    """
+    user_cache.pop(user_id)
+
+
+async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depends(oauth2schema)):
+    """
+    Resolve the user from a signed token. The signature and expiry are checked
+    locally and the user record comes from user_cache, so the database is only
+    queried on a cache miss (the session is not connected until then).
+    """
+    payload = decode_token(token)
+    user = user_cache.get(payload["id"])
+    if user is None:
+        db_user = await db.get(User, payload["id"])
+        if db_user is None:
+            raise HTTPException(status_code=401, detail="Invalid authentication credentials",
+                                headers={"WWW-Authenticate": "Bearer"})
+        user = PydanticUser.model_validate(db_user)
+        user_cache.set(user.id, user)
+    return user
+
+
+async def get_optional_user(db: AsyncSession = Depends(get_db), token: str | None = Depends(optional_oauth2schema)):
+    """
+    Like get_current_user, but anonymous requests get None. A token that is
+    present but invalid is still rejected.
+    """
+    if token is None:
+        return None
+    return await get_current_user(db, token)
 
 
 async def process_daily_intake(user_info: UserInfoRequest):
     return IntakeProcessor.process(user_info.model_dump())
 
 
-async def save_daily_intake_to_db(daily_intake, db: Session):
+async def save_daily_intake_to_db(daily_intake, db: AsyncSession):
+    """
+    Store the intake through the write-behind batcher and return once it is
+    committed.
+    """
     try:
-        db_transaction = UserCalories(**daily_intake.model_dump())
-        db.add(db_transaction)
-        db.commit()
-        db.refresh(db_transaction)
-        return db_transaction
+        await user_calories_writer.submit(db, [daily_intake.model_dump()])
+        return daily_intake
     except Exception as e:
-        db.rollback()
-        logger.error(f"Failed to save daily intake to DB: {e}")
+        logger.error("Failed to save daily intake to DB: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
     finally:
-        db.close()
+        await db.close()
 
 
-async def calculate_daily_intake_and_save_to_db(user_info: UserInfoRequest, db: Session = Depends(get_db)):
+async def calculate_daily_intake_and_save_to_db(user_info: UserInfoRequest, db: AsyncSession = Depends(get_db)):
     try:
         daily_intake = await process_daily_intake(user_info)
         return await save_daily_intake_to_db(daily_intake, db)
     except HTTPException as e:
         raise e
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
+        logger.error("Unexpected error: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-async def store_food_info(food_info: FoodInfo, db: Session = Depends(get_db)):
+async def calculate_daily_intakes_and_save_to_db(batch: UserInfoBatchRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Vectorised daily intake for many users; the valid rows go to the
+    database in one batch.
+    """
+    if len(batch.owner_id) > settings.INTAKE_BATCH_MAX_ROWS:
+        raise HTTPException(status_code=413,
+                            detail=f"A batch may contain at most {settings.INTAKE_BATCH_MAX_ROWS} rows")
+    result = IntakeProcessor.process_batch(batch.model_dump())
+    rows = [
+        dict(owner_id=owner_id, calories=calories, fat_g=fat_g, sugar_g=sugar_g, protein_g=protein_g)
+        for owner_id, calories, fat_g, sugar_g, protein_g, valid in zip(
+            result.owner_id, result.calories, result.fat_g, result.sugar_g, result.protein_g, result.valid)
+        if valid
+    ]
     try:
-        db_transaction = FoodInfoDB(**food_info.model_dump())
-        db.add(db_transaction)
-        db.commit()
-        db.refresh(db_transaction)
+        await user_calories_writer.submit(db, rows)
     except Exception as e:
-        db.rollback()
-        logger.error(f"Failed to store food info: {e}")
+        logger.error("Failed to save daily intakes to DB: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+    return result
+
+
+async def store_food_info(food_info: FoodInfo, db: AsyncSession = Depends(get_db), wait: bool = True,
+                          owner_id: int | None = None):
+    await store_food_infos([food_info], db, wait, owner_id)
+
+
+async def store_food_infos(food_infos: list[FoodInfo], db: AsyncSession = Depends(get_db), wait: bool = True,
+                           owner_id: int | None = None):
+    """
+    Persist analysis results through the write-behind batcher, which merges
+    them with concurrent requests into one multi-row INSERT. With `wait` the
+    call returns after the commit; otherwise as soon as the rows are queued.
+    """
+    try:
+        await food_info_writer.submit(
+            db, [dict(food_info.model_dump(), owner_id=owner_id) for food_info in food_infos], wait)
+    except Exception as e:
+        logger.error("Failed to store food info: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
     finally:
-        db.close()
+        await db.close()
+
+
+def _naive_utc(value: datetime | None) -> datetime | None:
+    # Timestamps are stored as naive UTC
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def encode_cursor(entry: FoodLogEntry) -> str:
+    return base64.urlsafe_b64encode(f"{entry.date_created.isoformat()}|{entry.id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        date_created, entry_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(date_created), int(entry_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def food_log_conditions(owner_id: int, start: datetime | None, end: datetime | None) -> list:
+    conditions = [FoodInfoDB.owner_id == owner_id]
+    if start is not None:
+        conditions.append(FoodInfoDB.date_created >= _naive_utc(start))
+    if end is not None:
+        conditions.append(FoodInfoDB.date_created < _naive_utc(end))
+    return conditions
 
 
-async def analyze_image_and_save_to_db(file: UploadFile, db: Session = Depends(get_db)):
+async def get_food_log_page(user: PydanticUser, db: AsyncSession, start: datetime | None = None,
+                            end: datetime | None = None, limit: int = 50, cursor: str | None = None) -> FoodLogPage:
     """
-    Endpoint to analyze an image and extract food information using OpenAI.
+    One page of the user's food log, newest first. Keyset pagination on
+    (date_created, id) walks the (owner_id, date_created) index, so the cost
+    of a page does not grow with how far back it is.
+    """
+    query = select(FoodInfoDB).where(*food_log_conditions(user.id, start, end))
+    if cursor is not None:
+        query = query.where(tuple_(FoodInfoDB.date_created, FoodInfoDB.id) < tuple_(*decode_cursor(cursor)))
+    query = query.order_by(FoodInfoDB.date_created.desc(), FoodInfoDB.id.desc()).limit(limit + 1)
+    rows = (await db.scalars(query)).all()
+
+    items = [FoodLogEntry.model_validate(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+    return FoodLogPage(items=items, next_cursor=next_cursor)
+
+
+async def get_food_log_aggregates(user: PydanticUser, db: AsyncSession, period: str = "day",
+                                  start: datetime | None = None, end: datetime | None = None) -> list[FoodLogAggregate]:
+    """
+    Daily or weekly totals of the user's food log within the date range.
     """
-    client = OpenAIClient()
-    temp_file_path = f"temp_{file.filename}"
+    bucket = period_start(FoodInfoDB.date_created, period, db.bind.dialect.name).label("period_start")
+    query = (select(bucket,
+                    func.count().label("entries"),
+                    func.sum(FoodInfoDB.calories_Kcal).label("calories_Kcal"),
+                    func.sum(FoodInfoDB.fat_in_g).label("fat_in_g"),
+                    func.sum(FoodInfoDB.sugar_in_g).label("sugar_in_g"),
+                    func.sum(FoodInfoDB.protein_in_g).label("protein_in_g"))
+             .where(*food_log_conditions(user.id, start, end))
+             .group_by(bucket)
+             .order_by(bucket))
+    rows = (await db.execute(query)).mappings().all()
+    return [FoodLogAggregate(**row) for row in rows]
+
+
+def _target_totals(target: UserCalories) -> NutrientTotals:
+    return NutrientTotals(calories_Kcal=target.calories, fat_in_g=target.fat_g, sugar_in_g=target.sugar_g,
+                          protein_in_g=target.protein_g)
+
 
+async def get_daily_nutrition(user: PydanticUser, db: AsyncSession, start: date, end: date) -> list[DailyNutrition]:
+    """
+    Consumed vs. target vs. remaining for every day from `start` to `end`
+    (inclusive). Consumption comes from the daily rollups, one row per day,
+    so the raw food log is not aggregated here.
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days >= settings.NUTRITION_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.NUTRITION_MAX_DAYS} days can be requested")
+
+    rollups = {rollup.day: rollup for rollup in (await db.scalars(
+        select(DailyNutritionRollup).where(DailyNutritionRollup.owner_id == user.id,
+                                           DailyNutritionRollup.day >= start,
+                                           DailyNutritionRollup.day <= end))).all()}
+    range_start = datetime.combine(start, datetime.min.time())
+    range_end = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    target = await db.scalar(select(UserCalories)
+                             .where(UserCalories.owner_id == user.id, UserCalories.date_created < range_start)
+                             .order_by(UserCalories.date_created.desc()).limit(1))
+    later_targets = list((await db.scalars(
+        select(UserCalories).where(UserCalories.owner_id == user.id, UserCalories.date_created >= range_start,
+                                   UserCalories.date_created < range_end)
+        .order_by(UserCalories.date_created))).all())
+
+    days = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        day_end = datetime.combine(day + timedelta(days=1), datetime.min.time())
+        while later_targets and later_targets[0].date_created < day_end:
+            target = later_targets.pop(0)
+        rollup = rollups.get(day)
+        consumed = NutrientTotals(**{nutrient: getattr(rollup, nutrient) if rollup else 0.0 for nutrient in NUTRIENTS})
+        target_totals = _target_totals(target) if target else None
+        remaining = NutrientTotals(**{
+            nutrient: getattr(target_totals, nutrient) - getattr(consumed, nutrient) for nutrient in NUTRIENTS
+        }) if target_totals else None
+        days.append(DailyNutrition(day=day, entries=rollup.entries if rollup else 0, consumed=consumed,
+                                   target=target_totals, remaining=remaining))
+    return days
+
+
+def create_openai_client():
+    """
+    Build the OpenAI client selected by OPENAI_ANALYSIS_BACKEND and
+    OPENAI_CLIENT_MODE. The single-call vision backend is async only.
+    """
+    if settings.OPENAI_ANALYSIS_BACKEND == "vision":
+        return AsyncVisionClient()
+    if settings.OPENAI_CLIENT_MODE == "sync":
+        return OpenAIClient()
+    return AsyncOpenAIClient()
+
+
+async def close_openai_client(client) -> None:
+    if isinstance(client, OpenAIClient):
+        client.close()
+    else:
+        await client.close()
+
+
+async def get_openai_client(request: Request):
+    """
+    Dependency returning the application-scoped OpenAI client created in the
+    app lifespan. Without a lifespan (e.g. a TestClient used outside a
+    `with` block) a client is created for the request and closed after it.
+    """
+    client = getattr(request.app.state, "openai_client", None)
+    if client is not None:
+        yield client
+        return
+    client = create_openai_client()
     try:
-        with open(temp_file_path, "wb") as buffer:
-            buffer.write(await file.read())
+        yield client
+    finally:
+        await close_openai_client(client)
+
+
+async def process_image(client, file) -> FoodInfo:
+    """
+    Run the image analysis without blocking the event loop. The synchronous
+    client is pushed to the thread pool, the async client is awaited directly.
+    All analyses share the process-wide limiter and circuit breaker; one
+    deadline bounds the analysis including queueing and retries.
+    """
+    deadline = analysis_deadline()
+
+    async def analyze() -> FoodInfo:
+        # A retry streams the payload again from the start
+        if isinstance(file, tuple) and hasattr(file[1], "seek"):
+            file[1].seek(0)
+        if isinstance(client, OpenAIClient):
+            return await run_in_threadpool(client.process_image, file, deadline)
+        return await client.process_image(file, deadline)
+
+    return await openai_guard.call(analyze, requests=client.API_CALLS_PER_ANALYSIS, deadline=deadline)
+
+
+async def lookup_cached_analysis(file: UploadFile):
+    """
+    Return (food_info, image_hash, perceptual_hash) for the upload;
+    food_info is None on a cache miss.
+    """
+    image_hash = await hash_upload(file)
+    phash = None
+    if image_cache.perceptual:
+        phash = await run_in_threadpool(perceptual_hash, file.file)
+        await file.seek(0)
+    return await image_cache.get(image_hash, phash), image_hash, phash
+
+
+async def analyze_upload(file: UploadFile, client) -> FoodInfo:
+    """
+    Analyze one uploaded image: size check, cache lookup, preprocessing and
+    the OpenAI call. Nothing is written to the food log.
+    """
+    check_upload_size(file)
+    if not settings.IMAGE_CACHE_ENABLED:
+        return await process_image(client, await preprocess_upload(file))
+
+    food_info, image_hash, phash = await lookup_cached_analysis(file)
+    if food_info is not None:
+        logger.debug("Image cache hit for %s", image_hash)
+        return food_info
+
+    async def analyze() -> FoodInfo:
+        food_info = await process_image(client, await preprocess_upload(file))
+        await image_cache.set(image_hash, food_info, phash)
+        return food_info
 
-        food_info = client.process_image(temp_file_path)
-        await store_food_info(food_info, db)
+    return await image_cache.single_flight(image_hash, analyze)
+
+
+async def analyze_image_and_save_to_db(file: UploadFile, db: AsyncSession = Depends(get_db),
+                                       client=Depends(get_openai_client), owner_id: int | None = None):
+    """
+    Endpoint to analyze an image and extract food information using OpenAI.
+    """
+    try:
+        food_info = await analyze_upload(file, client)
+        await store_food_info(food_info, db, settings.FOOD_LOG_DURABLE_WRITES, owner_id)
         return food_info
 
     except HTTPException as e:
-        db.rollback()
-        logger.error(f"HTTP exception: {e.detail}")
+        await db.rollback()
+        logger.error("HTTP exception: %s", e.detail)
         raise e
     except Exception as e:
-        db.rollback()
-        logger.error(f"Internal server error: {e}")
+        await db.rollback()
+        logger.error("Internal server error: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
+
+
+async def analyze_images_and_save_to_db(files: list[UploadFile], db: AsyncSession = Depends(get_db),
+                                        client=Depends(get_openai_client),
+                                        owner_id: int | None = None) -> list[BatchItemResult]:
+    """
+    Analyze a batch of images (zip archives are expanded in place) with at
+    most BATCH_ANALYZE_CONCURRENCY analyses in flight. Failures are reported
+    per item; all successful results are stored in one batch.
+    """
+    items = await expand_batch_uploads(files)
+    if len(items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {settings.BATCH_MAX_ITEMS} images")
+
+    semaphore = asyncio.Semaphore(settings.BATCH_ANALYZE_CONCURRENCY)
+
+    async def analyze_item(index: int, item: UploadFile | BatchUploadError) -> BatchItemResult:
+        if isinstance(item, BatchUploadError):
+            return BatchItemResult(index=index, filename=item.filename, error=item.detail,
+                                   status_code=item.status_code)
+        try:
+            async with semaphore:
+                food_info = await analyze_upload(item, client)
+            return BatchItemResult(index=index, filename=item.filename, food_info=food_info)
+        except HTTPException as e:
+            logger.error("Batch item %s (%s) failed: %s", index, item.filename, e.detail)
+            return BatchItemResult(index=index, filename=item.filename, error=str(e.detail),
+                                   status_code=e.status_code)
+        except Exception as e:
+            logger.error("Batch item %s (%s) failed: %s", index, item.filename, e)
+            return BatchItemResult(index=index, filename=item.filename, error="Internal server error",
+                                   status_code=500)
+
+    try:
+        results = await asyncio.gather(*(analyze_item(index, item) for index, item in enumerate(items)))
     finally:
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        for item in items:
+            if isinstance(item, UploadFile) and item not in files:
+                await item.close()
+
+    await store_food_infos([result.food_info for result in results if result.food_info is not None], db,
+                           settings.FOOD_LOG_DURABLE_WRITES, owner_id)
+    return results
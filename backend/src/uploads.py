@@ -0,0 +1,147 @@
+import hashlib
+import mimetypes
+import os
+import shutil
+import zipfile
+from tempfile import SpooledTemporaryFile
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from .config import settings
+
+CHUNK_SIZE = 64 * 1024
+# Same in-memory threshold Starlette uses for multipart uploads
+SPOOL_MAX_SIZE = 1024 * 1024
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject request bodies larger than `max_bytes` with 413 before they are
+    buffered. A declared Content-Length is checked up front; bodies without
+    one are counted while they stream in and aborted once over the limit.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int, path_limits: dict[str, int] | None = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.path_limits.get(scope["path"], self.max_bytes)
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send: Send) -> None:
+        body = b'{"detail":"Request body too large"}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def check_upload_size(file: UploadFile) -> None:
+    if file.size is not None and file.size > settings.MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413, detail=f"File exceeds the maximum size of {settings.MAX_UPLOAD_BYTES} bytes")
+
+
+async def hash_upload(file: UploadFile) -> str:
+    """
+    SHA-256 of the upload, read in fixed-size chunks. The file is rewound
+    afterwards so it can be streamed again.
+    """
+    digest = hashlib.sha256()
+    await file.seek(0)
+    while chunk := await file.read(CHUNK_SIZE):
+        digest.update(chunk)
+    await file.seek(0)
+    return digest.hexdigest()
+
+
+def upload_payload(file: UploadFile) -> tuple:
+    """
+    (filename, file object, content type) tuple accepted by the OpenAI files
+    API, so the spooled upload is streamed instead of copied.
+    """
+    return (file.filename or "upload", file.file, file.content_type or "application/octet-stream")
+
+
+class BatchUploadError:
+    """
+    Placeholder for a batch entry that could not be turned into an image.
+    """
+
+    def __init__(self, filename: str | None, detail: str, status_code: int = 400):
+        self.filename = filename
+        self.detail = detail
+        self.status_code = status_code
+
+
+def is_zip_upload(file: UploadFile) -> bool:
+    return file.content_type in ZIP_CONTENT_TYPES or (file.filename or "").lower().endswith(".zip")
+
+
+def _extract_zip(file: UploadFile) -> list[UploadFile | BatchUploadError]:
+    items = []
+    with zipfile.ZipFile(file.file) as archive:
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or info.filename.startswith("__MACOSX/") or name.startswith("."):
+                continue
+            if len(items) >= settings.BATCH_MAX_ITEMS:
+                raise HTTPException(status_code=413,
+                                    detail=f"A batch may contain at most {settings.BATCH_MAX_ITEMS} images")
+            if info.file_size > settings.MAX_UPLOAD_BYTES:
+                items.append(BatchUploadError(
+                    name, f"File exceeds the maximum size of {settings.MAX_UPLOAD_BYTES} bytes", 413))
+                continue
+            spooled = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+            with archive.open(info) as member:
+                shutil.copyfileobj(member, spooled, CHUNK_SIZE)
+            spooled.seek(0)
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            items.append(UploadFile(spooled, size=info.file_size, filename=name,
+                                    headers=Headers({"content-type": content_type})))
+    return items
+
+
+async def expand_batch_uploads(files: list[UploadFile]) -> list[UploadFile | BatchUploadError]:
+    """
+    Flatten a batch upload: zip archives are replaced by their members, in
+    archive order, each spooled like a regular upload.
+    """
+    items = []
+    for file in files:
+        if not is_zip_upload(file):
+            items.append(file)
+            continue
+        try:
+            items.extend(await run_in_threadpool(_extract_zip, file))
+        except zipfile.BadZipFile as e:
+            items.append(BatchUploadError(file.filename, f"Invalid zip archive: {e}"))
+    return items
@@ -0,0 +1,82 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from benchmarks.openai_stub import StubConfig, serve_stub
+from run import backend as app
+from src.cache import user_cache
+from src.config import settings
+from src.database import Base, get_db
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JWT_SECRET", "current-secret")
+    monkeypatch.setattr(settings, "JWT_KEY_ID", "k2")
+    monkeypatch.setattr(settings, "JWT_PREVIOUS_KEYS", "k1:old-secret")
+    monkeypatch.setattr(settings, "PASSWORD_BCRYPT_ROUNDS", 4)
+    db_path = tmp_path / "api.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
+
+    previous = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = override_get_db
+    user_cache.clear()
+    statements = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    test_client = TestClient(app)
+    test_client.statements = statements
+    test_client.session_factory = session_factory
+    yield test_client
+    user_cache.clear()
+    if previous is None:
+        app.dependency_overrides.pop(get_db, None)
+    else:
+        app.dependency_overrides[get_db] = previous
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def openai_stub_server():
+    config = StubConfig(call_latency=0.01, run_latency=0.3, poll_after_ms=20)
+    with serve_stub(config) as base_url:
+        yield config, base_url
+
+
+@pytest.fixture
+def stub_openai(openai_stub_server, monkeypatch):
+    """
+    Point the OpenAI clients at the shared local stub; yields its config.
+    """
+    config, base_url = openai_stub_server
+    monkeypatch.setattr(settings, "OPENAI_BASE_URL", base_url)
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "stub")
+    monkeypatch.setattr(settings, "ASSISTANT_ID", "asst_stub")
+    return config
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path / "image.jpg"
+    path.write_bytes(os.urandom(1024))
+    return str(path)
+
+
+def signup(client, email="a@example.com"):
+    response = client.post("/users", json={"email": email, "hashed_password": "secret"})
+    assert response.status_code == 200
+    return response.json()["access_token"]
+
+
+def auth(token):
+    return {"Authorization": f"Bearer {token}"}
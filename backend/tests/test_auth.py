@@ -0,0 +1,60 @@
+import time
+from jwt import encode
+
+from src.cache import user_cache
+from tests.conftest import auth, signup
+
+
+def test_users_me_is_served_without_database_query(client):
+    token = signup(client)
+    client.statements.clear()
+
+    for _ in range(3):
+        response = client.get("/users/me", headers=auth(token))
+        assert response.status_code == 200
+        assert response.json()["email"] == "a@example.com"
+    assert client.statements == []
+
+
+def test_users_me_loads_user_once_on_cache_miss(client):
+    token = signup(client)
+    user_cache.clear()
+    client.statements.clear()
+
+    assert client.get("/users/me", headers=auth(token)).status_code == 200
+    assert client.get("/users/me", headers=auth(token)).status_code == 200
+    assert len(client.statements) == 1
+
+
+def test_token_has_expiry_and_login_works(client):
+    signup(client)
+    response = client.post("/token", data={"username": "a@example.com", "password": "secret"})
+    assert response.status_code == 200
+    assert client.get("/users/me", headers=auth(response.json()["access_token"])).status_code == 200
+    assert client.post("/token", data={"username": "a@example.com", "password": "nope"}).status_code == 401
+
+
+def test_expired_token_is_rejected(client):
+    signup(client)
+    now = int(time.time())
+    token = encode({"id": 1, "email": "a@example.com", "iat": now - 120, "exp": now - 60},
+                   "current-secret", algorithm="HS256", headers={"kid": "k2"})
+    assert client.get("/users/me", headers=auth(token)).status_code == 401
+
+
+def test_token_without_expiry_is_rejected(client):
+    signup(client)
+    token = encode({"id": 1, "email": "a@example.com"}, "current-secret", algorithm="HS256", headers={"kid": "k2"})
+    assert client.get("/users/me", headers=auth(token)).status_code == 401
+
+
+def test_token_signed_with_retired_key_is_accepted(client):
+    signup(client)
+    now = int(time.time())
+    claims = {"id": 1, "email": "a@example.com", "iat": now, "exp": now + 60}
+    assert client.get("/users/me", headers=auth(
+        encode(claims, "old-secret", algorithm="HS256", headers={"kid": "k1"}))).status_code == 200
+    assert client.get("/users/me", headers=auth(
+        encode(claims, "old-secret", algorithm="HS256", headers={"kid": "k2"}))).status_code == 401
+    assert client.get("/users/me", headers=auth(
+        encode(claims, "old-secret", algorithm="HS256", headers={"kid": "k9"}))).status_code == 401
@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from src.batch_writer import BatchWriter
+from src.database import Base, utcnow
+from src.models import FoodInfoDB
+
+APPLE = dict(certainty=0.9, food_name="Apple", calories_Kcal=52, fat_in_g=0.2, protein_in_g=0.3, sugar_in_g=10.4)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    db_path = tmp_path / "writer.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    inserts = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: inserts.append(statement)
+                 if statement.startswith("INSERT") else None)
+    factory = async_sessionmaker(async_engine, expire_on_commit=False)
+    factory.inserts = inserts
+    return factory
+
+
+async def count_rows(session_factory) -> int:
+    async with session_factory() as db:
+        return await db.scalar(select(func.count()).select_from(FoodInfoDB))
+
+
+def test_concurrent_submits_are_coalesced(session_factory):
+    writer = BatchWriter(FoodInfoDB, max_rows=1000, max_delay=0.05)
+
+    async def run():
+        async def submit():
+            async with session_factory() as db:
+                await writer.submit(db, [APPLE])
+
+        await asyncio.gather(*(submit() for _ in range(50)))
+        return await count_rows(session_factory)
+
+    assert asyncio.run(run()) == 50
+    assert len(session_factory.inserts) == 1
+
+
+def test_batch_is_written_when_size_reached(session_factory):
+    writer = BatchWriter(FoodInfoDB, max_rows=10, max_delay=60)
+
+    async def run():
+        async with session_factory() as db:
+            await writer.submit(db, [APPLE] * 10)
+        return await count_rows(session_factory)
+
+    assert asyncio.run(run()) == 10
+
+
+def test_unacknowledged_rows_are_written_on_flush(session_factory):
+    writer = BatchWriter(FoodInfoDB, max_rows=1000, max_delay=60)
+
+    async def run():
+        async with session_factory() as db:
+            await writer.submit(db, [APPLE], wait=False)
+        before = await count_rows(session_factory)
+        await writer.flush()
+        return before, await count_rows(session_factory)
+
+    assert asyncio.run(run()) == (0, 1)
+
+
+def test_write_failure_is_raised_to_waiting_callers(session_factory):
+    writer = BatchWriter(FoodInfoDB, max_rows=1000, max_delay=0.01)
+
+    async def run():
+        async with session_factory() as db:
+            await writer.submit(db, [dict(APPLE, food_name=None)])
+
+    with pytest.raises(Exception):
+        asyncio.run(run())
+
+
+def test_bad_row_only_fails_its_own_caller(session_factory):
+    writer = BatchWriter(FoodInfoDB, max_rows=1000, max_delay=0.05)
+
+    async def run():
+        async def submit(row):
+            async with session_factory() as db:
+                await writer.submit(db, [row])
+
+        results = await asyncio.gather(submit(APPLE), submit(dict(APPLE, food_name=None)), submit(APPLE),
+                                       return_exceptions=True)
+        return results, await count_rows(session_factory)
+
+    results, rows = asyncio.run(run())
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], Exception)
+    assert rows == 2
+
+
+def test_rows_get_server_side_timestamps(session_factory):
+    writer = BatchWriter(FoodInfoDB, max_rows=1, max_delay=60)
+
+    async def run():
+        async with session_factory() as db:
+            await writer.submit(db, [APPLE])
+        async with session_factory() as db:
+            return (await db.scalars(select(FoodInfoDB))).one()
+
+    row = asyncio.run(run())
+    assert abs((utcnow() - row.date_created).total_seconds()) < 5
+    assert row.date_last_updated == row.date_created
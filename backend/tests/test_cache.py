@@ -0,0 +1,111 @@
+import asyncio
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from src.cache import TTLCache, ImageResultCache
+from src.database import Base
+from src.schemas import FoodInfo
+from tests.conftest import auth, signup
+
+APPLE = FoodInfo(certainty=0.9, food_name="Apple", calories_Kcal=52,
+                 fat_in_g=0.2, protein_in_g=0.3, sugar_in_g=10.4)
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.hits == 3
+    assert cache.misses == 1
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(max_entries=10, ttl=0.05)
+    cache.set("a", 1)
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_image_cache_hit_and_miss_counters():
+    cache = ImageResultCache(max_entries=10, ttl=60)
+    key = cache.key(b"image bytes")
+    assert asyncio.run(cache.get(key)) is None
+    asyncio.run(cache.set(key, APPLE))
+    assert asyncio.run(cache.get(key)) == APPLE
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_image_cache_perceptual_match():
+    cache = ImageResultCache(max_entries=10, ttl=60, perceptual=True, perceptual_distance=2)
+    cache.perceptual = True
+    asyncio.run(cache.set(cache.key(b"original"), APPLE, phash="ffff0000ffff0000"))
+    assert asyncio.run(cache.get(cache.key(b"resized"), phash="ffff0000ffff0001")) == APPLE
+    assert asyncio.run(cache.get(cache.key(b"other"), phash="0000ffff0000ffff")) is None
+    assert cache.get_stats()["perceptual_hits"] == 1
+
+
+def test_concurrent_misses_for_one_image_are_analyzed_once():
+    cache = ImageResultCache(max_entries=10, ttl=60)
+    calls = []
+
+    async def analyze():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return APPLE
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise ValueError("upstream failed")
+
+    async def run():
+        results = await asyncio.gather(*(cache.single_flight("a", analyze) for _ in range(3)))
+        errors = await asyncio.gather(*(cache.single_flight("b", failing) for _ in range(2)),
+                                      return_exceptions=True)
+        return results, errors
+
+    results, errors = asyncio.run(run())
+    assert results == [APPLE] * 3
+    assert [type(error) for error in errors] == [ValueError, ValueError]
+    assert len(calls) == 2
+    assert cache.get_stats()["coalesced"] == 3
+    assert cache._in_flight == {}
+
+
+def test_persistent_tier_matches_perceptual_hash(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+    session_factory = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'cache.db'}",
+                                                             poolclass=NullPool), expire_on_commit=False)
+
+    def make_cache():
+        cache = ImageResultCache(max_entries=10, ttl=60, persistent=True, perceptual=True,
+                                 session_factory=session_factory)
+        cache.perceptual = True
+        return cache
+
+    asyncio.run(make_cache().set(ImageResultCache.key(b"original"), APPLE, phash="ffff0000ffff0000"))
+    # A fresh process: the memory tier is empty
+    cache = make_cache()
+    assert asyncio.run(cache.get(cache.key(b"re-encoded"), phash="ffff0000ffff0000")) == APPLE
+    assert asyncio.run(cache.get(cache.key(b"other"), phash="0000ffff0000ffff")) is None
+    assert cache.get_stats()["perceptual_hits"] == 1
+
+
+def test_stats_require_sign_in(client):
+    assert client.get("/image-cache/stats").status_code == 401
+    response = client.get("/image-cache/stats", headers=auth(signup(client)))
+    assert response.status_code == 200
+    assert "hit_ratio" in response.json()
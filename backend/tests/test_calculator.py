@@ -0,0 +1,43 @@
+import pytest
+from src.calculator.calculators import IntakeCalculator
+from src.calculator.processors import IntakeProcessor
+from src.calculator.schemas import UserInfo
+from src.schemas import UserInfoRequest
+
+COLUMNS = {
+    "owner_id": [1, 2, 3, 4, 5],
+    "height_cm": [180, 165, 172.5, None, 190],
+    "weight_kg": [75, 58, 80, 70, 95],
+    "age": [25, 41, 33, 50, 60],
+    "gender": ["male", "female", "female", "male", "other"],
+    "activity_level": ["low", "medium", "high", "low", "high"],
+}
+
+
+def test_batch_matches_single_row_calculator():
+    result = IntakeProcessor.process_batch(COLUMNS)
+
+    for i in range(3):
+        expected = IntakeCalculator.calculate_daily_intake(UserInfo(**{k: v[i] for k, v in COLUMNS.items()}))
+        assert result.calories[i] == pytest.approx(expected.calories)
+        assert result.fat_g[i] == pytest.approx(expected.fat_g)
+        assert result.sugar_g[i] == pytest.approx(expected.sugar_g)
+        assert result.protein_g[i] == pytest.approx(expected.protein_g)
+
+
+def test_batch_reports_invalid_rows_as_masks():
+    result = IntakeProcessor.process_batch(COLUMNS)
+
+    assert result.valid == [True, True, True, False, False]
+    assert result.errors["height_cm"] == [False, False, False, True, False]
+    assert result.errors["gender"] == [False, False, False, False, True]
+    assert not any(result.errors["activity_level"])
+    assert result.calories[3] is None
+    assert result.protein_g[4] is None
+
+
+@pytest.mark.parametrize("field", ["owner_id", "user_id"])
+def test_intake_request_accepts_user_id_for_owner_id(field):
+    request = UserInfoRequest.model_validate({field: 7, "height_cm": 180, "weight_kg": 75, "age": 25,
+                                              "gender": "male", "activity_level": "low"})
+    assert request.owner_id == 7
@@ -0,0 +1,99 @@
+import asyncio
+import os
+from datetime import datetime
+from sqlalchemy import insert
+from src.models import FoodInfoDB
+from src.schemas import FoodInfo
+from tests.conftest import auth, signup
+
+APPLE = dict(certainty=0.9, food_name="Apple", calories_Kcal=52, fat_in_g=0.2, protein_in_g=0.3, sugar_in_g=10.4)
+
+
+def add_entries(client, owner_id, dates):
+    async def run():
+        async with client.session_factory() as db:
+            await db.execute(insert(FoodInfoDB), [dict(APPLE, owner_id=owner_id, date_created=date_created)
+                                                  for date_created in dates])
+            await db.commit()
+
+    asyncio.run(run())
+
+
+def test_analyzed_image_is_added_to_users_food_log(client, mocker):
+    mock_openai_client = mocker.patch("src.services.AsyncOpenAIClient")
+    mock_openai_client.return_value.process_image = mocker.AsyncMock(return_value=FoodInfo(**APPLE))
+    mock_openai_client.return_value.close = mocker.AsyncMock()
+    token = signup(client)
+
+    response = client.post("/analyze-image", files={"file": ("meal.jpg", os.urandom(1024))}, headers=auth(token))
+    assert response.status_code == 200
+
+    items = client.get("/users/me/food-log", headers=auth(token)).json()["items"]
+    assert [item["food_name"] for item in items] == ["Apple"]
+
+
+def test_food_log_keyset_pagination_and_date_filter(client):
+    token = signup(client)
+    signup(client, "b@example.com")
+    add_entries(client, 1, [datetime(2024, 1, day, 12) for day in range(1, 6)] + [datetime(2024, 1, 3, 12)])
+    add_entries(client, 2, [datetime(2024, 1, 2, 12)])
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2} | ({"cursor": cursor} if cursor else {})
+        page = client.get("/users/me/food-log", params=params, headers=auth(token)).json()
+        seen += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == 6
+    assert len({item["id"] for item in seen}) == 6
+    assert [item["date_created"][:10] for item in seen] == [
+        "2024-01-05", "2024-01-04", "2024-01-03", "2024-01-03", "2024-01-02", "2024-01-01"]
+
+    page = client.get("/users/me/food-log", params={"start": "2024-01-02T00:00:00", "end": "2024-01-04T00:00:00"},
+                      headers=auth(token)).json()
+    assert [item["date_created"][:10] for item in page["items"]] == ["2024-01-03", "2024-01-03", "2024-01-02"]
+
+
+def test_food_log_pages_rows_with_server_default_timestamps(client):
+    token = signup(client)
+
+    async def run():
+        async with client.session_factory() as db:
+            await db.execute(insert(FoodInfoDB), [dict(APPLE, owner_id=1) for _ in range(5)])
+            await db.commit()
+
+    asyncio.run(run())
+    # The stored defaults must compare correctly with the bound cursor and filter values
+    seen, cursor = [], None
+    for _ in range(5):
+        params = {"limit": 2, "start": "2000-01-01T00:00:00"} | ({"cursor": cursor} if cursor else {})
+        page = client.get("/users/me/food-log", params=params, headers=auth(token)).json()
+        seen += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert cursor is None
+    assert sorted(seen) == [1, 2, 3, 4, 5]
+
+
+def test_food_log_aggregates(client):
+    token = signup(client)
+    # 2024-01-01 is a Monday
+    add_entries(client, 1, [datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 19), datetime(2024, 1, 7, 12),
+                            datetime(2024, 1, 8, 12)])
+
+    days = client.get("/users/me/food-log/aggregates", headers=auth(token)).json()
+    assert [(day["period_start"], day["entries"]) for day in days] == [
+        ("2024-01-01", 2), ("2024-01-07", 1), ("2024-01-08", 1)]
+    assert days[0]["calories_Kcal"] == 104
+
+    weeks = client.get("/users/me/food-log/aggregates", params={"period": "week"}, headers=auth(token)).json()
+    assert [(week["period_start"], week["entries"]) for week in weeks] == [("2024-01-01", 3), ("2024-01-08", 1)]
+
+
+def test_food_log_requires_authentication(client):
+    assert client.get("/users/me/food-log").status_code == 401
+    token = signup(client)
+    assert client.get("/users/me/food-log", params={"cursor": "nope"}, headers=auth(token)).status_code == 400
@@ -0,0 +1,48 @@
+import io
+from PIL import Image
+from src.image_preprocessor import ImagePreprocessor
+
+
+def make_jpeg(width, height, orientation=None, quality=95):
+    image = Image.effect_noise((width, height), 60).convert("RGB")
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    exif[0x010F] = "Test camera"
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, exif=exif)
+    return buffer.getvalue()
+
+
+def test_preprocess_downscales_and_strips_exif():
+    original = make_jpeg(2000, 1000)
+    processed = ImagePreprocessor.preprocess(io.BytesIO(original), max_edge=500)
+
+    with Image.open(io.BytesIO(processed)) as image:
+        assert image.format == "JPEG"
+        assert image.size == (500, 250)
+        assert len(image.getexif()) == 0
+    assert len(processed) < len(original)
+
+
+def test_preprocess_applies_orientation():
+    original = make_jpeg(400, 200, orientation=6)
+    processed = ImagePreprocessor.preprocess(io.BytesIO(original), max_edge=1000)
+
+    with Image.open(io.BytesIO(processed)) as image:
+        assert image.size == (200, 400)
+
+
+def test_preprocess_respects_target_bytes():
+    original = make_jpeg(800, 800)
+    unbounded = ImagePreprocessor.preprocess(io.BytesIO(original), max_edge=800, quality=95)
+    bounded = ImagePreprocessor.preprocess(io.BytesIO(original), max_edge=800, quality=95,
+                                           min_quality=30, target_bytes=len(unbounded) // 2)
+    assert len(bounded) < len(unbounded)
+
+
+def test_preprocess_webp():
+    processed = ImagePreprocessor.preprocess(io.BytesIO(make_jpeg(300, 300)), max_edge=100, image_format="webp")
+    with Image.open(io.BytesIO(processed)) as image:
+        assert image.format == "WEBP"
+        assert image.size == (100, 100)
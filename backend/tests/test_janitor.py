@@ -0,0 +1,184 @@
+import asyncio
+import os
+import time
+import pytest
+from openai import AsyncOpenAI
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from benchmarks.openai_stub import StubConfig, create_stub_app, serve_stub
+from src.config import settings
+from src.database import Base
+from src.models import OpenAIResource
+from src.openai_client.client import AsyncOpenAIClient, OpenAIClient
+from src.openai_client.http import create_async_openai
+from src.openai_client.janitor import OpenAIJanitor, openai_janitor
+
+
+@pytest.fixture
+def stub_app(monkeypatch):
+    app = create_stub_app(StubConfig(call_latency=0, run_latency=0.05, poll_after_ms=10))
+    with serve_stub(app=app) as base_url:
+        monkeypatch.setattr(settings, "OPENAI_BASE_URL", base_url)
+        monkeypatch.setattr(settings, "OPENAI_API_KEY", "stub")
+        monkeypatch.setattr(settings, "ASSISTANT_ID", "asst_stub")
+        yield app
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'janitor.db'}")
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'janitor.db'}", poolclass=NullPool)
+    factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    factory.sync = sessionmaker(bind=engine)
+    yield factory
+    engine.dispose()
+
+
+def recorded(session_factory):
+    async def run():
+        async with session_factory() as db:
+            return set((await db.execute(select(OpenAIResource.kind, OpenAIResource.id))).all())
+
+    return asyncio.run(run())
+
+
+def test_analysis_deletes_its_file_and_thread(stub_app, tmp_path):
+    image = tmp_path / "image.jpg"
+    image.write_bytes(os.urandom(1024))
+
+    async def run():
+        client = AsyncOpenAIClient()
+        try:
+            return await client.process_image(str(image))
+        finally:
+            await client.close()
+
+    assert asyncio.run(run()).food_name == "Apple"
+    assert stub_app.state.files == {}
+    assert stub_app.state.threads == set()
+    assert stub_app.state.stats["files_deleted"] == stub_app.state.stats["threads_deleted"] == 1
+
+
+def test_blocking_client_records_its_file_and_thread(stub_app, session_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(openai_janitor, "sync_session_factory", session_factory.sync)
+    image = tmp_path / "image.jpg"
+    image.write_bytes(os.urandom(1024))
+
+    assert OpenAIClient().process_image(str(image)).food_name == "Apple"
+    # Nothing is deleted before the response; the sweep finds both in the table
+    assert len(stub_app.state.files) == len(stub_app.state.threads) == 1
+    [file_id], [thread_id] = stub_app.state.files, stub_app.state.threads
+    assert recorded(session_factory) == {("file", file_id), ("thread", thread_id)}
+
+
+def test_resources_are_recorded_without_inline_cleanup(session_factory, monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_CLEANUP_INLINE", False)
+    janitor = OpenAIJanitor(session_factory=session_factory, requests_per_minute=0)
+
+    async def run():
+        janitor.discard(None, file_id="file-1", thread_id="thread_1")
+        await janitor.flush()
+
+    asyncio.run(run())
+    assert recorded(session_factory) == {("file", "file-1"), ("thread", "thread_1")}
+
+
+def test_failed_deletions_are_recorded(session_factory):
+    janitor = OpenAIJanitor(session_factory=session_factory, requests_per_minute=0)
+
+    async def run():
+        client = AsyncOpenAI(base_url="http://127.0.0.1:9/v1", api_key="stub", max_retries=0)
+        janitor.discard(client, file_id="file-1", thread_id="thread_1")
+        await janitor.flush()
+        await client.close()
+
+    asyncio.run(run())
+    assert recorded(session_factory) == {("file", "file-1"), ("thread", "thread_1")}
+
+
+class BlockedClient:
+    """
+    Deletions wait until `release` is set.
+    """
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.deleted = []
+        self.files = self.beta = self
+        self.threads = self
+
+    async def delete(self, resource_id, timeout=None):
+        await self.release.wait()
+        self.deleted.append(resource_id)
+
+
+def test_inline_deletions_beyond_the_cap_are_recorded(session_factory):
+    janitor = OpenAIJanitor(session_factory=session_factory, requests_per_minute=0, inline_max_pending=2)
+    client = BlockedClient()
+
+    async def run():
+        for i in range(5):
+            janitor.discard(client, file_id=f"file-{i}")
+        await asyncio.sleep(0.1)
+        client.release.set()
+        await janitor.flush()
+
+    asyncio.run(run())
+    assert sorted(client.deleted) == ["file-0", "file-1"]
+    assert recorded(session_factory) == {("file", "file-2"), ("file", "file-3"), ("file", "file-4")}
+    assert janitor._deleting == 0
+
+
+def test_sweep_survives_failing_bookkeeping(session_factory):
+    janitor = OpenAIJanitor(session_factory=session_factory, concurrency=2, requests_per_minute=0)
+    client = BlockedClient()
+    client.release.set()
+
+    async def resources():
+        for i in range(20):
+            yield "thread", f"thread_{i}"
+
+    async def forget(resource):
+        raise RuntimeError("database is gone")
+
+    counts = asyncio.run(asyncio.wait_for(janitor._delete_all(client, resources(), on_deleted=forget), 5))
+    assert counts == (20, 0)
+
+
+def test_sweep_deletes_expired_files_and_recorded_leftovers(stub_app, session_factory):
+    now = int(time.time())
+    files = stub_app.state.files
+    for i in range(250):
+        files[f"file-old{i:03}"] = {"id": f"file-old{i:03}", "object": "file", "bytes": 1, "created_at": now - 7200,
+                                    "filename": "upload", "purpose": "vision", "status": "processed"}
+    files["file-new"] = {**files["file-old000"], "id": "file-new", "created_at": now}
+    files["file-assistant"] = {**files["file-old000"], "id": "file-assistant", "purpose": "assistants"}
+    stub_app.state.threads.add("thread_leftover")
+
+    async def seed():
+        async with session_factory() as db:
+            db.add_all([OpenAIResource(id="thread_leftover", kind="thread"),
+                        OpenAIResource(id="thread_gone", kind="thread")])
+            await db.commit()
+
+    async def run(dry_run):
+        client = create_async_openai()
+        try:
+            janitor = OpenAIJanitor(session_factory=session_factory, retention=3600, concurrency=4,
+                                    requests_per_minute=0)
+            return await janitor.sweep(client, dry_run=dry_run)
+        finally:
+            await client.close()
+
+    asyncio.run(seed())
+    assert asyncio.run(run(dry_run=True)) == {"expired_files": 250, "recorded": 2}
+    assert len(files) == 252
+
+    assert asyncio.run(run(dry_run=False)) == {"files_deleted": 250, "files_failed": 0,
+                                               "recorded_deleted": 2, "recorded_failed": 0}
+    assert set(files) == {"file-new", "file-assistant"}
+    assert stub_app.state.threads == set()
+    assert recorded(session_factory) == set()
@@ -0,0 +1,232 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+import httpx
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from src.database import Base
+from src.config import settings
+from src.jobs import JobQueue, check_webhook_url, get_job_queue, job_status
+from run import backend as app
+from src.models import AnalysisJob, FoodInfoDB
+from src.schemas import FoodInfo
+from tests.conftest import auth, signup
+
+APPLE = FoodInfo(certainty=0.9, food_name="Apple", calories_Kcal=52,
+                 fat_in_g=0.2, protein_in_g=0.3, sugar_in_g=10.4)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "jobs.db"
+
+
+@pytest.fixture
+def session_factory(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def async_session_factory(db_path, session_factory):
+    # NullPool: every asyncio.run() gets its own event loop, so connections
+    # must not outlive it.
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    return async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+
+@pytest.fixture
+def queue(async_session_factory):
+    return JobQueue(session_factory=async_session_factory, workers=1, max_attempts=2, backoff=60)
+
+
+@pytest.fixture
+def openai_client(mocker):
+    mock_openai_client = mocker.patch("src.services.AsyncOpenAIClient")
+    mock_openai_client.return_value.close = mocker.AsyncMock()
+    return mock_openai_client.return_value
+
+
+def enqueue(queue):
+    async def run():
+        async with queue.session_factory() as db:
+            return (await queue.enqueue(db, os.urandom(256), "meal.jpg", "image/jpeg")).id
+
+    return asyncio.run(run())
+
+
+def test_job_completes(queue, session_factory, openai_client, mocker):
+    openai_client.process_image = mocker.AsyncMock(return_value=APPLE)
+    job_id = enqueue(queue)
+
+    assert asyncio.run(queue.process_next()) is True
+
+    with session_factory() as db:
+        job = db.get(AnalysisJob, job_id)
+        assert job.status == "completed"
+        assert job.attempts == 1
+        assert job.result["food_name"] == "Apple"
+        assert job.image is None
+        assert db.query(FoodInfoDB).count() == 1
+    assert asyncio.run(queue.process_next()) is False
+
+
+def test_result_is_kept_when_the_food_log_write_fails(queue, session_factory, openai_client, mocker):
+    openai_client.process_image = mocker.AsyncMock(return_value=APPLE)
+    mocker.patch("src.jobs.store_food_info", side_effect=HTTPException(status_code=500, detail="Internal server error"))
+    job_id = enqueue(queue)
+
+    asyncio.run(queue.process_next())
+
+    with session_factory() as db:
+        job = db.get(AnalysisJob, job_id)
+        assert (job.status, job.attempts, job.error_status_code) == ("completed", 1, 500)
+        assert job.result["food_name"] == "Apple"
+        assert job.error == "Result could not be added to the food log"
+    openai_client.process_image.assert_called_once()
+
+def test_transient_failure_is_retried_with_backoff(queue, session_factory, openai_client, mocker):
+    openai_client.process_image = mocker.AsyncMock(
+        side_effect=HTTPException(status_code=503, detail="OpenAI is unreachable"))
+    job_id = enqueue(queue)
+
+    asyncio.run(queue.process_next())
+
+    with session_factory() as db:
+        job = db.get(AnalysisJob, job_id)
+        assert job.status == "pending"
+        assert job.error_status_code == 503
+        assert job.next_attempt_at > datetime.now(timezone.utc).replace(tzinfo=None)
+        assert job.image is not None
+    # Not due yet
+    assert asyncio.run(queue.process_next()) is False
+
+    with session_factory() as db:
+        db.get(AnalysisJob, job_id).next_attempt_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.commit()
+    asyncio.run(queue.process_next())
+
+    with session_factory() as db:
+        job = db.get(AnalysisJob, job_id)
+        assert job.status == "failed"
+        assert job.attempts == 2
+
+
+def test_permanent_failure_is_not_retried(queue, session_factory, openai_client, mocker):
+    openai_client.process_image = mocker.AsyncMock(
+        side_effect=HTTPException(status_code=422, detail="Invalid JSON format."))
+    job_id = enqueue(queue)
+
+    asyncio.run(queue.process_next())
+
+    with session_factory() as db:
+        job = db.get(AnalysisJob, job_id)
+        assert job.status == "failed"
+        assert job.attempts == 1
+        assert job.error == "Invalid JSON format."
+
+
+def make_stale(session_factory, queue, job_id, attempts):
+    with session_factory() as db:
+        job = db.get(AnalysisJob, job_id)
+        job.status = "running"
+        job.attempts = attempts
+        db.commit()
+        db.query(AnalysisJob).update({"date_last_updated": datetime.now(timezone.utc)
+                                      - timedelta(seconds=queue.stale_after + 1)})
+        db.commit()
+
+
+def test_stale_running_job_is_reclaimed(queue, session_factory, openai_client, mocker):
+    openai_client.process_image = mocker.AsyncMock(return_value=APPLE)
+    job_id = enqueue(queue)
+    make_stale(session_factory, queue, job_id, attempts=1)
+
+    assert asyncio.run(queue.process_next()) is True
+
+    with session_factory() as db:
+        assert db.get(AnalysisJob, job_id).status == "completed"
+
+
+def test_stale_job_without_attempts_left_fails(queue, session_factory, openai_client, mocker):
+    openai_client.process_image = mocker.AsyncMock(return_value=APPLE)
+    job_id = enqueue(queue)
+    make_stale(session_factory, queue, job_id, attempts=queue.max_attempts)
+
+    assert asyncio.run(queue.process_next()) is False
+
+    with session_factory() as db:
+        job = db.get(AnalysisJob, job_id)
+        assert (job.status, job.attempts, job.error_status_code) == ("failed", 2, 504)
+        assert job.image is None
+    openai_client.process_image.assert_not_called()
+
+
+@pytest.mark.parametrize("url", ["http://example.com/hook", "https://127.0.0.1/hook", "https://localhost/hook",
+                                 "https://10.0.0.8/hook", "https://169.254.169.254/latest/meta-data",
+                                 "https://[::ffff:192.168.0.1]/hook", "https:///hook"])
+def test_webhook_url_must_be_https_and_public(url):
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(check_webhook_url(url))
+    assert excinfo.value.status_code == 400
+
+
+def test_webhook_allow_list(monkeypatch):
+    assert asyncio.run(check_webhook_url("https://93.184.216.34/hook")) == "https://93.184.216.34/hook"
+
+    monkeypatch.setattr(settings, "WEBHOOK_ALLOWED_HOSTS", "hooks.example.com, internal.local")
+    assert asyncio.run(check_webhook_url("https://internal.local/hook")) == "https://internal.local/hook"
+    with pytest.raises(HTTPException):
+        asyncio.run(check_webhook_url("https://93.184.216.34/hook"))
+
+
+def test_webhook_is_sent_to_the_checked_address(queue, session_factory, monkeypatch, mocker):
+    lookups = iter([["93.184.216.34"], ["127.0.0.1"]])
+    monkeypatch.setattr("socket.getaddrinfo", lambda host, port, *args, **kwargs:
+                        [(2, 1, 6, "", (address, port)) for address in next(lookups)])
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(204)
+
+    client = httpx.AsyncClient
+    mocker.patch("src.jobs.httpx.AsyncClient",
+                 lambda **kwargs: client(transport=httpx.MockTransport(handler), **kwargs))
+    job_id = enqueue(queue)
+    with session_factory() as db:
+        status = job_status(db.get(AnalysisJob, job_id))
+
+    # A host rebinding to a private address after the check is not called
+    asyncio.run(queue._notify("https://hooks.example.com:8443/job?x=1", status))
+    asyncio.run(queue._notify("https://hooks.example.com/job", status))
+
+    assert len(requests) == 1
+    assert str(requests[0].url) == "https://93.184.216.34:8443/job?x=1"
+    assert requests[0].headers["host"] == "hooks.example.com:8443"
+    assert requests[0].extensions["sni_hostname"] == "hooks.example.com"
+
+def test_jobs_are_only_visible_to_their_owner(client, openai_client):
+    owner, other = signup(client), signup(client, "b@example.com")
+    app.dependency_overrides[get_job_queue] = lambda: JobQueue(session_factory=client.session_factory, workers=1)
+    try:
+        response = client.post("/analyze-image?async_job=true", files={"file": ("meal.jpg", os.urandom(1024))},
+                               data={"webhook_url": "https://93.184.216.34/hook"}, headers=auth(owner))
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+
+        assert client.get(f"/jobs/{job_id}", headers=auth(owner)).status_code == 200
+        assert client.get(f"/jobs/{job_id}", headers=auth(other)).status_code == 404
+        assert client.get(f"/jobs/{job_id}").status_code == 404
+
+        response = client.post("/analyze-image?async_job=true", files={"file": ("meal.jpg", os.urandom(1024))},
+                               data={"webhook_url": "https://192.168.1.1/hook"}, headers=auth(owner))
+        assert response.status_code == 400
+    finally:
+        del app.dependency_overrides[get_job_queue]
@@ -0,0 +1,64 @@
+import json
+import logging
+import queue
+from src.logger import JsonFormatter, NonBlockingQueueHandler, request_id, truncate
+
+
+def make_record(message, *args, **extra):
+    record = logging.LogRecord("src.test", logging.ERROR, __file__, 1, message, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_request_id_and_extra_fields():
+    record = make_record("Job %s failed", 7, request_id="abc", job_id=7)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Job 7 failed"
+    assert entry["level"] == "ERROR"
+    assert entry["logger"] == "src.test"
+    assert entry["request_id"] == "abc"
+    assert entry["job_id"] == 7
+
+
+def test_long_messages_are_truncated(monkeypatch):
+    monkeypatch.setattr("src.logger.settings.LOG_MAX_MESSAGE_CHARS", 10)
+    entry = json.loads(JsonFormatter().format(make_record("The response was: %s", "x" * 1000)))
+    assert entry["message"] == "The respon... [1008 chars truncated]"
+    assert truncate("short", 10) == "short"
+
+
+def test_handler_snapshots_args_without_formatting_and_drops_when_full(monkeypatch):
+    monkeypatch.setattr("src.logger.settings.LOG_MAX_MESSAGE_CHARS", 20)
+    log_queue = queue.Queue(maxsize=1)
+    handler = NonBlockingQueueHandler(log_queue)
+    payload = ["large", "object"]
+    token = request_id.set("req-1")
+    try:
+        for _ in range(3):
+            handler.emit(make_record("payload %s, %d, %.1f", payload, 3, 1.5))
+    finally:
+        request_id.reset(token)
+    payload.append("x" * 1000)
+
+    record = log_queue.get_nowait()
+    assert record.msg == "payload %s, %d, %.1f"
+    assert record.args == ("['large', 'object']", 3, 1.5)
+    assert record.getMessage() == "payload ['large', 'object'], 3, 1.5"
+    assert record.request_id == "req-1"
+    assert handler.dropped == 2
+
+    handler.emit(make_record("after the storm"))
+    assert log_queue.get_nowait().dropped_records == 2
+    assert handler.dropped == 0
+
+
+def test_request_id_is_echoed(client):
+    assert client.get("/ping", headers={"X-Request-ID": "trace-1"}).headers["x-request-id"] == "trace-1"
+    assert len(client.get("/ping").headers["x-request-id"]) == 32
+
+
+def test_handler_truncates_long_args(monkeypatch):
+    monkeypatch.setattr("src.logger.settings.LOG_MAX_MESSAGE_CHARS", 10)
+    log_queue = queue.Queue()
+    NonBlockingQueueHandler(log_queue).emit(make_record("The response was: %s", "x" * 1000))
+    assert log_queue.get_nowait().args == ("xxxxxxxxxx... [990 chars truncated]",)
@@ -0,0 +1,53 @@
+import asyncio
+from prometheus_client import REGISTRY
+from src.metrics import statement_operation
+from src.openai_client.client import AsyncOpenAIClient
+from tests.conftest import signup
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_request_latency_is_labelled_by_route_template(client):
+    before = sample("http_request_duration_seconds_count", method="GET", route="/jobs/{job_id}", status="404")
+    client.get("/jobs/does-not-exist")
+    client.get("/jobs/also-missing")
+    assert sample("http_request_duration_seconds_count",
+                  method="GET", route="/jobs/{job_id}", status="404") == before + 2
+
+
+def test_metrics_endpoint_reports_database_timings(client):
+    before = sample("db_commit_duration_seconds_count")
+    signup(client)
+    assert sample("db_commit_duration_seconds_count") > before
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'db_query_duration_seconds_count{operation="INSERT"}' in body
+    assert 'db_pool_connections{state="checked_out"}' in body
+    assert 'http_request_duration_seconds_count{method="POST",route="/users",status="200"}' in body
+
+
+def test_openai_stages_are_timed(stub_openai, image_path):  # noqa: F811
+    before = sample("openai_stage_duration_seconds_count", stage="run_poll")
+
+    async def run():
+        client = AsyncOpenAIClient()
+        try:
+            return await client.process_image(image_path)
+        finally:
+            await client.close()
+
+    asyncio.run(run())
+    for stage in ("thread_create", "upload", "message_create", "list_messages", "parse"):
+        assert sample("openai_stage_duration_seconds_count", stage=stage) > 0
+    assert sample("openai_stage_duration_seconds_count", stage="run_poll") == before + 1
+
+
+def test_statement_operation():
+    assert statement_operation("  select 1") == "SELECT"
+    assert statement_operation("INSERT INTO food_info VALUES (?)") == "INSERT"
+    assert statement_operation("PRAGMA foreign_keys") == "OTHER"
@@ -0,0 +1,111 @@
+import csv
+import pytest
+from src.nutrition_reference import NutritionReference, convert_usda, nutrition_reference, trigrams
+from src.response_processor import ResponseProcessor
+from src.schemas import FoodInfo
+
+
+def test_trigrams_pad_each_word():
+    assert trigrams("Ab, c") == {"  a", " ab", "ab ", "  c", " c "}
+
+
+def test_search_ranks_by_similarity_and_matches_aliases():
+    results = nutrition_reference.search("greek yoghurt", limit=2)
+    assert [food.food_name for food, _ in results] == ["Greek yogurt", "Plain yogurt"]
+    assert results[0][1] > results[1][1]
+
+    food, similarity = nutrition_reference.search("fries", limit=1)[0]
+    assert (food.food_name, similarity) == ("French fries", 1)
+    assert nutrition_reference.search("xyzzy") == []
+
+
+def test_correct_keeps_calories_and_takes_macros_from_reference():
+    food = FoodInfo(certainty=0.8, food_name="Grilled chicken breast", calories_Kcal=330,
+                    fat_in_g=20, protein_in_g=10, sugar_in_g=5)
+    corrected = nutrition_reference.correct(food)
+    # 330 kcal of chicken breast (165 kcal / 100 g) is 200 g
+    assert corrected.model_dump() == {"certainty": 0.8, "food_name": "Grilled chicken breast",
+                                      "calories_Kcal": 330, "fat_in_g": 7.14, "protein_in_g": 62.04,
+                                      "sugar_in_g": 0}
+
+    unknown = food.model_copy(update={"food_name": "Mystery stew"})
+    assert nutrition_reference.correct(unknown) == unknown
+    no_calories = food.model_copy(update={"calories_Kcal": 0})
+    assert nutrition_reference.correct(no_calories) == no_calories
+
+
+@pytest.mark.parametrize("food_name", ["Apple pie", "Chocolate cake", "Chicken nuggets", "Grilled chicken"])
+def test_correct_leaves_dishes_named_like_an_ingredient_alone(food_name):
+    food = FoodInfo(certainty=0.8, food_name=food_name, calories_Kcal=300, fat_in_g=12, protein_in_g=8,
+                    sugar_in_g=20)
+    assert nutrition_reference.correct(food) == food
+
+
+def test_match_takes_exact_names_and_aliases():
+    assert nutrition_reference.match("Red  apple!").food_name == "Apple"
+    assert nutrition_reference.match("chocolate").food_name == "Milk chocolate"
+    assert nutrition_reference.match("Chocolate cake") is None
+
+
+def test_process_response_corrects_each_food_before_combining():
+    content = '''[
+        {"certainty": 0.9, "food_name": "Apple", "calories_Kcal": 104,
+         "fat_in_g": 1, "protein_in_g": 1, "sugar_in_g": 1},
+        {"certainty": 0.7, "food_name": "Banana", "calories_Kcal": 89,
+         "fat_in_g": 1, "protein_in_g": 1, "sugar_in_g": 1}
+    ]'''
+    assert ResponseProcessor.process_response(content).sugar_in_g == 2
+    result = ResponseProcessor.process_response(content, correct=True)
+    assert result.calories_Kcal == 193
+    assert result.sugar_in_g == pytest.approx(2 * 10.39 + 12.23)
+
+
+def test_convert_usda(tmp_path):
+    with open(tmp_path / "food.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("fdc_id", "data_type", "description"))
+        writer.writerows([("1", "sr_legacy_food", "Apples, raw, with skin"),
+                          ("2", "branded_food", "APPLE CHIPS"),
+                          ("3", "sr_legacy_food", "Salt, table")])
+    with open(tmp_path / "food_nutrient.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("id", "fdc_id", "nutrient_id", "amount"))
+        writer.writerows([("1", "1", "1008", "52"), ("2", "1", "1004", "0.17"), ("3", "1", "1003", "0.26"),
+                          ("4", "1", "2000", "10.39"), ("5", "2", "1008", "500"), ("6", "3", "1008", "0")])
+
+    output = tmp_path / "reference.csv"
+    assert convert_usda(tmp_path, output) == 1
+    reference = NutritionReference(output)
+    food, similarity = reference.search("raw apples", limit=1)[0]
+    assert (food.food_name, food.calories_Kcal, food.sugar_in_g) == ("Apples, raw, with skin", 52, 10.39)
+
+
+class CountingList(list):
+    def __init__(self, items):
+        super().__init__(items)
+        self.reads = 0
+
+    def __getitem__(self, index):
+        self.reads += 1
+        return super().__getitem__(index)
+
+
+def test_search_work_is_bounded_on_a_large_table(tmp_path):
+    # Every name shares "raw" and "with salt"; "yoghurt" is rare
+    path = tmp_path / "reference.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("food_name", "aliases", "calories_Kcal", "fat_in_g", "protein_in_g", "sugar_in_g"))
+        writer.writerows((f"Food {i}, raw, with salt", "", 100, 1, 1, 1) for i in range(20_000))
+        writer.writerows((f"Greek yoghurt {i}, raw", "", 60, 1, 1, 1) for i in range(50))
+    bounded = NutritionReference(path, max_postings=500, max_candidates=50)
+    unbounded = NutritionReference(path, max_postings=10 ** 6, max_candidates=10 ** 6)
+    bounded.load()
+    bounded._names = CountingList(bounded._names)
+
+    assert bounded.search("greek yoghurt raw", limit=3) == unbounded.search("greek yoghurt raw", limit=3)
+    assert bounded._names.reads <= 500 + 50
+
+    bounded._names.reads = 0
+    assert len(bounded.search("raw with salt", limit=3)) == 3
+    assert bounded._names.reads <= 500 + 50
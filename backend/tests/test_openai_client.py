@@ -0,0 +1,130 @@
+import asyncio
+import os
+import time
+from itertools import islice
+import pytest
+from fastapi import HTTPException
+from benchmarks.openai_stub import StubConfig, create_stub_app, serve_stub
+from src.config import settings
+from src.openai_client.client import AsyncOpenAIClient, OpenAIClient, RunDurationEstimate
+from src.openai_client.vision import AsyncVisionClient, FOOD_INFO_SCHEMA
+from src.schemas import FoodInfo
+
+
+def test_async_process_image(stub_openai, image_path):
+    async def run():
+        client = AsyncOpenAIClient()
+        try:
+            return await client.process_image(image_path)
+        finally:
+            await client.close()
+
+    food_info = asyncio.run(run())
+    assert food_info.food_name == "Apple"
+    assert food_info.calories_Kcal == 52
+
+
+def test_async_process_image_runs_concurrently(stub_openai, image_path):
+    async def run():
+        client = AsyncOpenAIClient()
+        try:
+            started = time.perf_counter()
+            results = await asyncio.gather(*(client.process_image(image_path) for _ in range(10)))
+            return results, time.perf_counter() - started
+        finally:
+            await client.close()
+
+    results, elapsed = asyncio.run(run())
+    assert len(results) == 10
+    # Ten serial runs would take at least 10 * run_latency.
+    assert elapsed < 10 * stub_openai.run_latency / 2
+
+
+def test_vision_process_image(stub_openai):
+    async def run():
+        client = AsyncVisionClient()
+        try:
+            return await client.process_image(("image.jpg", os.urandom(1024), "image/jpeg"))
+        finally:
+            await client.close()
+
+    food_info = asyncio.run(run())
+    assert food_info.food_name == "Apple"
+    assert food_info.sugar_in_g == 10.4
+
+
+def test_vision_schema_matches_food_info():
+    assert set(FOOD_INFO_SCHEMA["required"]) == set(FoodInfo.model_fields)
+    assert FOOD_INFO_SCHEMA["properties"]["food_name"] == {"type": "string"}
+    assert FOOD_INFO_SCHEMA["properties"]["calories_Kcal"] == {"type": "number"}
+    assert FOOD_INFO_SCHEMA["additionalProperties"] is False
+
+
+@pytest.fixture
+def stuck_openai(monkeypatch):
+    app = create_stub_app(StubConfig(call_latency=0, run_latency=3600))
+    with serve_stub(app=app) as base_url:
+        monkeypatch.setattr(settings, "OPENAI_BASE_URL", base_url)
+        monkeypatch.setattr(settings, "OPENAI_API_KEY", "stub")
+        monkeypatch.setattr(settings, "ASSISTANT_ID", "asst_stub")
+        yield app.state.stats
+
+
+def test_async_run_past_deadline_is_cancelled(stuck_openai, image_path):
+    async def run():
+        client = AsyncOpenAIClient()
+        try:
+            return await client.process_image(image_path, deadline=time.monotonic() + 0.5)
+        finally:
+            await client.close()
+
+    started = time.monotonic()
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(run())
+    assert excinfo.value.status_code == 504
+    assert time.monotonic() - started < 2
+    assert stuck_openai["cancelled"] == 1
+
+
+def test_sync_run_past_deadline_is_cancelled(stuck_openai, image_path):
+    client = OpenAIClient()
+    try:
+        with pytest.raises(HTTPException) as excinfo:
+            client.process_image(image_path, deadline=time.monotonic() + 0.5)
+    finally:
+        client.close()
+    assert excinfo.value.status_code == 504
+    assert stuck_openai["cancelled"] == 1
+
+
+def test_poll_intervals_back_off_to_cap(monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_POLL_INITIAL_SECONDS", 0.2)
+    monkeypatch.setattr(settings, "OPENAI_POLL_BACKOFF", 2)
+    monkeypatch.setattr(settings, "OPENAI_POLL_MAX_SECONDS", 1)
+    estimate = RunDurationEstimate(weight=0.5)
+    assert list(islice(estimate.poll_intervals(), 5)) == [0.2, 0.4, 0.8, 1, 1]
+
+    estimate.update(4)
+    estimate.update(2)
+    assert estimate.seconds == 3
+    assert list(islice(estimate.poll_intervals(), 3)) == [pytest.approx(2.7), 0.2, 0.4]
+
+
+def test_stub_injects_errors_per_endpoint(monkeypatch, image_path):
+    config = StubConfig(call_latency=0, endpoint_latency={"create_file": 0.2}, error_rates={"create_run": 1})
+    app = create_stub_app(config)
+    with serve_stub(app=app) as base_url:
+        monkeypatch.setattr(settings, "OPENAI_BASE_URL", base_url)
+        monkeypatch.setattr(settings, "OPENAI_API_KEY", "stub")
+        monkeypatch.setattr(settings, "OPENAI_MAX_RETRIES", 0)
+        client = OpenAIClient()
+        try:
+            started = time.monotonic()
+            client.upload_file(image_path)
+            assert time.monotonic() - started >= 0.2
+            with pytest.raises(HTTPException) as excinfo:
+                client.process_image(image_path)
+        finally:
+            client.close()
+    assert excinfo.value.status_code == 502
+    assert app.state.stats["errors"] == 1
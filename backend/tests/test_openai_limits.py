@@ -0,0 +1,187 @@
+import asyncio
+import time
+import httpx
+import openai
+import pytest
+from fastapi import HTTPException
+from src.openai_client.client import to_http_exception
+from src.openai_client.limits import AdaptiveLimiter, CircuitBreaker, OpenAIGuard, TokenBucket, retry_after_seconds
+
+
+def make_guard(retries=2, failures=3, reset=60.0, initial=4):
+    return OpenAIGuard(AdaptiveLimiter(initial, 1, 8), CircuitBreaker(failures, reset), TokenBucket(0),
+                       TokenBucket(0), retries=retries, backoff=0.01, backoff_max=0.02, retry_after_max=1,
+                       queue_timeout=0.05)
+
+
+def failing(*status_codes, headers=None):
+    """
+    Analysis failing with the given status codes in turn, then succeeding.
+    """
+    calls = []
+
+    async def analyze():
+        calls.append(time.monotonic())
+        if len(calls) <= len(status_codes):
+            raise HTTPException(status_code=status_codes[len(calls) - 1], headers=headers)
+        return "ok"
+
+    analyze.calls = calls
+    return analyze
+
+
+def test_limiter_halves_once_per_incident_and_grows_back():
+    async def run():
+        limiter = AdaptiveLimiter(8, 1, 16)
+        slots = [await limiter.acquire(1) for _ in range(3)]
+        for started in slots:
+            await limiter.release(started, overloaded=True)
+        assert limiter.limit == 4
+        for _ in range(4):
+            await limiter.release(await limiter.acquire(1), overloaded=False)
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert 4.9 < limiter.limit < 5
+    assert limiter.in_flight == 0
+
+
+def test_limiter_rejects_when_queue_wait_times_out():
+    async def run():
+        limiter = AdaptiveLimiter(1, 1, 1)
+        await limiter.acquire(1)
+        await limiter.acquire(0.01)
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(run())
+    assert excinfo.value.status_code == 503
+    assert "Retry-After" in excinfo.value.headers
+
+
+def test_guard_retries_transient_failures():
+    analyze = failing(502, 503)
+    guard = make_guard()
+    assert asyncio.run(guard.call(analyze)) == "ok"
+    assert len(analyze.calls) == 3
+    # Only the 503 signals overload; the success then adds 1/limit
+    assert guard.limiter.limit == 2.5
+    assert guard.limiter.in_flight == 0
+
+
+def test_guard_does_not_retry_client_errors():
+    analyze = failing(422)
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(make_guard().call(analyze))
+    assert excinfo.value.status_code == 422
+    assert len(analyze.calls) == 1
+
+
+def test_guard_waits_for_retry_after():
+    analyze = failing(429, headers={"Retry-After": "0.2"})
+    guard = make_guard()
+    assert asyncio.run(guard.call(analyze)) == "ok"
+    assert analyze.calls[1] - analyze.calls[0] >= 0.2
+    # Rate limits shrink the cap but say nothing about upstream health
+    assert guard.breaker.failures == 0
+
+
+def test_guard_passes_long_retry_after_on():
+    analyze = failing(429, headers={"Retry-After": "120"})
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(make_guard().call(analyze))
+    assert excinfo.value.status_code == 429
+    assert len(analyze.calls) == 1
+
+
+def test_circuit_opens_fails_fast_and_closes_after_trial():
+    guard = make_guard(retries=0, failures=2, reset=0.1)
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            asyncio.run(guard.call(failing(502)))
+    assert guard.breaker.state == "open"
+
+    analyze = failing()
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(guard.call(analyze))
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.headers["Retry-After"] == "1"
+    assert analyze.calls == []
+
+    time.sleep(0.1)
+    assert guard.breaker.state == "half-open"
+    assert asyncio.run(guard.call(analyze)) == "ok"
+    assert guard.breaker.state == "closed"
+
+
+def test_cancelled_trial_lets_the_next_call_through():
+    guard = make_guard(retries=0, failures=1, reset=0.05)
+    with pytest.raises(HTTPException):
+        asyncio.run(guard.call(failing(502)))
+    time.sleep(0.05)
+
+    async def cancel_trial():
+        trial = asyncio.create_task(guard.call(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+    asyncio.run(cancel_trial())
+    assert guard.breaker.state == "half-open"
+    assert guard.limiter.in_flight == 0
+    assert asyncio.run(guard.call(failing())) == "ok"
+    assert guard.breaker.state == "closed"
+
+
+def test_queue_timeout_does_not_take_the_trial():
+    guard = make_guard(retries=0, failures=1, reset=0.05, initial=1)
+    with pytest.raises(HTTPException):
+        asyncio.run(guard.call(failing(502)))
+    time.sleep(0.05)
+
+    async def run():
+        await guard.limiter.acquire(1)
+        with pytest.raises(HTTPException) as excinfo:
+            await guard.call(failing())
+        assert excinfo.value.detail == "Too many image analyses in progress"
+        await guard.limiter.release(time.monotonic(), None)
+        return await guard.call(failing())
+
+    assert asyncio.run(run()) == "ok"
+
+
+def test_guard_works_across_event_loops():
+    guard = make_guard(initial=1)
+
+    async def run():
+        async def analyze():
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        # Contention makes the limiter and buckets wait on their primitives
+        guard.queue_timeout = 1
+        return await asyncio.gather(*(guard.call(analyze) for _ in range(3)))
+
+    guard.requests = TokenBucket(6000)
+    for _ in range(2):
+        assert asyncio.run(run()) == ["ok"] * 3
+
+
+def test_token_bucket_spaces_out_requests():
+    async def run():
+        bucket = TokenBucket(600)
+        await bucket.acquire(600)
+        started = time.monotonic()
+        await bucket.acquire(2)
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.15
+
+
+def test_rate_limit_error_keeps_retry_after():
+    response = httpx.Response(429, headers={"retry-after": "3"}, request=httpx.Request("POST", "https://api.test"))
+    error = to_http_exception(openai.RateLimitError("slow down", response=response, body=None))
+    assert error.status_code == 429
+    assert retry_after_seconds(error.headers) == 3
+    assert retry_after_seconds({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+    assert retry_after_seconds(None) is None
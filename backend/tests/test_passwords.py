@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+from passlib.hash import bcrypt
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from src.config import settings
+from src.database import Base
+from src.models import User
+from src.passwords import hash_password, needs_rehash, verify_password
+from src.services import authenticate_user
+
+
+@pytest.fixture(autouse=True)
+def low_cost(monkeypatch):
+    monkeypatch.setattr(settings, "PASSWORD_BCRYPT_ROUNDS", 4)
+
+
+def test_hash_and_verify():
+    hashed = asyncio.run(hash_password("secret"))
+    assert bcrypt.from_string(hashed).rounds == 4
+    assert asyncio.run(verify_password("secret", hashed)) == (True, None)
+    assert asyncio.run(verify_password("wrong", hashed)) == (False, None)
+
+
+def test_verify_returns_new_hash_when_cost_changed():
+    hashed = bcrypt.using(rounds=5).hash("secret")
+    assert needs_rehash(hashed)
+
+    valid, new_hash = asyncio.run(verify_password("secret", hashed))
+    assert valid
+    assert bcrypt.from_string(new_hash).rounds == 4
+    assert bcrypt.verify("secret", new_hash)
+
+
+def test_authenticate_user_upgrades_hash(tmp_path):
+    db_path = tmp_path / "users.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add(User(email="a@example.com", hashed_password=bcrypt.using(rounds=5).hash("secret")))
+        db.commit()
+    session_factory = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool),
+                                         expire_on_commit=False)
+
+    async def login(password):
+        async with session_factory() as db:
+            return await authenticate_user("a@example.com", password, db)
+
+    assert asyncio.run(login("wrong")) is False
+    assert asyncio.run(login("secret"))
+    with sessionmaker(bind=engine)() as db:
+        stored = db.query(User).one().hashed_password
+    assert bcrypt.from_string(stored).rounds == 4
+    engine.dispose()
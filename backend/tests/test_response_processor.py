@@ -79,3 +79,44 @@ def test_process_response_extra_text():
     assert result.fat_in_g == 0.2
     assert result.protein_in_g == 0.3
     assert result.sugar_in_g == 10.4
+
+def test_process_response_nested_braces_in_prose_and_strings():
+    content = '''
+    Here you go {"note": "ignore the } in this string",
+    "certainty": 0.8, "food_name": "Soup {tomato}", "calories_Kcal": 90,
+    "fat_in_g": 3, "protein_in_g": 2, "sugar_in_g": 6, "extra": {"a": [1, 2]}}
+    Anything else?
+    '''
+    result = ResponseProcessor.process_response(content)
+    assert result.food_name == "Soup {tomato}"
+    assert result.calories_Kcal == 90
+
+def test_process_response_list_of_foods_is_combined():
+    content = '''
+    [INFO] Two foods found:
+    [
+        {"certainty": 0.9, "food_name": "Apple", "calories_Kcal": 52,
+         "fat_in_g": 0.2, "protein_in_g": 0.3, "sugar_in_g": 10.4},
+        {"certainty": 0.7, "food_name": "Banana", "calories_Kcal": 89,
+         "fat_in_g": 0.3, "protein_in_g": 1.1, "sugar_in_g": 12.2}
+    ]
+    '''
+    foods = ResponseProcessor.parse_foods(content)
+    assert [food.food_name for food in foods] == ["Apple", "Banana"]
+
+    result = ResponseProcessor.process_response(content)
+    assert result.food_name == "Apple, Banana"
+    assert result.certainty == 0.7
+    assert result.calories_Kcal == 141
+    assert result.sugar_in_g == pytest.approx(22.6)
+
+def test_process_response_numeric_strings_are_accepted():
+    content = '''{"certainty": "0.9", "food_name": "Apple", "calories_Kcal": "52",
+    "fat_in_g": 0.2, "protein_in_g": 0.3, "sugar_in_g": 10.4}'''
+    assert ResponseProcessor.process_response(content).calories_Kcal == 52
+
+def test_process_response_malformed_balanced_json():
+    with pytest.raises(HTTPException) as excinfo:
+        ResponseProcessor.process_response('{"food_name": "Apple",}')
+    assert excinfo.value.status_code == 422
+    assert "Invalid JSON format" in excinfo.value.detail
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import warnings
+from datetime import datetime
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SADeprecationWarning
+from src.models import DailyNutritionRollup, FoodInfoDB
+from src.rollups import rebuild_daily_rollups, update_daily_rollups
+from src.schemas import FoodInfo
+from tests.conftest import auth, signup
+
+APPLE = dict(certainty=0.9, food_name="Apple", calories_Kcal=52, fat_in_g=0.2, protein_in_g=0.3, sugar_in_g=10.4)
+PROFILE = dict(owner_id=1, height_cm=180, weight_kg=75, age=25, gender="male", activity_level="low")
+
+
+def test_rollup_is_updated_on_each_logged_meal(client, mocker):
+    mock_openai_client = mocker.patch("src.services.AsyncOpenAIClient")
+    mock_openai_client.return_value.process_image = mocker.AsyncMock(return_value=FoodInfo(**APPLE))
+    mock_openai_client.return_value.close = mocker.AsyncMock()
+    token = signup(client)
+    target = client.post("/calculate-intake", json=PROFILE).json()
+
+    for _ in range(2):
+        response = client.post("/analyze-image", files={"file": ("meal.jpg", os.urandom(1024))},
+                               headers=auth(token))
+        assert response.status_code == 200
+
+    [today] = client.get("/users/me/nutrition", headers=auth(token)).json()
+    assert today["entries"] == 2
+    assert today["consumed"]["calories_Kcal"] == 104
+    assert today["target"]["calories_Kcal"] == pytest.approx(target["calories"])
+    assert today["remaining"]["calories_Kcal"] == pytest.approx(target["calories"] - 104)
+    assert today["remaining"]["protein_in_g"] == pytest.approx(target["protein_g"] - 0.6)
+
+
+def test_days_without_meals_or_target(client):
+    token = signup(client)
+    days = client.get("/users/me/nutrition", params={"start": "2024-01-01", "end": "2024-01-03"},
+                      headers=auth(token)).json()
+    assert [day["day"] for day in days] == ["2024-01-01", "2024-01-02", "2024-01-03"]
+    assert all(day["entries"] == 0 and day["target"] is None and day["remaining"] is None for day in days)
+
+    response = client.get("/users/me/nutrition", params={"start": "2024-01-03", "end": "2024-01-01"},
+                          headers=auth(token))
+    assert response.status_code == 400
+
+
+def test_rebuild_backfills_rollups(client):
+    token = signup(client)
+
+    async def backfill():
+        async with client.session_factory() as db:
+            await db.execute(insert(FoodInfoDB), [
+                dict(APPLE, owner_id=1, date_created=datetime(2024, 1, 1, 8)),
+                dict(APPLE, owner_id=1, date_created=datetime(2024, 1, 1, 20)),
+                dict(APPLE, owner_id=1, date_created=datetime(2024, 1, 2, 12)),
+            ])
+            await db.commit()
+            first = await rebuild_daily_rollups(db)
+            # Idempotent: rebuilding replaces instead of adding up
+            second = await rebuild_daily_rollups(db, owner_id=1, start=datetime(2024, 1, 1).date())
+            return first, second
+
+    assert asyncio.run(backfill()) == (2, 2)
+    days = client.get("/users/me/nutrition", params={"start": "2024-01-01", "end": "2024-01-02"},
+                      headers=auth(token)).json()
+    assert [(day["entries"], day["consumed"]["calories_Kcal"]) for day in days] == [(2, 104), (1, 52)]
+
+
+def test_rollup_day_of_defaulted_timestamp_is_the_stored_one(client):
+    signup(client)
+
+    async def run():
+        async with client.session_factory() as db:
+            await db.execute(insert(FoodInfoDB), [dict(APPLE, owner_id=1)])
+            await update_daily_rollups(db, [dict(APPLE, owner_id=1)])
+            await db.commit()
+            stored = await db.scalar(select(FoodInfoDB.date_created))
+            rollup = (await db.scalars(select(DailyNutritionRollup))).one()
+            with warnings.catch_warnings():
+                warnings.simplefilter("error", SADeprecationWarning)
+                rebuilt = await rebuild_daily_rollups(db)
+            return stored, rollup.day, rebuilt
+
+    stored, day, rebuilt = asyncio.run(run())
+    assert day == stored.date()
+    assert rebuilt == 1
@@ -1,27 +1,36 @@
+import asyncio
+import io
 import os
+import zipfile
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from run import backend as app  
 from src.database import get_db, Base
+from src.schemas import FoodInfo
+from src.models import FoodInfoDB
+from src.jobs import JobQueue, get_job_queue
+from src.config import settings
 
 # Testovací databáze
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # Příprava testovací databáze
 Base.metadata.create_all(bind=engine)
 
 # Dependency override
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingAsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 app.dependency_overrides[get_db] = override_get_db
 
@@ -32,6 +41,12 @@ def test_ping():
     assert response.status_code == 200
     assert response.json() == {"message": "pong"}
 
+def test_root_reports_database_and_pool():
+    response = client.get("/")
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
+    assert "class" in response.json()["pool"]
+
 def test_calculate_intake():
     user_info = {
         "user_id": 1,
@@ -53,22 +68,44 @@ def test_calculate_intake():
     assert response_json["protein_g"] >= 0
     assert response_json["sugar_g"] >= 0
 
+def test_calculate_intake_batch():
+    response = client.post("/calculate-intake/batch", json={
+        "owner_id": [1, 2, 3],
+        "height_cm": [180, 165, 170],
+        "weight_kg": [75, 58, 70],
+        "age": [25, 41, 30],
+        "gender": ["male", "female", "male"],
+        "activity_level": ["low", "medium", "extreme"],
+    })
+    assert response.status_code == 200
+    response_json = response.json()
+    assert response_json["valid"] == [True, True, False]
+    assert response_json["errors"]["activity_level"] == [False, False, True]
+    assert response_json["calories"][0] > 0
+    assert response_json["calories"][2] is None
+
+def test_calculate_intake_batch_rejects_mismatched_columns():
+    response = client.post("/calculate-intake/batch", json={
+        "owner_id": [1, 2],
+        "height_cm": [180],
+        "weight_kg": [75, 58],
+        "age": [25, 41],
+        "gender": ["male", "female"],
+        "activity_level": ["low", "medium"],
+    })
+    assert response.status_code == 422
+
 def test_analyze_image(mocker):
-    mock_openai_client = mocker.patch("src.routes.OpenAIClient")
-    mock_openai_client.return_value.create_thread.return_value.id = "test_thread_id"
-    mock_openai_client.return_value.upload_file.return_value = "test_file_id"
-    mock_openai_client.return_value.create_message.return_value = None
-    mock_openai_client.return_value.create_and_poll_run.return_value.status = "completed"
-    mock_openai_client.return_value.list_messages.return_value.data[0].content[0].text.value = '''
-    {
-        "certainty": 0.9,
-        "food_name": "Apple",
-        "calories_Kcal": 52,
-        "fat_in_g": 0.2,
-        "protein_in_g": 0.3,
-        "sugar_in_g": 10.4
-    }
-    '''
+    mock_openai_client = mocker.patch("src.services.AsyncOpenAIClient")
+    mock_openai_client.return_value.process_image = mocker.AsyncMock(return_value=FoodInfo(
+        certainty=0.9,
+        food_name="Apple",
+        calories_Kcal=52,
+        fat_in_g=0.2,
+        protein_in_g=0.3,
+        sugar_in_g=10.4,
+    ))
+    mock_openai_client.return_value.close = mocker.AsyncMock()
 
     file_path = "test_image.jpg"
     with open(file_path, "wb") as f:
@@ -85,6 +122,137 @@ def test_analyze_image(mocker):
     assert json_response["calories_Kcal"] == 52
     assert json_response["certainty"] == 0.9
 
+def test_analyze_image_cache_hit(mocker):
+    mock_openai_client = mocker.patch("src.services.AsyncOpenAIClient")
+    mock_openai_client.return_value.process_image = mocker.AsyncMock(return_value=FoodInfo(
+        certainty=0.8,
+        food_name="Banana",
+        calories_Kcal=89,
+        fat_in_g=0.3,
+        protein_in_g=1.1,
+        sugar_in_g=12.2,
+    ))
+    mock_openai_client.return_value.close = mocker.AsyncMock()
+
+    content = os.urandom(1024)
+    first = client.post("/analyze-image", files={"file": ("banana.jpg", content)})
+    second = client.post("/analyze-image", files={"file": ("banana-again.jpg", content)})
+
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert mock_openai_client.return_value.process_image.await_count == 1
+
+def test_analyze_image_too_large(mocker):
+    mock_openai_client = mocker.patch("src.services.AsyncOpenAIClient")
+    mock_openai_client.return_value.process_image = mocker.AsyncMock()
+    mock_openai_client.return_value.close = mocker.AsyncMock()
+    mocker.patch.object(settings, "MAX_UPLOAD_BYTES", 512)
+
+    response = client.post("/analyze-image", files={"file": ("big.jpg", os.urandom(1024))})
+
+    assert response.status_code == 413
+    mock_openai_client.return_value.process_image.assert_not_awaited()
+
+def test_request_body_limit():
+    response = client.post("/analyze-image", files={"file": ("huge.jpg", b"0" * (settings.MAX_REQUEST_BYTES + 1))})
+    assert response.status_code == 413
+
+def test_analyze_images_batch(mocker):
+    def fake_process_image(payload, deadline=None):
+        filename = payload[0]
+        if filename.startswith("bad"):
+            raise HTTPException(status_code=422, detail="Invalid JSON format.")
+        return FoodInfo(certainty=0.7, food_name=filename, calories_Kcal=100,
+                        fat_in_g=1, protein_in_g=2, sugar_in_g=3)
+
+    mock_openai_client = mocker.patch("src.services.AsyncOpenAIClient")
+    mock_openai_client.return_value.process_image = mocker.AsyncMock(side_effect=fake_process_image)
+    mock_openai_client.return_value.close = mocker.AsyncMock()
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("meals/c.jpg", os.urandom(256))
+        zf.writestr("meals/d.jpg", os.urandom(256))
+
+    db = TestingSessionLocal()
+    rows_before = db.query(FoodInfoDB).count()
+    response = client.post("/analyze-images", files=[
+        ("files", ("a.jpg", os.urandom(256))),
+        ("files", ("bad.jpg", os.urandom(256))),
+        ("files", ("meals.zip", archive.getvalue(), "application/zip")),
+        ("files", ("broken.zip", b"not a zip", "application/zip")),
+    ])
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["filename"] for r in results] == ["a.jpg", "bad.jpg", "c.jpg", "d.jpg", "broken.zip"]
+    assert [r["index"] for r in results] == [0, 1, 2, 3, 4]
+    assert results[0]["food_info"]["food_name"] == "a.jpg"
+    assert results[1]["status_code"] == 422
+    assert results[1]["food_info"] is None
+    assert results[3]["food_info"]["food_name"] == "d.jpg"
+    assert results[4]["status_code"] == 400
+    assert db.query(FoodInfoDB).count() == rows_before + 3
+    db.close()
+
+def test_analyze_image_async_job(mocker):
+    mock_openai_client = mocker.patch("src.services.AsyncOpenAIClient")
+    mock_openai_client.return_value.process_image = mocker.AsyncMock(return_value=FoodInfo(
+        certainty=0.9,
+        food_name="Apple",
+        calories_Kcal=52,
+        fat_in_g=0.2,
+        protein_in_g=0.3,
+        sugar_in_g=10.4,
+    ))
+    mock_openai_client.return_value.close = mocker.AsyncMock()
+    queue = JobQueue(session_factory=TestingAsyncSessionLocal, workers=1)
+    app.dependency_overrides[get_job_queue] = lambda: queue
+
+    try:
+        response = client.post("/analyze-image?async_job=true", files={"file": ("meal.jpg", os.urandom(1024))})
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+        assert response.json()["status"] == "pending"
+        assert client.get(f"/jobs/{job_id}").json()["status"] == "pending"
+
+        asyncio.run(queue.process_next())
+
+        job = client.get(f"/jobs/{job_id}").json()
+        assert job["status"] == "completed"
+        assert job["food_info"]["food_name"] == "Apple"
+        assert client.get("/jobs/unknown").status_code == 404
+
+        # Webhooks are only accepted from authenticated users
+        response = client.post("/analyze-image?async_job=true", files={"file": ("meal.jpg", os.urandom(1024))},
+                               data={"webhook_url": "https://93.184.216.34/hook"})
+        assert response.status_code == 401
+    finally:
+        del app.dependency_overrides[get_job_queue]
+
+def test_openai_client_is_app_scoped(mocker):
+    mock_openai_client = mocker.patch("src.services.AsyncOpenAIClient")
+    mock_openai_client.return_value.process_image = mocker.AsyncMock(return_value=FoodInfo(
+        certainty=0.9,
+        food_name="Apple",
+        calories_Kcal=52,
+        fat_in_g=0.2,
+        protein_in_g=0.3,
+        sugar_in_g=10.4,
+    ))
+    mock_openai_client.return_value.close = mocker.AsyncMock()
+
+    with TestClient(app) as app_client:
+        for _ in range(3):
+            response = app_client.post("/analyze-image", files={"file": ("meal.jpg", os.urandom(1024))})
+            assert response.status_code == 200
+        mock_openai_client.return_value.close.assert_not_awaited()
+
+    assert mock_openai_client.call_count == 1
+    assert mock_openai_client.return_value.process_image.await_count == 3
+    mock_openai_client.return_value.close.assert_awaited_once()
+
 @pytest.fixture(scope="module", autouse=True)
 def setup_and_teardown():
     # Příprava před spuštěním testů
@@ -92,3 +260,16 @@ def setup_and_teardown():
     yield
     # Úklid po testech
     Base.metadata.drop_all(bind=engine)
+
+
+def test_search_foods():
+    response = client.get("/foods/search", params={"q": "banan", "grams": 50, "limit": 1})
+    assert response.status_code == 200
+    [result] = response.json()
+    assert result["food_name"] == "Banana"
+    assert result["grams"] == 50
+    assert result["calories_Kcal"] == 44.5
+    assert 0 < result["certainty"] < 1
+
+    assert client.get("/foods/search", params={"q": "xyzzy"}).json() == []
+    assert client.get("/foods/search", params={"q": ""}).status_code == 422